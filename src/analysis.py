@@ -1,14 +1,27 @@
 import os
 import json
 import argparse
+import hashlib
 import logging
 import pandas as pd
 import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
-from scipy.stats import pearsonr, spearmanr, ttest_rel, chi2_contingency
 from datetime import datetime
-from sklearn.metrics import confusion_matrix, precision_recall_fscore_support
+
+import bootstrap
+import metrics
+import online_stats
+import plotting
+import reply_graph
+import score_store
+import storage
+import threshold_sweep
+import time_series
+from score_store import SCORE_COLUMNS, ScoreStore
+
+# Plotting (seaborn/matplotlib, in plotting.py workers), scipy and
+# scikit-learn are imported inside the functions that need them, so
+# importing this module never pays for them; a --fast run only renders the
+# agreement matrix.
 
 # ===== CONFIG =====
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -17,72 +30,83 @@ RESULTS_DIR = os.path.join(BASE_DIR, "results")
 TABLES_DIR = os.path.join(BASE_DIR, "tables")
 SUMMARY_DIR = os.path.join(BASE_DIR, "summary")
 
-INPUT_FILE = os.path.join(DATA_DIR, "pol_posts_with_scores.json")
-
-# Ensure output folders exist
-os.makedirs(RESULTS_DIR, exist_ok=True)
-os.makedirs(TABLES_DIR, exist_ok=True)
-os.makedirs(SUMMARY_DIR, exist_ok=True)
-
-sns.set_theme(style="whitegrid")
+INPUT_FILE = os.path.join(DATA_DIR, "pol_posts_with_scores.jsonl")
+GRAPH_FILE = os.path.join(DATA_DIR, "pol_posts_graph.npz")   # reply index from processing.py
+STATE_FILE = os.path.join(SUMMARY_DIR, "analysis_state.npz")   # incremental statistics
+INCREMENTAL_BATCH = 100000   # records read per update step (bounds memory)
+BOOTSTRAP_REPLICATES = 1000   # 0 disables bootstrap CIs; --fast runs skip them unless asked
+BOOTSTRAP_SEED = 0
+CONFIDENCE = 0.95
 
-# ===== LOGGING CONFIG =====
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(os.path.join(SUMMARY_DIR, "analysis.log"), mode="w", encoding="utf-8")
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# ===== ARGPARSE =====
-parser = argparse.ArgumentParser(description="4chan Toxicity Analysis")
-parser.add_argument("--fast", action="store_true",
-                    help="Skip heavy plots (distributions/heatmaps) for faster runs.")
-args = parser.parse_args()
-
-# ===== LOAD DATA =====
-with open(INPUT_FILE, "r", encoding="utf-8") as f:
-    posts = json.load(f)
-
-df = pd.DataFrame(posts)
-logger.info(f"Total posts analyzed: {len(df)}")
-
-# ===== EXTRACT SCORES =====
-persp_attributes = [
-    "TOXICITY", "SEVERE_TOXICITY", "INSULT", "PROFANITY", "THREAT",
-    "IDENTITY_ATTACK", "SEXUALLY_EXPLICIT", "FLIRTATION", "SPAM", "OBSCENE"
-]
-for attr in persp_attributes:
-    df[f"persp_{attr.lower()}"] = df["perspective_scores"].apply(
-        lambda x: x.get(attr, np.nan) if isinstance(x, dict) else np.nan
-    )
+CATEGORY_MAPPING = {
+    "openai_hate": "persp_identity_attack",
+    "openai_violence": "persp_threat",
+    "openai_harassment": "persp_insult",
+    "openai_sexual": "persp_sexually_explicit",
+    "openai_hate_threatening": "persp_threat",
+}
+THRESHOLD = 0.5
+MIN_COUNTRY_POSTS = 25
 
-openai_categories = [
-    "sexual", "sexual/minors", "hate", "hate/threatening", "violence",
-    "violence/graphic", "harassment", "harassment/threatening",
-    "self-harm", "self-harm/intent"
-]
-for cat in openai_categories:
-    df[f"openai_{cat.replace('/', '_')}"] = df["openai_moderation"].apply(
-        lambda x: x.get("category_scores", {}).get(cat, np.nan) if isinstance(x, dict) else np.nan
+# ===== LOGGING CONFIG =====
+def setup_logging(summary_dir=None):
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        handlers=[
+            logging.StreamHandler(),
+            logging.FileHandler(os.path.join(summary_dir or SUMMARY_DIR, "analysis.log"), mode="w", encoding="utf-8")
+        ],
+        force=True,
     )
 
-# Ensure required columns exist
-required_cols = ["openai_toxicity", "persp_toxicity"]
-missing = [c for c in required_cols if c not in df.columns]
-if missing:
-    logger.error(f"Missing required columns: {missing}. Please regenerate dataset.")
-    raise ValueError(f"Missing required columns: {missing}")
+# ===== LOAD DATA =====
+def load_scores(path=None, use_store=True):
+    """Load the scored dataset as a compact score frame (see `score_frame`).
+    By default the columnar store next to it (score_store.py) is brought up
+    to date and memory-mapped: only posts scored since its last sync are
+    parsed."""
+    path = path or INPUT_FILE
+    storage.migrate_legacy(path)
+    if use_store and os.path.exists(path):
+        store = ScoreStore(path)
+        added = store.sync()
+        columns, countries, has_openai_toxicity = store.columns()
+        logger.info(f"Score store: {len(columns['post_id'])} rows memory-mapped ({added} newly synced)")
+        _check_columns(len(columns["post_id"]), has_openai_toxicity)
+        df = score_store.to_frame(columns, countries)
+    else:
+        df = score_frame(storage.iter_records(path))
+    logger.info(f"Total posts analyzed: {len(df)}")
+    return df
+
+def _check_columns(rows, has_openai_toxicity):
+    if rows and not has_openai_toxicity:
+        logger.error("Missing required columns: ['openai_toxicity']. Please regenerate dataset.")
+        raise ValueError("Missing required columns: ['openai_toxicity']")
+
+def score_frame(records):
+    """Flatten scored records into a typed frame in one streaming pass.
+
+    Only the columns the analysis uses are kept: post/thread ids and the
+    Unix `timestamp` (int64, 0 when missing), `openai_toxicity` and one
+    float32 column per Perspective attribute and OpenAI category (NaN when
+    missing), and `country` as a categorical. Values go straight into typed
+    arrays, so the nested dicts of a record are garbage as soon as the next
+    one is read.
+    """
+    countries = {}
+    columns, has_openai_toxicity = score_store.score_columns(records, countries)
+    _check_columns(len(columns["post_id"]), has_openai_toxicity)
+    return score_store.to_frame(columns, countries)
+
+def score_values(df, col):
+    """Non-missing values of a score column, upcast so statistics run in float64."""
+    return df[col].dropna().astype(np.float64)
 
 # ===== CORRELATION ANALYSIS =====
-pearson_corr, pearson_p = pearsonr(df["openai_toxicity"].dropna(), df["persp_toxicity"].dropna())
-spearman_corr, spearman_p = spearmanr(df["openai_toxicity"].dropna(), df["persp_toxicity"].dropna())
-logger.info(f"Pearson corr = {pearson_corr:.3f} (p={pearson_p:.4f})")
-logger.info(f"Spearman corr = {spearman_corr:.3f} (p={spearman_p:.4f})")
-
 def fisher_ci(r, n, alpha=0.05):
     if abs(r) == 1 or n <= 3:
         return (np.nan, np.nan)
@@ -92,189 +116,681 @@ def fisher_ci(r, n, alpha=0.05):
     lo, hi = z - z_crit * se, z + z_crit * se
     return np.tanh(lo), np.tanh(hi)
 
-pearson_ci = fisher_ci(pearson_corr, len(df.dropna(subset=["openai_toxicity", "persp_toxicity"])))
-logger.info(f"Pearson 95% CI: {pearson_ci}")
-
-if not args.fast:
-    plt.figure(figsize=(5, 4))
-    sns.heatmap(df[["openai_toxicity", "persp_toxicity"]].corr(), annot=True,
-                cmap="coolwarm", vmin=-1, vmax=1)
-    plt.title("Correlation between OpenAI and Perspective Toxicity Scores")
-    plt.tight_layout()
-    plt.savefig(os.path.join(RESULTS_DIR, "correlation_heatmap.png"), dpi=300)
-    plt.close()
-    logger.info("Saved correlation_heatmap.png")
-
-# ===== CATEGORY-WISE CORRELATION =====
-category_mapping = {
-    "openai_hate": "persp_identity_attack",
-    "openai_violence": "persp_threat",
-    "openai_harassment": "persp_insult",
-    "openai_sexual": "persp_sexually_explicit",
-    "openai_hate_threatening": "persp_threat",
-}
-correlation_results = []
-for openai_col, persp_col in category_mapping.items():
-    if openai_col in df.columns and persp_col in df.columns:
-        subset = df[[openai_col, persp_col]].dropna()
-        if len(subset) >= 2:
-            pr, _ = pearsonr(subset[openai_col], subset[persp_col])
-            sr, _ = spearmanr(subset[openai_col], subset[persp_col])
-            correlation_results.append({
-                "openai": openai_col,
-                "perspective": persp_col,
-                "pearson": round(pr, 3),
-                "spearman": round(sr, 3),
-            })
-logger.info(f"Category correlations computed for {len(correlation_results)} mappings")
-
-# ===== DISTRIBUTIONS =====
-if not args.fast:
-    for col in df.columns:
-        if col.startswith("openai_") or col.startswith("persp_"):
-            series = pd.to_numeric(df[col], errors="coerce").dropna()
-            if len(series) == 0:
-                continue
-            plt.figure(figsize=(6, 4))
-            sns.histplot(series, kde=(len(series) >= 2), color="#4C72B0", edgecolor="black")
-            plt.axvline(series.mean(), color="red", linestyle="--", linewidth=1.2,
-                        label=f"Mean: {series.mean():.2f}")
-            plt.axvline(series.median(), color="green", linestyle=":",
-                        linewidth=1.2, label=f"Median: {series.median():.2f}")
-            plt.title(f"{col.replace('_', ' ').title()} Distribution", fontsize=14, weight="bold")
-            plt.xlabel("Score")
-            plt.ylabel("Frequency")
-            plt.legend()
-            plt.tight_layout()
-            plt.savefig(os.path.join(RESULTS_DIR, f"{col}_distribution.png"), dpi=300)
-            plt.close()
-    logger.info("Saved all distributions")
-    
-    # Combined toxicity score distribution
-    plt.figure(figsize=(6, 4))
-    sns.histplot(df["openai_toxicity"], kde=True, color="#4C72B0", edgecolor="black", label="OpenAI", alpha=0.5)
-    sns.histplot(df["persp_toxicity"], kde=True, color="#E24A33", edgecolor="black", label="Perspective", alpha=0.5)
-    plt.axvline(df["openai_toxicity"].mean(), color="#4C72B0", linestyle="--", linewidth=1.2,
-                label=f"OpenAI Mean: {df['openai_toxicity'].mean():.2f}")
-    plt.axvline(df["persp_toxicity"].mean(), color="#E24A33", linestyle="--", linewidth=1.2,
-                label=f"Perspective Mean: {df['persp_toxicity'].mean():.2f}")
-    plt.title("Toxicity Score Distributions", fontsize=14, weight="bold")
-    plt.xlabel("Score")
-    plt.ylabel("Frequency")
-    plt.legend()
-    plt.tight_layout()
-    plt.savefig(os.path.join(RESULTS_DIR, "toxicity_distributions.png"), dpi=300)
-    plt.close()
-    logger.info("Saved toxicity_distributions.png")
+def compute_correlations(df):
+    from scipy.stats import pearsonr, spearmanr
+
+    openai_toxicity, persp_toxicity = score_values(df, "openai_toxicity"), score_values(df, "persp_toxicity")
+    pearson_corr, pearson_p = pearsonr(openai_toxicity, persp_toxicity)
+    spearman_corr, spearman_p = spearmanr(openai_toxicity, persp_toxicity)
+    logger.info(f"Pearson corr = {pearson_corr:.3f} (p={pearson_p:.4f})")
+    logger.info(f"Spearman corr = {spearman_corr:.3f} (p={spearman_p:.4f})")
+
+    pearson_ci = fisher_ci(pearson_corr, len(df.dropna(subset=["openai_toxicity", "persp_toxicity"])))
+    logger.info(f"Pearson 95% CI: {pearson_ci}")
+
+    # ===== CATEGORY-WISE CORRELATION =====
+    correlation_results = []
+    for openai_col, persp_col in CATEGORY_MAPPING.items():
+        if openai_col in df.columns and persp_col in df.columns:
+            subset = df[[openai_col, persp_col]].dropna().astype(np.float64)
+            if len(subset) >= 2:
+                pr, _ = pearsonr(subset[openai_col], subset[persp_col])
+                sr, _ = spearmanr(subset[openai_col], subset[persp_col])
+                correlation_results.append({
+                    "openai": openai_col,
+                    "perspective": persp_col,
+                    "pearson": round(pr, 3),
+                    "spearman": round(sr, 3),
+                })
+    logger.info(f"Category correlations computed for {len(correlation_results)} mappings")
+
+    return {
+        "pearson_corr": pearson_corr,
+        "pearson_p": pearson_p,
+        "pearson_r_ci": pearson_ci,
+        "spearman_corr": spearman_corr,
+        "spearman_p": spearman_p,
+        "category_correlations": correlation_results,
+    }
 
 # ===== AGREEMENT/DISAGREEMENT =====
-threshold = 0.5
-df["openai_flag"] = df["openai_toxicity"] >= threshold
-df["persp_flag"] = df["persp_toxicity"] >= threshold
-
-# True if APIs disagree on this post
-df["disagreement"] = df["openai_flag"] != df["persp_flag"]
-
-conf_matrix = pd.crosstab(df["openai_flag"], df["persp_flag"])
-plt.figure(figsize=(4, 3))
-sns.heatmap(conf_matrix, annot=True, fmt="d", cmap="Blues", cbar=False)
-plt.title("Agreement/Disagreement Matrix")
-plt.tight_layout()
-plt.savefig(os.path.join(RESULTS_DIR, "agreement_matrix.png"), dpi=300)
-plt.close()
-logger.info("Saved agreement_matrix.png")
-
-cm = confusion_matrix(df["persp_flag"], df["openai_flag"], labels=[False, True])
-cm_df = pd.DataFrame(cm,
-                     index=["Perspective: Non-toxic", "Perspective: Toxic"],
-                     columns=["OpenAI: Non-toxic", "OpenAI: Toxic"])
-cm_df.to_csv(os.path.join(TABLES_DIR, "confusion_matrix.csv"))
-cm_df.to_markdown(os.path.join(TABLES_DIR, "confusion_matrix.md"))
-logger.info("Saved confusion matrix tables")
-
-precision, recall, f1, support = precision_recall_fscore_support(
-    df["persp_flag"], df["openai_flag"], average=None, labels=[False, True]
-)
-metrics_df = pd.DataFrame({
-    "Class": ["Non-toxic", "Toxic"],
-    "Precision": precision,
-    "Recall": recall,
-    "F1-score": f1,
-    "Support": support
-})
-metrics_df.to_csv(os.path.join(TABLES_DIR, "precision_recall_table.csv"), index=False)
-metrics_df.to_markdown(os.path.join(TABLES_DIR, "precision_recall_table.md"), index=False)
-logger.info("Saved precision/recall tables")
-
-# Breakdown: OP vs reply
-df["is_op"] = df["thread_id"] == df["post_id"]
-op_disagree_rate = df.groupby("is_op")["disagreement"].mean() * 100
-
-op_disagree_rate.to_csv(os.path.join(TABLES_DIR, "disagreement_by_op.csv"))
-op_disagree_rate.to_frame("Disagreement %").to_markdown(os.path.join(TABLES_DIR, "disagreement_by_op.md"))
-logger.info("Saved OP vs reply disagreement")
-
-# Breakdown: by country
-df["country"] = df["metadata"].apply(lambda m: m.get("country") if isinstance(m, dict) else None)
-country_counts = df["country"].value_counts()
-valid_countries = country_counts[country_counts >= 25].index
-country_disagree = (
-    df[df["country"].isin(valid_countries)]
-    .groupby("country")["disagreement"].mean()
-    .sort_values(ascending=False) * 100
-)
-
-country_disagree.to_csv(os.path.join(TABLES_DIR, "disagreement_by_country.csv"))
-country_disagree.to_frame("Disagreement %").to_markdown(os.path.join(TABLES_DIR, "disagreement_by_country.md"))
-logger.info("Saved country disagreement")
+def compute_agreement(df, threshold=THRESHOLD):
+    """Flag both providers at `threshold` and tabulate where they disagree."""
+    from sklearn.metrics import confusion_matrix, precision_recall_fscore_support
 
-# ===== STATS & SUMMARY =====
-t_stat, t_p = ttest_rel(df["openai_toxicity"].dropna(), df["persp_toxicity"].dropna())
-diff = df["openai_toxicity"].dropna() - df["persp_toxicity"].dropna()
-cohens_d = diff.mean() / diff.std(ddof=1)
-chi2, chi_p, _, _ = chi2_contingency(conf_matrix)
-
-summary = {
-    "pearson_corr": pearson_corr,
-    "pearson_r_ci": pearson_ci,   
-    "spearman_corr": spearman_corr,
-    "spearman_p": spearman_p,
-    "agreement_rate": (df["openai_flag"] == df["persp_flag"]).mean(),
-    "false_positive_rate": (df["openai_flag"] & ~df["persp_flag"]).mean() * 100,
-    "false_negative_rate": (~df["openai_flag"] & df["persp_flag"]).mean() * 100,
-    "t_test": {"t_stat": t_stat, "p_value": t_p},
-    "cohen_d": cohens_d,          
-    "chi_square": {"chi2": chi2, "p_value": chi_p},
-    "op_disagreement_rate": op_disagree_rate.to_dict(),
-    "country_disagreement_rate": country_disagree.to_dict(),
-    "category_correlations": correlation_results,
-    "generated_at": datetime.utcnow().isoformat() + "Z"
-}
+    df["openai_flag"] = df["openai_toxicity"] >= threshold
+    df["persp_flag"] = df["persp_toxicity"] >= threshold
+
+    # True if APIs disagree on this post
+    df["disagreement"] = df["openai_flag"] != df["persp_flag"]
 
+    conf_matrix = pd.crosstab(df["openai_flag"], df["persp_flag"])
 
-with open(os.path.join(SUMMARY_DIR, "analysis_summary.json"), "w", encoding="utf-8") as f:
-    json.dump(summary, f, indent=2)
-logger.info("Saved analysis_summary.json")
+    cm = confusion_matrix(df["persp_flag"], df["openai_flag"], labels=[False, True])
+    cm_df = pd.DataFrame(cm,
+                         index=["Perspective: Non-toxic", "Perspective: Toxic"],
+                         columns=["OpenAI: Non-toxic", "OpenAI: Toxic"])
 
-# ===== SCATTERPLOT: OpenAI vs Perspective =====
-if not args.fast:
-    plt.figure(figsize=(7, 7))
-    sns.scatterplot(
-        x=df["openai_toxicity"],
-        y=df["persp_toxicity"],
-        alpha=0.4,
-        s=20,
-        edgecolor=None
+    precision, recall, f1, support = precision_recall_fscore_support(
+        df["persp_flag"], df["openai_flag"], average=None, labels=[False, True]
     )
-    plt.xlabel("OpenAI Toxicity Score")
-    plt.ylabel("Perspective Toxicity Score")
-    plt.title("OpenAI vs Perspective Toxicity Scores", fontsize=14, weight="bold")
-    plt.xlim(0, 1)
-    plt.ylim(0, 1)
-    plt.tight_layout()
-    plt.savefig(os.path.join(RESULTS_DIR, "scatter_toxicity.png"), dpi=300, bbox_inches="tight")
-    plt.close()
-    logger.info("Saved scatter_toxicity.png")
-
-
-logger.info("✅ Analysis complete. Results saved into /results, /tables, and /summary")
+    metrics_df = pd.DataFrame({
+        "Class": ["Non-toxic", "Toxic"],
+        "Precision": precision,
+        "Recall": recall,
+        "F1-score": f1,
+        "Support": support
+    })
+
+    # Breakdown: OP vs reply
+    df["is_op"] = df["thread_id"] == df["post_id"]
+    op_disagree_rate = df.groupby("is_op")["disagreement"].mean() * 100
+
+    # Breakdown: by country
+    country_counts = df["country"].value_counts()
+    valid_countries = country_counts[country_counts >= MIN_COUNTRY_POSTS].index
+    country_disagree = (
+        df[df["country"].isin(valid_countries)]
+        .groupby("country", observed=True)["disagreement"].mean()
+        .sort_values(ascending=False) * 100
+    )
+
+    return {
+        "conf_matrix": conf_matrix,
+        "cm_df": cm_df,
+        "metrics_df": metrics_df,
+        "op_disagree_rate": op_disagree_rate,
+        "country_disagree": country_disagree,
+    }
+
+def _with_ci(rates, ci, name):
+    """Rate Series -> frame with its bootstrap CI columns (if any)."""
+    if ci is None:
+        return rates.to_frame(name)
+    lo, hi = ci
+    return pd.DataFrame({name: rates, "ci_low": pd.Series(lo), "ci_high": pd.Series(hi)}, index=rates.index)
+
+def write_tables(agreement, tables_dir, ci=None):
+    """`ci` (from `compute_bootstrap`) adds CI columns to the breakdown tables."""
+    ci = ci or {}
+    cm_df = agreement["cm_df"]
+    cm_df.to_csv(os.path.join(tables_dir, "confusion_matrix.csv"))
+    cm_df.to_markdown(os.path.join(tables_dir, "confusion_matrix.md"))
+    logger.info("Saved confusion matrix tables")
+
+    metrics_df = agreement["metrics_df"]
+    metrics_df.to_csv(os.path.join(tables_dir, "precision_recall_table.csv"), index=False)
+    metrics_df.to_markdown(os.path.join(tables_dir, "precision_recall_table.md"), index=False)
+    logger.info("Saved precision/recall tables")
+
+    op_disagree_rate = agreement["op_disagree_rate"]
+    _with_ci(op_disagree_rate, ci.get("op_disagreement_rate"), op_disagree_rate.name).to_csv(
+        os.path.join(tables_dir, "disagreement_by_op.csv"))
+    _with_ci(op_disagree_rate, ci.get("op_disagreement_rate"), "Disagreement %").to_markdown(
+        os.path.join(tables_dir, "disagreement_by_op.md"))
+    logger.info("Saved OP vs reply disagreement")
+
+    country_disagree = agreement["country_disagree"]
+    _with_ci(country_disagree, ci.get("country_disagreement_rate"), country_disagree.name).to_csv(
+        os.path.join(tables_dir, "disagreement_by_country.csv"))
+    _with_ci(country_disagree, ci.get("country_disagreement_rate"), "Disagreement %").to_markdown(
+        os.path.join(tables_dir, "disagreement_by_country.md"))
+    logger.info("Saved country disagreement")
+
+# ===== BOOTSTRAP CIs =====
+def _pair_columns(x, y):
+    """[complete, x, y, x^2, y^2, xy] per row, centred, zero where the pair is incomplete."""
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    complete = ~(np.isnan(x) | np.isnan(y))
+    mean_x = x[complete].mean() if complete.any() else 0.0
+    mean_y = y[complete].mean() if complete.any() else 0.0
+    cx, cy = np.where(complete, x - mean_x, 0.0), np.where(complete, y - mean_y, 0.0)
+    return [complete.astype(np.float64), cx, cy, cx * cx, cy * cy, cx * cy], mean_x - mean_y
+
+def compute_bootstrap(df, agreement, replicates=BOOTSTRAP_REPLICATES, seed=BOOTSTRAP_SEED,
+                      confidence=CONFIDENCE, workers=None):
+    """Percentile CIs for the summary statistics from `replicates` bootstrap
+    resamples of posts: Pearson r, Cohen's d, agreement rate, OP and country
+    disagreement rates and category Pearson correlations. Every statistic is
+    derived from per-replicate column sums (see bootstrap.py)."""
+    columns, layout = [], {}
+
+    def add(name, cols):
+        layout[name] = slice(len(columns), len(columns) + len(cols))
+        columns.extend(cols)
+
+    pair, shift = _pair_columns(df["openai_toxicity"], df["persp_toxicity"])
+    add("toxicity", pair)
+    for openai_col, persp_col in CATEGORY_MAPPING.items():
+        if openai_col in df.columns and persp_col in df.columns:
+            add((openai_col, persp_col), _pair_columns(df[openai_col], df[persp_col])[0])
+    disagreement = df["disagreement"].to_numpy(dtype=np.float64)
+    add("agreement", [1.0 - disagreement])
+    for is_op in agreement["op_disagree_rate"].index:
+        member = (df["is_op"].to_numpy() == is_op).astype(np.float64)
+        add(("op", is_op), [member, member * disagreement])
+    for country in agreement["country_disagree"].index:
+        member = (df["country"] == country).to_numpy(dtype=np.float64)
+        add(("country", country), [member, member * disagreement])
+
+    sums = bootstrap.resampled_sums(np.column_stack(columns), replicates, seed=seed,
+                                    workers=workers or bootstrap.BOOTSTRAP_WORKERS)
+    moments = lambda key: [sums[:, i] for i in range(layout[key].start, layout[key].stop)]
+    interval = lambda values: tuple(float(v) for v in bootstrap.percentile_ci(values, confidence))
+    rate = lambda key: 100 * bootstrap.safe_divide(sums[:, layout[key].start + 1], sums[:, layout[key].start])
+
+    ci = {
+        "pearson_corr": interval(bootstrap.pearson_from_sums(*moments("toxicity"))),
+        "cohen_d": interval(bootstrap.cohens_d_from_sums(*moments("toxicity"), shift=shift)),
+        "agreement_rate": interval(sums[:, layout["agreement"].start] / len(df)),
+        "category_correlations": {
+            key: interval(bootstrap.pearson_from_sums(*moments(key)))
+            for key in layout if isinstance(key, tuple) and key[0] not in ("op", "country")
+        },
+    }
+    for group, name in (("op", "op_disagreement_rate"), ("country", "country_disagreement_rate")):
+        keys = [key for key in layout if isinstance(key, tuple) and key[0] == group]
+        bounds = [interval(rate(key)) for key in keys]
+        ci[name] = ({key[1]: b[0] for key, b in zip(keys, bounds)},
+                    {key[1]: b[1] for key, b in zip(keys, bounds)})
+    logger.info(f"Bootstrap: {replicates} replicates (seed={seed}), "
+                f"Pearson {confidence:.0%} CI {ci['pearson_corr']}, Cohen's d CI {ci['cohen_d']}")
+    return ci
+
+def add_bootstrap_to_summary(summary, ci, replicates, seed, confidence=CONFIDENCE):
+    summary["bootstrap"] = {"replicates": replicates, "seed": seed, "confidence": confidence}
+    summary["pearson_r_bootstrap_ci"] = ci["pearson_corr"]
+    summary["cohen_d_ci"] = ci["cohen_d"]
+    summary["agreement_rate_ci"] = ci["agreement_rate"]
+    for name in ("op_disagreement_rate", "country_disagreement_rate"):
+        lo, hi = ci[name]
+        summary[name.replace("_rate", "_ci")] = {key: (lo[key], hi[key]) for key in lo}
+    for entry in summary["category_correlations"]:
+        key = (entry["openai"], entry["perspective"])
+        if key in ci["category_correlations"]:
+            entry["pearson_ci"] = [round(v, 3) for v in ci["category_correlations"][key]]
+    return summary
+
+# ===== THRESHOLD SWEEP =====
+SWEEP_TABLE_STEP = 0.05   # shared thresholds listed in the markdown table
+CURVE_POINTS = 2000       # ROC/PR points kept for plotting
+
+def compute_sweep(df, reference_threshold=THRESHOLD):
+    """Agreement metrics for every threshold pair on the sweep grid, plus
+    exact ROC/PR curves of OpenAI scores against Perspective >= `reference_threshold`."""
+    openai_scores, persp_scores = threshold_sweep.paired(df["openai_toxicity"], df["persp_toxicity"])
+    result = threshold_sweep.sweep(openai_scores, persp_scores)
+    curves = threshold_sweep.ranking_curves(openai_scores, persp_scores >= reference_threshold)
+    best = threshold_sweep.best_pair(result)
+    logger.info(f"Threshold sweep: {len(result['thresholds'])}x{len(result['thresholds'])} pairs, "
+                f"ROC AUC = {curves['roc_auc']:.3f}, AP = {curves['average_precision']:.3f}")
+    logger.info(f"Best kappa {best['kappa']:.3f} at OpenAI >= {best['openai_threshold']}, "
+                f"Perspective >= {best['persp_threshold']}")
+    return {"result": result, "curves": curves, "best": best, "reference_threshold": reference_threshold}
+
+def write_sweep_tables(sweep, tables_dir):
+    result = sweep["result"]
+    pd.DataFrame(threshold_sweep.sweep_rows(result)).to_csv(
+        os.path.join(tables_dir, "threshold_sweep.csv"), index=False)
+    diagonal = pd.DataFrame(threshold_sweep.sweep_rows(result, diagonal=True))
+    steps = np.isclose(np.round(diagonal["openai_threshold"] / SWEEP_TABLE_STEP), diagonal["openai_threshold"] / SWEEP_TABLE_STEP)
+    diagonal[steps].drop(columns="persp_threshold").rename(columns={"openai_threshold": "threshold"}).to_markdown(
+        os.path.join(tables_dir, "threshold_sweep.md"), index=False)
+    logger.info("Saved threshold sweep tables")
+
+def sweep_summary(sweep):
+    return {
+        "reference_threshold": sweep["reference_threshold"],
+        "roc_auc": sweep["curves"]["roc_auc"],
+        "average_precision": sweep["curves"]["average_precision"],
+        "best_kappa": sweep["best"],
+    }
+
+def _thin(curves, keys, points=CURVE_POINTS):
+    idx = np.unique(np.linspace(0, len(curves[keys[0]]) - 1, points).astype(np.int64))
+    return {key: curves[key][idx] for key in keys}
+
+# ===== REPLY GRAPH =====
+# Thread-level propagation from the quote index processing writes next to
+# the posts (see reply_graph.py). Scores are placed on graph rows with one
+# searchsorted, so every statistic is vectorized over all edges.
+GRAPH_TABLE_THREADS = 100   # most-replied threads in the markdown table
+GRAPH_PROVIDERS = {"perspective": "persp_toxicity", "openai": "openai_toxicity"}
+
+def graph_scores(graph, df, col):
+    """`df[col]` aligned with graph rows (NaN for posts without a score)."""
+    rows = graph.rows(df["post_id"].to_numpy())
+    found = rows >= 0
+    aligned = np.full(graph.num_nodes, np.nan, dtype=np.float32)
+    aligned[rows[found]] = df[col].to_numpy()[found]
+    return aligned
+
+def compute_reply_graph(df, graph, threshold=THRESHOLD):
+    depth = reply_graph.cascade_depth(graph)
+    scores = {name: graph_scores(graph, df, col) for name, col in GRAPH_PROVIDERS.items()}
+    by_depth = {name: reply_graph.toxicity_by_depth(depth, values, threshold) for name, values in scores.items()}
+    return {
+        "summary": {
+            "posts": graph.num_nodes,
+            "reply_edges": graph.num_edges,
+            "scored_posts": int((~np.isnan(scores["perspective"])).sum()),
+            "posts_with_replies": int((graph.reply_counts() > 0).sum()),
+            "max_cascade_depth": int(depth.max()) if len(depth) else 0,
+            "mean_cascade_depth": float(depth.mean()) if len(depth) else 0.0,
+            "reply_vs_parent": {name: reply_graph.reply_vs_parent(graph, values, threshold)
+                                for name, values in scores.items()},
+        },
+        "threads": pd.DataFrame(reply_graph.thread_aggregates(graph, scores["perspective"], threshold, depth)),
+        "by_depth": pd.concat({name: pd.DataFrame(table) for name, table in by_depth.items()}, names=["provider"])
+                      .reset_index(level=0),
+    }
+
+def write_graph_tables(result, tables_dir):
+    threads = result["threads"].sort_values("reply_edges", ascending=False)
+    threads.to_csv(os.path.join(tables_dir, "thread_toxicity.csv"), index=False)
+    threads.head(GRAPH_TABLE_THREADS).to_markdown(os.path.join(tables_dir, "thread_toxicity.md"), index=False)
+    result["by_depth"].to_csv(os.path.join(tables_dir, "toxicity_by_depth.csv"), index=False)
+    result["by_depth"].to_markdown(os.path.join(tables_dir, "toxicity_by_depth.md"), index=False)
+    logger.info("Saved reply graph tables")
+
+# ===== TIME SERIES =====
+# Hourly and daily toxicity/disagreement trends (see time_series.py): one
+# table per window width, with per-window percentiles and rolling values.
+TIME_SERIES_TABLES = {"hour": "toxicity_hourly.csv", "day": "toxicity_daily.csv"}
+
+def write_time_series_tables(series, tables_dir):
+    for name, table in series.tables().items():
+        table.to_csv(os.path.join(tables_dir, TIME_SERIES_TABLES.get(name, f"toxicity_{name}.csv")), index=False)
+    logger.info("Saved time series tables")
+
+# ===== STATS & SUMMARY =====
+def compute_stats(df, agreement):
+    from scipy.stats import ttest_rel, chi2_contingency
+
+    openai_toxicity, persp_toxicity = score_values(df, "openai_toxicity"), score_values(df, "persp_toxicity")
+    t_stat, t_p = ttest_rel(openai_toxicity, persp_toxicity)
+    diff = openai_toxicity - persp_toxicity
+    cohens_d = diff.mean() / diff.std(ddof=1)
+    chi2, chi_p, _, _ = chi2_contingency(agreement["conf_matrix"])
+    return {
+        "t_test": {"t_stat": t_stat, "p_value": t_p},
+        "cohen_d": cohens_d,
+        "chi_square": {"chi2": chi2, "p_value": chi_p},
+    }
+
+def build_summary(df, correlations, agreement, stats):
+    return {
+        "pearson_corr": correlations["pearson_corr"],
+        "pearson_r_ci": correlations["pearson_r_ci"],
+        "spearman_corr": correlations["spearman_corr"],
+        "spearman_p": correlations["spearman_p"],
+        "agreement_rate": (df["openai_flag"] == df["persp_flag"]).mean(),
+        "false_positive_rate": (df["openai_flag"] & ~df["persp_flag"]).mean() * 100,
+        "false_negative_rate": (~df["openai_flag"] & df["persp_flag"]).mean() * 100,
+        "t_test": stats["t_test"],
+        "cohen_d": stats["cohen_d"],
+        "chi_square": stats["chi_square"],
+        "op_disagreement_rate": agreement["op_disagree_rate"].to_dict(),
+        "country_disagreement_rate": agreement["country_disagree"].to_dict(),
+        "category_correlations": correlations["category_correlations"],
+        "generated_at": datetime.utcnow().isoformat() + "Z"
+    }
+
+def write_summary(summary, summary_dir):
+    with open(os.path.join(summary_dir, "analysis_summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    logger.info("Saved analysis_summary.json")
+
+# ===== INCREMENTAL SUMMARY =====
+# `--incremental` keeps the summary's sufficient statistics in STATE_FILE
+# (see online_stats.py) and folds in only the posts appended to the scored
+# dataset since the last update, so refreshing the summary costs O(new posts).
+def head_digest(path, offset):
+    return hashlib.sha256(storage.file_head(path, min(offset, 4096))).hexdigest()
+
+def update_state(input_file=None, state_file=None, batch_size=INCREMENTAL_BATCH):
+    """Load the saved statistics and fold in newly appended posts. Starts over
+    when the dataset was rewritten rather than appended to."""
+    input_file = input_file or INPUT_FILE
+    state_file = state_file or STATE_FILE
+    storage.migrate_legacy(input_file)
+
+    state = online_stats.SummaryState.load(state_file) if os.path.exists(state_file) else None
+    size = os.path.getsize(input_file) if os.path.exists(input_file) else 0
+    if state is not None and (size < state.offset or head_digest(input_file, state.offset) != state.head):
+        logger.info("Scored dataset was rewritten; rebuilding incremental statistics")
+        state = None
+    if state is not None and state.time_series is None:
+        logger.info("Incremental statistics predate the time series; rebuilding")
+        state = None
+    if state is None:
+        state = online_stats.SummaryState(category_mapping=CATEGORY_MAPPING.items(), threshold=THRESHOLD)
+
+    added = 0
+    while True:
+        records, offset = storage.read_tail(input_file, state.offset, limit=batch_size)
+        if records:
+            state.update(score_frame(records))
+            added += len(records)
+        if offset == state.offset:
+            break
+        state.offset = offset
+    state.head = head_digest(input_file, state.offset)
+    state.save(state_file)
+    logger.info(f"Incremental statistics: {added} new posts, {state.n} total")
+    return state
+
+def agreement_from_state(state):
+    """The agreement tables of `compute_agreement`, rebuilt from counts."""
+    labels = [False, True]
+    counts = state.contingency.counts   # rows: openai_flag, columns: persp_flag
+    conf_matrix = pd.DataFrame(counts, index=pd.Index(labels, name="openai_flag"),
+                               columns=pd.Index(labels, name="persp_flag"))
+    conf_matrix = conf_matrix.loc[conf_matrix.sum(axis=1) > 0, conf_matrix.sum(axis=0) > 0]
+
+    cm = counts.T   # rows: Perspective (truth), columns: OpenAI (prediction)
+    cm_df = pd.DataFrame(cm,
+                         index=["Perspective: Non-toxic", "Perspective: Toxic"],
+                         columns=["OpenAI: Non-toxic", "OpenAI: Toxic"])
+
+    tp = np.diag(cm).astype(np.float64)
+    predicted, support = cm.sum(axis=0), cm.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.nan_to_num(tp / predicted)
+        recall = np.nan_to_num(tp / support)
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+    metrics_df = pd.DataFrame({
+        "Class": ["Non-toxic", "Toxic"],
+        "Precision": precision,
+        "Recall": recall,
+        "F1-score": f1,
+        "Support": support
+    })
+
+    op_rates = state.by_op.rates()
+    op_disagree_rate = pd.Series({k: op_rates[k] for k in sorted(op_rates)}, name="disagreement", dtype=np.float64)
+    op_disagree_rate.index.name = "is_op"
+    country_disagree = pd.Series(state.by_country.rates(MIN_COUNTRY_POSTS), name="disagreement",
+                                 dtype=np.float64).sort_values(ascending=False)
+    country_disagree.index.name = "country"
+
+    return {
+        "conf_matrix": conf_matrix,
+        "cm_df": cm_df,
+        "metrics_df": metrics_df,
+        "op_disagree_rate": op_disagree_rate,
+        "country_disagree": country_disagree,
+    }
+
+def summary_from_state(state, agreement):
+    from scipy.stats import chi2_contingency
+
+    pearson_corr, pearson_p = state.moments.pearson()
+    spearman_corr, spearman_p, spearman_bound = state.sketch.spearman()
+    logger.info(f"Pearson corr = {pearson_corr:.3f} (p={pearson_p:.4f})")
+    logger.info(f"Spearman corr ~ {spearman_corr:.3f} (±{spearman_bound:.3f}, p={spearman_p:.4f})")
+    pearson_ci = fisher_ci(pearson_corr, state.moments.n)
+
+    correlation_results = []
+    for (openai_col, persp_col), (moments, sketch) in state.categories.items():
+        if moments.n >= 2:
+            correlation_results.append({
+                "openai": openai_col,
+                "perspective": persp_col,
+                "pearson": round(moments.pearson()[0], 3),
+                "spearman": round(sketch.spearman()[0], 3),
+            })
+
+    t_stat, t_p = state.moments.t_test()
+    chi2, chi_p, _, _ = chi2_contingency(agreement["conf_matrix"])
+    counts, n = state.contingency.counts, state.n
+    return {
+        "pearson_corr": pearson_corr,
+        "pearson_r_ci": pearson_ci,
+        "spearman_corr": spearman_corr,
+        "spearman_p": spearman_p,
+        "spearman_error_bound": spearman_bound,
+        "agreement_rate": (counts[0, 0] + counts[1, 1]) / n,
+        "false_positive_rate": counts[1, 0] / n * 100,
+        "false_negative_rate": counts[0, 1] / n * 100,
+        "t_test": {"t_stat": t_stat, "p_value": t_p},
+        "cohen_d": state.moments.cohens_d(),
+        "chi_square": {"chi2": chi2, "p_value": chi_p},
+        "op_disagreement_rate": agreement["op_disagree_rate"].to_dict(),
+        "country_disagreement_rate": agreement["country_disagree"].to_dict(),
+        "category_correlations": correlation_results,
+        "generated_at": datetime.utcnow().isoformat() + "Z"
+    }
+
+CI_TABLES = {"op_disagreement_rate": "disagreement_by_op.csv",
+             "country_disagreement_rate": "disagreement_by_country.csv"}
+
+def previous_ci(tables_dir):
+    """Bootstrap CI columns a full run left in the breakdown tables, in the
+    `compute_bootstrap` layout, so an incremental refresh can keep them."""
+    ci = {}
+    for name, table in CI_TABLES.items():
+        path = os.path.join(tables_dir, table)
+        if not os.path.exists(path):
+            continue
+        # only empty cells are missing: "NA" is Namibia
+        frame = pd.read_csv(path, index_col=0, keep_default_na=False, na_values=[""])
+        if {"ci_low", "ci_high"} <= set(frame.columns):
+            ci[name] = (frame["ci_low"].dropna().to_dict(), frame["ci_high"].dropna().to_dict())
+    return ci
+
+def merge_summary(summary, summary_dir):
+    """`summary` on top of the saved one. What the state cannot recompute
+    (bootstrap CIs, threshold sweep, reply graph) is kept from the last full
+    run and listed under `carried_over`, since it predates the new posts."""
+    path = os.path.join(summary_dir, "analysis_summary.json")
+    if not os.path.exists(path):
+        return summary
+    with open(path, encoding="utf-8") as f:
+        previous = json.load(f)
+    category_ci = {(entry["openai"], entry["perspective"]): entry["pearson_ci"]
+                   for entry in previous.get("category_correlations", []) if "pearson_ci" in entry}
+    for entry in summary["category_correlations"]:
+        key = (entry["openai"], entry["perspective"])
+        if key in category_ci:
+            entry["pearson_ci"] = category_ci[key]
+    carried = sorted(key for key in previous if key not in summary and key != "carried_over")
+    merged = {**previous, **summary}
+    merged.pop("carried_over", None)
+    if carried:
+        merged["carried_over"] = carried
+    return merged
+
+def run_incremental(input_file=None, state_file=None, tables_dir=None, summary_dir=None):
+    """Refresh the summary and tables from the saved statistics plus newly
+    scored posts. Spearman values come from a rank sketch; the summary
+    carries its error bound. Plots need the full data and are left alone;
+    results only a full run computes are kept (see `merge_summary`)."""
+    tables_dir = tables_dir or TABLES_DIR
+    summary_dir = summary_dir or SUMMARY_DIR
+    for folder in (tables_dir, summary_dir):
+        os.makedirs(folder, exist_ok=True)
+
+    state = update_state(input_file, state_file)
+    agreement = agreement_from_state(state)
+    write_tables(agreement, tables_dir, previous_ci(tables_dir))
+    write_time_series_tables(state.time_series, tables_dir)
+    summary = summary_from_state(state, agreement)
+    summary["time_series"] = state.time_series.summary()
+    summary = merge_summary(summary, summary_dir)
+    write_summary(summary, summary_dir)
+    logger.info("✅ Incremental analysis complete. Summary and tables updated")
+    return summary
+
+# ===== PLOTS =====
+def _distribution_data(values, params):
+    data = {"mean": float(values.mean()), "median": float(np.median(values))} if len(values) else {}
+    if params["binned"]:
+        data.update(plotting.binned(values, params["bins"]))
+    else:
+        data["values"] = values
+    return data
+
+def plot_jobs(df, agreement, results_dir, preview=False, sweep=None):
+    """Describe every figure as a `plotting` job (data + parameters)."""
+    params = plotting.plot_params(preview)
+    path = lambda name: os.path.join(results_dir, name)
+    values = {col: df[col].dropna().to_numpy() for col in SCORE_COLUMNS}
+
+    jobs = [{
+        "kind": "correlation_heatmap",
+        "file": path("correlation_heatmap.png"),
+        "data": {"corr": df[["openai_toxicity", "persp_toxicity"]].astype(np.float64).corr()},
+        "params": params,
+    }]
+    # ===== DISTRIBUTIONS =====
+    for col in SCORE_COLUMNS:
+        if len(values[col]) == 0:
+            continue
+        data = _distribution_data(values[col], params)
+        data["column"] = col
+        jobs.append({"kind": "distribution", "file": path(f"{col}_distribution.png"),
+                     "data": data, "params": params})
+    # Combined toxicity score distribution
+    jobs.append({
+        "kind": "combined",
+        "file": path("toxicity_distributions.png"),
+        "data": {"openai": _distribution_data(values["openai_toxicity"], params),
+                 "perspective": _distribution_data(values["persp_toxicity"], params)},
+        "params": params,
+    })
+    jobs.append(agreement_matrix_job(agreement, results_dir, params))
+    # ===== SCATTERPLOT: OpenAI vs Perspective =====
+    jobs.append({
+        "kind": "scatter",
+        "file": path("scatter_toxicity.png"),
+        "data": {"openai": df["openai_toxicity"].to_numpy(), "perspective": df["persp_toxicity"].to_numpy()},
+        "params": params,
+        "savefig": {"bbox_inches": "tight"},
+    })
+    if sweep is not None:
+        result, diagonal = sweep["result"], np.arange(len(sweep["result"]["thresholds"]))
+        jobs.append({
+            "kind": "threshold_sweep",
+            "file": path("threshold_sweep.png"),
+            "data": {
+                "thresholds": result["thresholds"],
+                **{metric: result[metric][diagonal, diagonal] for metric in ("agreement", "kappa", "f1")},
+                "roc": _thin(sweep["curves"], ["fpr", "tpr"]),
+                "pr": _thin(sweep["curves"], ["recall", "precision"]),
+                "roc_auc": sweep["curves"]["roc_auc"],
+                "average_precision": sweep["curves"]["average_precision"],
+                "reference_threshold": sweep["reference_threshold"],
+            },
+            "params": params,
+        })
+    return jobs
+
+def agreement_matrix_job(agreement, results_dir, params):
+    return {"kind": "agreement_matrix", "file": os.path.join(results_dir, "agreement_matrix.png"),
+            "data": {"conf_matrix": agreement["conf_matrix"]}, "params": params}
+
+def render_plots(df, agreement, results_dir, preview=False, sweep=None, workers=None, force=False, fast=False):
+    """Render all figures in a process pool, skipping ones whose data and
+    parameters are unchanged since the last run. `fast` renders only the
+    agreement matrix."""
+    if fast:
+        jobs = [agreement_matrix_job(agreement, results_dir, plotting.plot_params(preview))]
+    else:
+        jobs = plot_jobs(df, agreement, results_dir, preview, sweep)
+    with metrics.timer("plot_render_seconds", preview=preview):
+        rendered, skipped = plotting.render_jobs(jobs, results_dir, workers=workers or plotting.PLOT_WORKERS,
+                                                 force=force)
+    metrics.inc("plots_total", len(rendered), result="rendered")
+    metrics.inc("plots_total", len(skipped), result="skipped")
+    for name in rendered:
+        logger.info(f"Saved {name}")
+    logger.info(f"Rendered {len(rendered)} plots, {len(skipped)} unchanged" + (" (preview)" if preview else ""))
+    return rendered, skipped
+
+# ===== ANALYSIS =====
+def run_analysis(df=None, fast=False, preview=False, input_file=None,
+                 results_dir=None, tables_dir=None, summary_dir=None,
+                 bootstrap_replicates=None, seed=BOOTSTRAP_SEED, graph_file=None,
+                 use_store=True):
+    """Run the full analysis and write tables, summary and plots (with `fast`,
+    only the agreement matrix);
+    `preview` renders quick low-DPI plots instead.
+    Pass `df` (a frame from `load_scores`/`score_frame`) to skip reading `input_file`.
+    Reply-graph statistics are added when `graph_file` (default GRAPH_FILE) exists.
+    `use_store=False` parses the JSONL instead of the columnar score store.
+    `bootstrap_replicates` defaults to BOOTSTRAP_REPLICATES, or 0 with `fast`."""
+    if bootstrap_replicates is None:
+        bootstrap_replicates = 0 if fast else BOOTSTRAP_REPLICATES
+    graph_file = graph_file or GRAPH_FILE
+    results_dir = results_dir or RESULTS_DIR
+    tables_dir = tables_dir or TABLES_DIR
+    summary_dir = summary_dir or SUMMARY_DIR
+    for folder in (results_dir, tables_dir, summary_dir):
+        os.makedirs(folder, exist_ok=True)
+
+    def section(name):
+        return metrics.timer("analysis_section_seconds", section=name)
+
+    with section("load"):
+        df = load_scores(input_file, use_store) if df is None else df
+    metrics.inc("records_total", len(df), stage="analyze")
+    with section("statistics"):
+        correlations = compute_correlations(df)
+        agreement = compute_agreement(df)
+    with section("bootstrap"):
+        ci = compute_bootstrap(df, agreement, bootstrap_replicates, seed) if bootstrap_replicates else None
+    with section("sweep"):
+        sweep = compute_sweep(df)
+    with section("write"):
+        write_tables(agreement, tables_dir, ci)
+        write_sweep_tables(sweep, tables_dir)
+        summary = build_summary(df, correlations, agreement, compute_stats(df, agreement))
+        summary["threshold_sweep"] = sweep_summary(sweep)
+        if ci:
+            add_bootstrap_to_summary(summary, ci, bootstrap_replicates, seed)
+    with section("time_series"):
+        series = time_series.TimeSeries(threshold=THRESHOLD)
+        series.update(df)
+        write_time_series_tables(series, tables_dir)
+        summary["time_series"] = series.summary()
+    if os.path.exists(graph_file):
+        with section("reply_graph"):
+            graph_result = compute_reply_graph(df, reply_graph.ReplyGraph.load(graph_file))
+            write_graph_tables(graph_result, tables_dir)
+            summary["reply_graph"] = graph_result["summary"]
+    with section("write"):
+        write_summary(summary, summary_dir)
+
+    with section("plots"):
+        # --fast skips the heavy figures; the agreement matrix is always saved
+        render_plots(df, agreement, results_dir, preview=preview, sweep=sweep, fast=fast)
+
+    logger.info("✅ Analysis complete. Results saved into /results, /tables, and /summary")
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="4chan Toxicity Analysis")
+    parser.add_argument("--fast", action="store_true",
+                        help="Skip heavy plots (distributions/heatmaps) and, unless --bootstrap is given, bootstrap CIs.")
+    parser.add_argument("--preview", action="store_true",
+                        help="Render low-DPI preview plots (binned histograms, no KDE).")
+    parser.add_argument("--bootstrap", type=int, metavar="N",
+                        help=f"Bootstrap replicates for confidence intervals (default {BOOTSTRAP_REPLICATES}, 0 with --fast; 0 disables).")
+    parser.add_argument("--seed", type=int, default=BOOTSTRAP_SEED, help="Bootstrap RNG seed.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Update summary/tables from posts scored since the last run (no plots).")
+    parser.add_argument("--no-store", action="store_true",
+                        help="Parse the scored JSONL instead of the memory-mapped score store.")
+    args = parser.parse_args(argv)
+
+    os.makedirs(SUMMARY_DIR, exist_ok=True)
+    setup_logging()
+    if args.incremental:
+        return run_incremental()
+    return run_analysis(fast=args.fast, preview=args.preview,
+                        bootstrap_replicates=args.bootstrap, seed=args.seed, use_store=not args.no_store)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,174 +1,435 @@
 from dotenv import load_dotenv
-import os, json, time, requests, random
-from openai import OpenAI
+import os, json, asyncio, argparse, itertools, requests
+from openai import OpenAI, APIStatusError, APIConnectionError
+
+import metrics
+import storage
+from journal import RESCORED_FIELD, ScoreJournal
+from rate_limiting import RetryPolicy
+from score_cache import ScoreCache, make_namespace
+from score_store import ScoreStore
+from scoring_engine import Provider, score_batches
+from triage import Triage, THRESHOLD as TRIAGE_THRESHOLD, scored_own_text
+import prefilter as prefilter_model
 
 # ===== PATHS =====
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-INPUT_FILE = os.path.join(DATA_DIR, "pol_posts.json")   # from processing.py
-OUTPUT_FILE = os.path.join(DATA_DIR, "pol_posts_with_scores.json")
+INPUT_FILE = os.path.join(DATA_DIR, "pol_posts.jsonl")   # from processing.py
+OUTPUT_FILE = os.path.join(DATA_DIR, "pol_posts_with_scores.jsonl")  # append-only
+CACHE_FILE = os.path.join(DATA_DIR, "score_cache.sqlite")  # content-hash score cache
+CACHE_MAX_ENTRIES = 1_000_000
+PREFILTER_FILE = os.path.join(DATA_DIR, "prefilter.npz")  # from `python src/prefilter.py train`
 
 # ===== API KEYS =====
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 PERSPECTIVE_API_KEY = os.getenv("PERSPECTIVE_API_KEY")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# honours OPENAI_BASE_URL, e.g. a local mock. The SDK's own retries are off: a
+# 429 must reach the provider's adaptive limiter instead of being slept away.
+# Built on first use, so importing this module (benchmarks against the local
+# mocks, --seed-cache) needs no API key.
+client = None
+
+def get_client():
+    global client
+    if client is None:
+        client = OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+    return client
 
 # ===== OPENAI MODERATION API =====
-def get_openai_moderation(text):
-    if not text.strip():
-        return None
+OPENAI_MODEL = "text-moderation-latest"
+OPENAI_BATCH_SIZE = 32        # max inputs per moderation request
+OPENAI_BATCH_CHARS = 32000    # max total characters per moderation request
+
+# ===== PROVIDER LIMITS =====
+# Each provider has its own request budget, so both quotas are used at once.
+# Rates start at *_RATE and adapt to 429s; they probe upward to *_MAX_RATE.
+OPENAI_RATE = 5               # moderation requests/sec
+OPENAI_MAX_RATE = 50
+OPENAI_CONCURRENCY = 4
+PERSPECTIVE_RATE = 1          # Perspective default quota: 1 QPS
+PERSPECTIVE_MAX_RATE = 1      # raise for projects with a higher quota
+PERSPECTIVE_CONCURRENCY = 2
+MAX_IN_FLIGHT = 256           # posts scored but not yet written
+OFFLINE_RETRY_SECONDS = 10
+
+# ===== TRIAGE =====
+# Opt-in (--triage): near-duplicates (see triage.py) are scored once through
+# their cluster's representative, so members carry copied scores.
+# TRIAGE_THRESHOLD=1.0 propagates only between identical texts.
+TRIAGE_AUDIT_RATE = 0.0       # share of cluster members scored on their own text anyway
+
+# ===== PRE-FILTER =====
+# Optional local model (see prefilter.py): posts it rates as obviously benign
+# skip both APIs and are saved with null scores, `"prefiltered": true` and a
+# `prefilter` record. Analysis leaves them out; --rescore-prefiltered scores
+# them later (the scored record supersedes the skipped one).
+PREFILTER_SAMPLE_RATE = prefilter_model.SAMPLE_RATE  # skippable posts scored anyway to measure precision
+
+def openai_moderation_request(texts):
+    response = get_client().moderations.create(model=OPENAI_MODEL, input=texts)
+    results = response.model_dump()["results"]
+    if len(results) != len(texts):
+        raise ValueError(f"expected {len(texts)} moderation results, got {len(results)}")
+    return results
+
+def moderate_batch(items):
+    """Score [(post_id, text), ...] in one request. If the request is rejected
+    because of its inputs (400) or its size (413), split it in half and retry
+    each half, so a single bad input only loses its own score."""
+    try:
+        results = openai_moderation_request([text for _, text in items])
+    except (APIStatusError, ValueError) as e:
+        if isinstance(e, APIStatusError) and e.status_code not in (400, 413):
+            raise
+        if len(items) == 1:
+            print(f"[ERROR] OpenAI Moderation rejected post {items[0][0]}: {e}")
+            return {items[0][0]: None}
+        mid = len(items) // 2
+        return {**moderate_batch(items[:mid]), **moderate_batch(items[mid:])}
+    return {post_id: result for (post_id, _), result in zip(items, results)}
+
+def moderate_posts(items):
+    """Map post_id -> moderation result for [(post_id, text), ...]. Raises on
+    transport/server errors so the caller's retry policy can handle them."""
+    items = [(post_id, text) for post_id, text in items if text.strip()]
+    return moderate_batch(items) if items else {}
+
+def get_openai_moderation_batch(items):
     try:
-        response = client.moderations.create(
-            model="text-moderation-latest",
-            input=text
-        )
-        return response.model_dump()["results"][0]  
+        return moderate_posts(items)
     except Exception as e:
         print(f"[ERROR] OpenAI Moderation failed: {e}")
-        return None
+        return {}
+
+def get_openai_moderation(text):
+    return get_openai_moderation_batch([(0, text)]).get(0)
+
+def pack_batches(entries, max_items=OPENAI_BATCH_SIZE, max_chars=OPENAI_BATCH_CHARS):
+    """Group (idx, post) pairs into batches bounded by count and total characters."""
+    batch, chars = [], 0
+    for entry in entries:
+        size = len(entry[1].get("comment_text", ""))
+        if batch and (len(batch) >= max_items or chars + size > max_chars):
+            yield batch
+            batch, chars = [], 0
+        batch.append(entry)
+        chars += size
+    if batch:
+        yield batch
 
 # ===== GOOGLE PERSPECTIVE API =====
-def get_perspective_scores(text):
+PERSPECTIVE_URL = os.getenv("PERSPECTIVE_URL", "https://commentanalyzer.googleapis.com/v1alpha1/comments:analyze")
+PERSPECTIVE_MODEL = "v1alpha1-en"
+PERSPECTIVE_ATTRIBUTES = [
+    "TOXICITY", "SEVERE_TOXICITY", "INSULT", "PROFANITY", "THREAT",
+    "IDENTITY_ATTACK", "SEXUALLY_EXPLICIT", "FLIRTATION", "SPAM", "OBSCENE"
+]
+
+def perspective_request(text):
+    """Raises on transport/server errors so the caller's retry policy can handle them."""
     if not text.strip():
         return None
+    body = {
+        "comment": {"text": text},
+        "languages": ["en"],
+        "requestedAttributes": {attr: {} for attr in PERSPECTIVE_ATTRIBUTES}
+    }
+    r = requests.post(f"{PERSPECTIVE_URL}?key={PERSPECTIVE_API_KEY}", json=body, timeout=10)
+    r.raise_for_status()
+    scores = {}
+    for attr, val in r.json().get("attributeScores", {}).items():
+        scores[attr] = val["summaryScore"]["value"]
+    return scores
+
+def get_perspective_scores(text):
     try:
-        url = f"https://commentanalyzer.googleapis.com/v1alpha1/comments:analyze?key={PERSPECTIVE_API_KEY}"
-        body = {
-            "comment": {"text": text},
-            "languages": ["en"],
-            "requestedAttributes": {
-                "TOXICITY": {}, "SEVERE_TOXICITY": {}, "INSULT": {}, "PROFANITY": {}, "THREAT": {},
-                "IDENTITY_ATTACK": {}, "SEXUALLY_EXPLICIT": {}, "FLIRTATION": {}, "SPAM": {}, "OBSCENE": {}
-            }
-        }
-        r = requests.post(url, json=body, timeout=10)
-        r.raise_for_status()
-        scores = {}
-        for attr, val in r.json().get("attributeScores", {}).items():
-            scores[attr] = val["summaryScore"]["value"]
-        return scores
+        return perspective_request(text)
     except Exception as e:
         print(f"[ERROR] Perspective API failed: {e}")
         return None
 
-# ===== Retry wrapper =====
-def safe_call(func, *args, retries=3):
-    for i in range(retries):
-        try:
-            return func(*args)
-        except Exception as e:
-            print(f"[WARN] {func.__name__} failed (attempt {i+1}): {e}")
-            time.sleep((2 ** i) + random.random())
-    return None
-
-# ===== Internet Connectivity Check =====
-def is_connected():
-    try:
-        requests.get("https://www.google.com", timeout=5)
-        return True
-    except requests.ConnectionError:
-        return False
-
-# ===== MAIN INTEGRATION =====
-def run_api_analysis():
-    if not os.path.exists(INPUT_FILE):
-        print(f"[ERROR] Input file {INPUT_FILE} not found.")
-        return
-
-    with open(INPUT_FILE, "r", encoding="utf-8") as f:
-        posts = json.load(f)
+# ===== PROVIDERS =====
+def make_providers():
+    """Fresh providers per run: each owns its limiter, concurrency cap and backoff."""
+    openai_provider = Provider(
+        "OpenAI Moderation", moderate_posts, rate=OPENAI_RATE, max_rate=OPENAI_MAX_RATE,
+        concurrency=OPENAI_CONCURRENCY,
+        retry=RetryPolicy(retries=3), connection_errors=(APIConnectionError,),
+        namespace=make_namespace("openai", OPENAI_MODEL),
+    )
+    perspective_provider = Provider(
+        "Perspective API", perspective_request, rate=PERSPECTIVE_RATE, max_rate=PERSPECTIVE_MAX_RATE,
+        concurrency=PERSPECTIVE_CONCURRENCY,
+        retry=RetryPolicy(retries=3), connection_errors=(requests.ConnectionError,),
+        namespace=make_namespace("perspective", PERSPECTIVE_MODEL, PERSPECTIVE_ATTRIBUTES),
+    )
+    return openai_provider, perspective_provider
 
-    enriched_posts = []
-    processed_ids = set()
-    missing_count = 0
+# ===== ENRICHMENT =====
+def openai_toxicity_score(openai_result):
+    # ✅ Correct OpenAI toxicity extraction
+    openai_scores = openai_result.get("category_scores", {}) if openai_result else {}
+    return sum([
+        openai_scores.get("hate", 0),
+        openai_scores.get("harassment", 0),
+        openai_scores.get("violence", 0),
+        openai_scores.get("sexual", 0),
+        openai_scores.get("self-harm", 0)
+    ])
 
-    # Resume from previous output if available
-    if os.path.exists(OUTPUT_FILE):
-        with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-            try:
-                enriched_posts = json.load(f)
-                processed_ids = {post.get("post_id") for post in enriched_posts if post.get("post_id")}
-                print(f"🔄 Resuming from {len(enriched_posts)} posts")
-            except json.JSONDecodeError:
-                print("⚠️ Could not parse existing output file. Starting fresh.")
+def enrich_post(post, openai_result, perspective_result):
+    # ✅ Perspective toxicity extraction
+    persp_toxicity = perspective_result.get("TOXICITY") if perspective_result else None
+    post["openai_moderation"] = openai_result
+    post["openai_toxicity"] = openai_toxicity_score(openai_result)
+    post["perspective_scores"] = perspective_result
+    post["persp_toxicity"] = persp_toxicity
+    return post
 
-    try:
-        for idx, post in enumerate(posts, start=1):
-            post_id = post.get("post_id") or idx
-            if post_id in processed_ids:
-                continue
+# ===== MAIN INTEGRATION =====
+def pending_posts(processed_ids, posts=None, shard=None):
+    """(idx, post) for posts not scored yet. With `shard=(index, count)` only
+    posts with post_id % count == index, so several workers can split one input."""
+    posts = posts if posts is not None else storage.iter_records(INPUT_FILE)
+    for idx, post in enumerate(posts, start=1):
+        post["post_id"] = post.get("post_id") or idx
+        if shard and post["post_id"] % shard[1] != shard[0]:
+            continue
+        if post["post_id"] not in processed_ids:
+            yield idx, post
 
-            text = post.get("comment_text", "")
+def seed_cache():
+    """Load every score already in OUTPUT_FILE into the cache, so re-analysing
+    an old corpus needs no network calls at all. Only scores a provider gave
+    for the post's own text count: pre-filtered posts have none, and triage
+    members carry their representative's."""
+    openai_provider, perspective_provider = make_providers()
+    cache = ScoreCache(CACHE_FILE, max_entries=CACHE_MAX_ENTRIES)
+    seeded = 0
+    for post in storage.iter_records(OUTPUT_FILE):
+        if prefilter_model.skipped(post) or not scored_own_text(post):
+            continue
+        text = post.get("comment_text", "")
+        cache.put(openai_provider.namespace, text, post.get("openai_moderation"))
+        cache.put(perspective_provider.namespace, text, post.get("perspective_scores"))
+        seeded += 1
+    cache.close()
+    print(f"✅ Seeded score cache from {seeded} scored posts ({CACHE_FILE})")
 
-            if idx <= 3:
-                print(f"\n--- Post {idx} sample input ---")
-                print(text)
-                print("------------------------------")
+def prefiltered_posts(processed_ids):
+    """Posts in OUTPUT_FILE that the pre-filter skipped and that were not
+    rescored yet, stripped back to processed posts and marked `rescored`."""
+    for record in storage.iter_records(OUTPUT_FILE):
+        if not prefilter_model.skipped(record) or -record["post_id"] in processed_ids:
+            continue
+        for field in ("prefiltered", "openai_moderation", "openai_toxicity", "perspective_scores", "persp_toxicity"):
+            record.pop(field, None)
+        record[RESCORED_FIELD] = True
+        yield record
 
-            # Check internet before OpenAI call
-            while not is_connected():
-                print("🌐 No internet connection. Retrying in 10 seconds...")
-                time.sleep(10)
+def triaged(posts, triage):
+    for idx, post in posts:
+        triage.assign(post)
+        yield idx, post
 
-            openai_result = safe_call(get_openai_moderation, text)
-            time.sleep(1)
+def prefiltered(posts, prefilter, on_skipped, batch_size=prefilter_model.BATCH):
+    """Score `posts` with the pre-filter a batch at a time; pass skipped
+    ones to `on_skipped(idx, post)` and yield the rest."""
+    batch = []
+    for entry in itertools.chain(posts, [None]):
+        if entry is not None:
+            batch.append(entry)
+            if len(batch) < batch_size:
+                continue
+        if not batch:
+            break
+        prefilter.annotate([post for _, post in batch])
+        for idx, post in batch:
+            if post["prefilter"]["skipped"]:
+                on_skipped(idx, post)
+            else:
+                yield idx, post
+        batch = []
 
-            # ✅ Correct OpenAI toxicity extraction
-            openai_scores = openai_result.get("category_scores", {}) if openai_result else {}
-            openai_toxicity = sum([
-                openai_scores.get("hate", 0),
-                openai_scores.get("harassment", 0),
-                openai_scores.get("violence", 0),
-                openai_scores.get("sexual", 0),
-                openai_scores.get("self-harm", 0)
-            ])
+def run_api_analysis(use_cache=True, posts=None, shard=None, triage=False, triage_threshold=None,
+                     triage_audit=None, prefilter=False, prefilter_threshold=None, rescore_prefiltered=False):
+    """Score `posts` (any iterable of processed posts, e.g. the generator from
+    processing.iter_processed_posts) or, by default, INPUT_FILE. Results go
+    through a write-ahead journal (see journal.py) that is compacted into
+    OUTPUT_FILE; `shard=(index, count)` scores one share of the posts, so
+    several workers can run side by side on the same files. With `triage`,
+    near-duplicate posts share their cluster representative's scores and
+    record the cluster in `post["triage"]`; `triage_audit` scores that share
+    of them on their own text and reports the propagation error. With `prefilter`, posts the
+    local model (PREFILTER_FILE) rates as benign are not sent at all.
+    `rescore_prefiltered` instead scores the posts an earlier pre-filtered
+    run skipped; their scored records are appended to OUTPUT_FILE."""
+    storage.migrate_legacy(INPUT_FILE)
+    storage.migrate_legacy(OUTPUT_FILE)
+    if posts is None and not os.path.exists(INPUT_FILE):
+        print(f"[ERROR] Input file {INPUT_FILE} not found.")
+        return
+    if prefilter and not rescore_prefiltered and not os.path.exists(PREFILTER_FILE):
+        print(f"[ERROR] Pre-filter model {PREFILTER_FILE} not found (run `python src/prefilter.py train`).")
+        return
 
-            # Check internet before Perspective call
-            while not is_connected():
-                print("🌐 No internet connection. Retrying in 10 seconds...")
-                time.sleep(10)
+    # Fold in whatever a crashed run left in the journal, then resume from
+    # the committed id index (only the ids are kept in memory)
+    journal = ScoreJournal(OUTPUT_FILE)
+    cache = None
+    try:
+        recovered = journal.compact()
+        if recovered:
+            print(f"🩹 Recovered {recovered} scored posts from the journal")
+        processed_ids = journal.processed_ids()
+        saved = sum(1 for post_id in processed_ids if post_id > 0)  # negated ids are rescores
+        if saved:
+            print(f"🔄 Resuming from {saved} posts")
 
-            perspective_result = safe_call(get_perspective_scores, text)
-            time.sleep(1)
+        stats = {"missing": 0, "sampled": 0, "sampled_needed": 0}
+        tri = None
 
-            # ✅ Perspective toxicity extraction
-            persp_toxicity = perspective_result.get("TOXICITY") if perspective_result else None
+        # Results stream to the checkpoint file as soon as both providers answered
+        def on_scored(idx, post, openai_result, perspective_result):
+            post_id = post["post_id"]
+            enrich_post(post, openai_result, perspective_result)
 
             # 🔍 Debug print for first few posts
             if idx <= 3:
+                print(f"\n--- Post {idx} sample input ---")
+                print(post.get("comment_text", ""))
+                print("------------------------------")
                 print(f"\n🔍 OpenAI response for post {post_id}:\n", json.dumps(openai_result, indent=2))
                 print(f"\n🔍 Perspective response for post {post_id}:\n", json.dumps(perspective_result, indent=2))
 
             # ✅ Count and warn if scores are missing
-            if openai_toxicity is None or persp_toxicity is None:
+            if openai_result is None or perspective_result is None:
                 print(f"[WARN] Missing toxicity scores for post {post_id}")
-                missing_count += 1
+                stats["missing"] += 1
+
+            # 🧪 Posts the pre-filter would have skipped, scored to check it
+            if post.get("prefilter", {}).get("sampled") and prefilter_model.label(post) is not None:
+                stats["sampled"] += 1
+                stats["sampled_needed"] += prefilter_model.label(post)
 
-            # ✅ Enrich post with fallback values
-            post["openai_moderation"] = openai_result
-            post["openai_toxicity"] = openai_toxicity if openai_toxicity is not None else None
-            post["perspective_scores"] = perspective_result
-            post["persp_toxicity"] = persp_toxicity if persp_toxicity is not None else None
-            post["post_id"] = post_id
-            enriched_posts.append(post)
+            if tri is not None:
+                tri.observe(post)  # pairs audited members with their representative
+            journal.write(post)  # fsynced in batches of journal.FSYNC_EVERY
+            if journal.count % 50 == 0:
+                print(f"Processed {journal.count} posts...")
 
-            if idx % 50 == 0:
-                print(f"Processed {idx}/{len(posts)} posts...")
+        openai_provider, perspective_provider = make_providers()
+        cache = ScoreCache(CACHE_FILE, max_entries=CACHE_MAX_ENTRIES) if use_cache else None
+        if rescore_prefiltered:
+            # Already in processed_ids (as skipped); the journal keeps one rescore per post
+            pending = pending_posts(set(), prefiltered_posts(processed_ids), shard)
+            prefilter = False
+        else:
+            pending = pending_posts(processed_ids, posts, shard)
+        local = None
+        if prefilter:
+            local = prefilter_model.Prefilter(PREFILTER_FILE, threshold=prefilter_threshold,
+                                              sample_rate=PREFILTER_SAMPLE_RATE)
 
-            if idx % 100 == 0:
-                with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-                    json.dump(enriched_posts, f, ensure_ascii=False, indent=2)
-                print(f"💾 Saved checkpoint at {idx} posts")
+            def on_skipped(idx, post):
+                enrich_post(post, None, None)
+                post["openai_toxicity"] = None  # not scored, rather than scored 0
+                post["prefiltered"] = True      # left out of the analysis; see --rescore-prefiltered
+                journal.write(post)
 
+            pending = prefiltered(pending, local, on_skipped)
+        if triage:
+            tri = Triage(TRIAGE_THRESHOLD if triage_threshold is None else triage_threshold,
+                         TRIAGE_AUDIT_RATE if triage_audit is None else triage_audit)
+            pending = triaged(pending, tri)
+            # A representative's scores are reused through the cache; without the
+            # persistent one, a run-local cache still scores each cluster once
+            cache = cache or ScoreCache(":memory:")
+        try:
+            asyncio.run(score_batches(
+                pack_batches(pending), openai_provider, perspective_provider, on_scored,
+                max_in_flight=MAX_IN_FLIGHT, offline_retry=OFFLINE_RETRY_SECONDS, cache=cache,
+                text_of=tri.scoring_text if tri else None,
+            ))
+        finally:
+            journal.close()
+            journal.compact()
+            metrics.inc("records_total", journal.count, stage="score")
+            # Append the new rows to the columnar copy analysis memory-maps
+            print(f"🗄️ Score store: {ScoreStore(OUTPUT_FILE).sync()} new rows")
+            if cache is not None:
+                for namespace, counts in cache.stats()["by_namespace"].items():
+                    print(f"🗃️ Cache {namespace}: {counts['hits']} hits, {counts['misses']} misses")
+            for provider in (openai_provider, perspective_provider):
+                state = provider.limiter.snapshot()
+                print(f"🚦 {provider.name}: {state['rate']:.2f} req/s, {state['throttle_events']} throttled requests")
+            if local is not None:
+                counts = local.stats()
+                metrics.inc("prefilter_posts_total", counts["skipped"], decision="skipped")
+                metrics.inc("prefilter_posts_total", counts["sampled"], decision="sampled")
+                metrics.inc("prefilter_posts_total", counts["posts"] - counts["skipped"] - counts["sampled"],
+                            decision="scored")
+                print(f"🧪 Pre-filter: skipped {counts['skipped']} of {counts['posts']} posts "
+                      f"(threshold {counts['threshold']:.4f})")
+                if stats["sampled"]:
+                    print(f"🧪 Sampled {stats['sampled']} skippable posts: {stats['sampled_needed']} were not benign "
+                          f"(skip precision {1 - stats['sampled_needed'] / stats['sampled']:.1%}, "
+                          f"held-out {local.report['holdout']['skip_precision']:.1%})")
+            if tri is not None:
+                counts = tri.stats()
+                metrics.inc("triage_posts_total", counts["posts"] - counts["members"], role="representative")
+                metrics.inc("triage_posts_total", counts["members"], role="member")
+                metrics.inc("triage_posts_total", counts["audited"], role="audited")
+                print(f"🧬 Triage: {counts['posts']} posts in {counts['clusters']} clusters, "
+                      f"{counts['members'] - counts['audited']} scored via their representative")
+                for score, audit in tri.audit_report().items():
+                    if not audit["pairs"]:
+                        continue
+                    metrics.set_gauge("triage_audit_mae", audit["mae"], score=score)
+                    metrics.set_gauge("triage_audit_flag_disagreement", audit["flag_disagreement"], score=score)
+                    print(f"🧬 Audit {score}: {audit['pairs']} members vs their representative, "
+                          f"MAE {audit['mae']:.4f}, flagged differently {audit['flag_disagreement']:.1%}")
+            if rescore_prefiltered:
+                print(f"🔁 Rescored {journal.count} posts the pre-filter had skipped")
+            print(f"✅ Final save completed with {saved + (0 if rescore_prefiltered else journal.count)} posts")
+            print(f"⚠️ Total posts missing toxicity scores: {stats['missing']}")
     finally:
-        with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-            json.dump(enriched_posts, f, ensure_ascii=False, indent=2)
-        print(f"✅ Final save completed with {len(enriched_posts)} posts")
-        print(f"⚠️ Total posts missing toxicity scores: {missing_count}")
+        # Every exit, early or not, releases the journal and the cache
+        journal.close()
+        if cache is not None:
+            cache.close()
 
 if __name__ == "__main__":
-    run_api_analysis()
+    parser = argparse.ArgumentParser(description="Score posts with OpenAI Moderation and Perspective")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the content-hash score cache.")
+    parser.add_argument("--seed-cache", action="store_true",
+                        help="Populate the score cache from the existing scored dataset and exit.")
+    parser.add_argument("--shard", metavar="I/N",
+                        help="Score only posts with post_id %% N == I (run N workers side by side).")
+    parser.add_argument("--triage", action="store_true",
+                        help="Score near-duplicates once through a cluster representative (copies its scores).")
+    parser.add_argument("--triage-threshold", type=float,
+                        help=f"Similarity needed to share a cluster's scores (default {TRIAGE_THRESHOLD}; 1.0 = exact).")
+    parser.add_argument("--triage-audit", type=float,
+                        help="Share of cluster members scored on their own text anyway.")
+    parser.add_argument("--prefilter", action="store_true",
+                        help="Skip posts the local pre-filter rates as benign (train it with prefilter.py first).")
+    parser.add_argument("--prefilter-threshold", type=float,
+                        help="Override the trained pre-filter threshold (lower skips fewer posts).")
+    parser.add_argument("--rescore-prefiltered", action="store_true",
+                        help="Score the posts earlier --prefilter runs skipped (saved without scores).")
+    args = parser.parse_args()
+
+    if args.seed_cache:
+        seed_cache()
+    else:
+        shard = tuple(int(part) for part in args.shard.split("/")) if args.shard else None
+        run_api_analysis(use_cache=not args.no_cache, shard=shard, triage=args.triage,
+                         triage_threshold=args.triage_threshold, triage_audit=args.triage_audit,
+                         prefilter=args.prefilter, prefilter_threshold=args.prefilter_threshold,
+                         rescore_prefiltered=args.rescore_prefiltered)
@@ -0,0 +1,670 @@
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import get_context
+
+import numpy as np
+import requests
+
+import data_collection
+import mock_servers
+import storage
+from rate_limiting import AdaptiveTokenBucket
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BASE_DIR, "summary", "benchmarks")
+
+# ===== FETCH THROUGHPUT =====
+def bench_fetch(args):
+    server, url = mock_servers.start_4chan_mock(
+        num_threads=args.threads, posts_per_thread=10, latency=args.latency
+    )
+    data_collection.API_BASE = url
+    thread_ids = list(server.board)
+
+    try:
+        for workers in sorted({1, args.workers}):
+            data_collection.limiter = AdaptiveTokenBucket(rate=args.rate)
+            start = time.perf_counter()
+            fetched = sum(1 for _, data, _ in data_collection.fetch_threads(thread_ids, max_workers=workers) if data)
+            elapsed = time.perf_counter() - start
+            print(f"workers={workers:<3} fetched={fetched:<5} {elapsed:7.2f}s  {fetched / elapsed:7.2f} threads/s")
+    finally:
+        server.shutdown()
+
+
+# ===== HTML CLEANING =====
+def bench_clean(args):
+    import processing
+
+    rng = random.Random(args.seed)
+    corpus = [mock_servers.synthetic_comment(rng, 10**8 + i) for i in range(args.posts)]
+    corpus += ["", "plain text only", "&amp;gt;&amp;gt;double escaped", "a &gt b &amp c", "<b>bold</b>x<i>y</i>",
+               "<br><br><wbr>", "unclosed <span class=\"quote\">&gt;tag", "<!-- comment -->text", "x < y"]
+
+    # Equivalence against the BeautifulSoup reference implementation
+    mismatches = [html for html in corpus if processing.clean_comment(html) != processing.clean_comment_bs4(html)]
+    print(f"equivalence: {len(corpus) - len(mismatches)}/{len(corpus)} identical")
+    for html in mismatches[:5]:
+        print(f"  MISMATCH {html!r}\n    fast={processing.clean_comment(html)!r}\n    bs4 ={processing.clean_comment_bs4(html)!r}")
+
+    runs = [
+        ("beautifulsoup", lambda: [processing.clean_comment_bs4(html) for html in corpus]),
+        ("fast-path", lambda: processing.clean_comments(corpus, workers=1)),
+        (f"fast-path x{args.workers} procs", lambda: processing.clean_comments(corpus, workers=args.workers)),
+    ]
+    for name, run in runs:
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<22} {elapsed:7.2f}s  {len(corpus) / elapsed:10.0f} posts/s")
+    if mismatches:
+        raise SystemExit(1)
+
+# ===== MODERATION BATCHING =====
+def moderation_matches(result, text):
+    if text == mock_servers.REJECT_MARKER:
+        return result is None
+    expected = mock_servers.mock_moderation_result(text)["category_scores"]
+    return result is not None and all(result["category_scores"][k] == expected[k] for k in ("hate", "violence"))
+
+def bench_moderation(args):
+    import api_integration
+    from openai import OpenAI
+
+    server, url = mock_servers.start_openai_mock(latency=args.latency)
+    api_integration.client = OpenAI(api_key="mock", base_url=f"{url}/v1", max_retries=0)
+    items = [(post_id, f"synthetic post {post_id} " + "lorem ipsum " * (post_id % 40))
+             for post_id in range(args.posts)]
+    # One poisoned input per batch-worth of posts exercises the split-and-retry path
+    items[len(items) // 2] = (items[len(items) // 2][0], mock_servers.REJECT_MARKER)
+
+    try:
+        for batch_size in sorted({1, args.batch_size}):
+            server.requests_served = 0
+            start = time.perf_counter()
+            results = {}
+            for batch in api_integration.pack_batches(
+                    [(post_id, {"comment_text": text}) for post_id, text in items], max_items=batch_size):
+                results.update(api_integration.get_openai_moderation_batch(
+                    [(post_id, post["comment_text"]) for post_id, post in batch]))
+            elapsed = time.perf_counter() - start
+
+            wrong = sum(1 for post_id, text in items if not moderation_matches(results.get(post_id), text))
+            print(f"batch_size={batch_size:<4} requests={server.requests_served:<5} {elapsed:7.2f}s  "
+                  f"{len(items) / elapsed:8.1f} posts/s  mismatched={wrong}")
+    finally:
+        server.shutdown()
+
+
+# ===== ADAPTIVE RATE LIMITING =====
+def bench_ratelimit(args):
+    """Drive a Provider against a mock that enforces `quota` req/s and report
+    how close sustained throughput gets to it, and how many 429s that cost."""
+    import asyncio
+    from scoring_engine import Connectivity, Provider
+
+    server, url = mock_servers.start_perspective_mock(latency=args.latency, quota=args.quota)
+    endpoint = f"{url}{mock_servers.PERSPECTIVE_PATH}"
+    session = requests.Session()
+
+    def request(text):
+        r = session.post(endpoint, json={"comment": {"text": text}, "requestedAttributes": {"TOXICITY": {}}},
+                         timeout=10)
+        r.raise_for_status()
+        return r.json()
+
+    async def drive(provider):
+        connectivity = Connectivity()
+        done = []
+        deadline = time.monotonic() + args.seconds
+
+        async def worker(i):
+            while time.monotonic() < deadline:
+                if await provider.call(connectivity, f"post {i}") is not None:
+                    done.append(time.monotonic())
+
+        start = time.monotonic()
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency * 2)))
+        return start, done
+
+    runs = [("fixed (no probing)", args.start_rate), ("adaptive", args.max_rate)]
+    try:
+        for name, max_rate in runs:
+            server.throttled = server.requests_served = 0
+            provider = Provider("bench", request, rate=args.start_rate, concurrency=args.concurrency,
+                                max_rate=max_rate)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start, done = asyncio.run(drive(provider))
+            steady = [t for t in done if t - start >= args.seconds / 2]
+            steady_rate = len(steady) / (args.seconds / 2)
+            print(f"{name:<20} {len(done) / args.seconds:7.2f} req/s overall, {steady_rate:7.2f} req/s in the "
+                  f"second half ({steady_rate / args.quota:6.1%} of quota)  429s={server.throttled:<4} "
+                  f"final rate={provider.limiter.rate:.2f}")
+    finally:
+        server.shutdown()
+
+
+# ===== NEAR-DUPLICATE TRIAGE =====
+TRIAGE_WORDS = ("based", "cope", "the", "government", "thread", "anon", "why", "is", "this", "real", "never",
+                "bread", "milk", "election", "war", "tax", "news", "they", "want", "you", "to", "believe",
+                "source", "fake", "happening", "screencap", "kek", "posting", "again", "every", "day")
+
+def near_duplicate_corpus(count, dup_share, seed=0):
+    """[(label, text)]: unique texts, near-duplicates of earlier ones (same
+    label: quote-link prefixes, reaction suffixes, whitespace noise)
+    and one-word edits of earlier ones (new label, must not be merged)."""
+    rng = random.Random(seed)
+    corpus, originals = [], []
+    for i in range(count):
+        roll = rng.random()
+        if originals and roll < dup_share:
+            label, text = rng.choice(originals)
+            variant = rng.randrange(4)
+            if variant == 0:
+                text = f">>{FIRST_POST + rng.randrange(count)}\n{text}"
+            elif variant == 1:
+                text += rng.choice((" lol", "!!", " this", " /thread"))
+            elif variant == 2:
+                text = f">>{FIRST_POST + rng.randrange(count)} >>{FIRST_POST + rng.randrange(count)}\n{text}"
+            else:
+                text = "  ".join(text.split(" "))
+            corpus.append((label, text))
+        elif originals and roll < dup_share + 0.05:
+            _, text = rng.choice(originals)
+            words = text.split(" ")
+            words[rng.randrange(len(words))] = rng.choice(TRIAGE_WORDS) + "x"
+            corpus.append((i, " ".join(words)))
+        else:
+            text = " ".join(rng.choice(TRIAGE_WORDS) for _ in range(rng.randint(4, 40)))
+            originals.append((i, text))
+            corpus.append((i, text))
+    return corpus
+
+def bench_triage(args):
+    """Clusters, requests saved and pairwise precision/recall of the
+    near-duplicate triage on a corpus with known duplicate groups."""
+    from triage import Triage
+
+    corpus = near_duplicate_corpus(args.posts, args.dup_share, seed=args.seed)
+    for threshold in args.thresholds:
+        triage = Triage(threshold)
+        labels = {}
+        seen_labels = set()
+        merged = correct = expected = found = 0
+        start = time.perf_counter()
+        for post_id, (label, text) in enumerate(corpus):
+            post = triage.assign({"post_id": post_id, "comment_text": text})
+            labels[post_id] = label
+            info = post["triage"]
+            same = labels[info["cluster_id"]] == label
+            if not info["representative"]:
+                merged += 1
+                correct += same
+            if label in seen_labels:
+                expected += 1
+                found += not info["representative"] and same
+            seen_labels.add(label)
+        elapsed = time.perf_counter() - start
+        stats = triage.stats()
+        print(f"threshold={threshold:<5} {stats['clusters']:>8} clusters for {stats['posts']} posts  "
+              f"requests saved={1 - stats['clusters'] / stats['posts']:6.1%}  "
+              f"precision={correct / merged if merged else 1.0:6.1%}  recall={found / expected if expected else 1.0:6.1%}  "
+              f"{stats['posts'] / elapsed:9.0f} posts/s")
+
+
+# ===== LOCAL PRE-FILTER =====
+HOSTILE_WORDS = ("idiot", "moron", "scum", "trash", "filth", "vermin", "hate", "kill", "stupid", "subhuman")
+
+def labelled_corpus(count, hostile_share=0.4, noise=0.05, seed=0):
+    """Scored records whose toxicity follows their words, with `noise` of
+    the labels flipped, so the pre-filter has something real to learn."""
+    rng = random.Random(seed)
+    for i in range(count):
+        words = [rng.choice(TRIAGE_WORDS) for _ in range(rng.randint(3, 30))]
+        hostile = rng.random() < hostile_share
+        if hostile:
+            for _ in range(rng.randint(1, 3)):
+                words.insert(rng.randrange(len(words) + 1), rng.choice(HOSTILE_WORDS))
+        if rng.random() < noise:
+            hostile = not hostile
+        openai_score, persp_score = (rng.uniform(0.1, 1.0), rng.uniform(0.1, 1.0)) if hostile else \
+            (rng.uniform(0, 0.08), rng.uniform(0, 0.08))
+        yield {"post_id": i, "comment_text": " ".join(words), "openai_toxicity": openai_score,
+               "persp_toxicity": persp_score}
+
+def bench_prefilter(args):
+    """Train the pre-filter on one labelled corpus, then report what it
+    skips and what that costs on a fresh one, and its posts/sec."""
+    import prefilter
+
+    with tempfile.TemporaryDirectory() as workdir:
+        model_file = os.path.join(workdir, "prefilter.npz")
+        start = time.perf_counter()
+        report = prefilter.train(labelled_corpus(args.train, seed=args.seed), model_file=model_file,
+                                 target_recall=args.target_recall)
+        print(f"trained on {report['trained_on']} posts in {time.perf_counter() - start:.2f}s")
+        prefilter.print_report(report)
+
+        model = prefilter.Prefilter(model_file, sample_rate=0.0)
+        records = list(labelled_corpus(args.posts, seed=args.seed + 1))
+        start = time.perf_counter()
+        p = np.concatenate([model.scores([r["comment_text"] for r in records[i:i + prefilter.BATCH]])
+                            for i in range(0, len(records), prefilter.BATCH)])
+        elapsed = time.perf_counter() - start
+        _, needs, toxic = prefilter.training_data(records)
+        fresh = prefilter.tradeoff(p, needs, toxic, model.threshold)
+        print(f"fresh corpus: skips {fresh['skip_rate']:.1%} of {fresh['posts']} posts "
+              f"(skip precision {fresh['skip_precision']:.1%}, recall {fresh['recall']:.1%}, "
+              f"toxic lost {fresh['toxic_lost_rate']:.2%})  {len(records) / elapsed:9.0f} posts/s")
+
+
+# ===== REPLY GRAPH =====
+def synthetic_reply_graph(posts, edges_per_post=1.5, posts_per_thread=300, seed=0):
+    """(post ids, thread ids, children, parents): each post quotes earlier
+    posts of its own thread, mostly recent ones, so cascades form."""
+    rng = np.random.default_rng(seed)
+    post_ids = FIRST_POST + np.arange(posts, dtype=np.int64)
+    offsets = np.arange(posts, dtype=np.int64) % posts_per_thread
+    thread_ids = post_ids - offsets
+    quoting = rng.integers(0, posts, int(posts * edges_per_post))
+    back = np.minimum(rng.geometric(0.2, len(quoting)), offsets[quoting])
+    keep = back > 0
+    return post_ids, thread_ids, post_ids[quoting[keep]], post_ids[quoting[keep]] - back[keep]
+
+def bench_graph(args):
+    """Build the reply index and run the graph analyses on millions of edges."""
+    import reply_graph
+
+    post_ids, thread_ids, children, parents = synthetic_reply_graph(args.posts, args.edges_per_post, seed=args.seed)
+    scores = np.random.default_rng(args.seed).random(args.posts).astype(np.float32)
+    scores[::10] = np.nan  # unscored posts
+    timings = {}
+    start = time.perf_counter()
+    graph = reply_graph.ReplyGraph.from_edges(post_ids, thread_ids, children, parents)
+    timings["build"] = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as workdir:
+        start = time.perf_counter()
+        graph.save(os.path.join(workdir, "graph.npz"))
+        graph = reply_graph.ReplyGraph.load(os.path.join(workdir, "graph.npz"))
+        timings["save+load"] = time.perf_counter() - start
+    for name, func in (("cascade_depth", lambda: reply_graph.cascade_depth(graph)),
+                       ("reply_vs_parent", lambda: reply_graph.reply_vs_parent(graph, scores, 0.5)),
+                       ("thread_aggregates", lambda: reply_graph.thread_aggregates(graph, scores, 0.5, depth))):
+        start = time.perf_counter()
+        result = func()
+        timings[name] = time.perf_counter() - start
+        if name == "cascade_depth":
+            depth = result
+    print(f"{graph.num_nodes} posts, {graph.num_edges} reply edges, max cascade depth {depth.max()}, "
+          f"peak rss {peak_rss_mb():.0f}MB")
+    for name, seconds in timings.items():
+        print(f"  {name:<18} {seconds:7.3f}s")
+
+
+# ===== SCORE STORE =====
+def load_frame(scored_file, use_store):
+    """Runs in a spawned child: load the score frame and compute one
+    statistic over it, reporting time and peak RSS."""
+    import logging
+    import analysis
+    logging.disable(logging.INFO)
+    start = time.perf_counter()
+    df = analysis.load_scores(scored_file, use_store=use_store)
+    mean = float(np.nanmean(df["openai_toxicity"].to_numpy()))
+    return {"rows": len(df), "seconds": time.perf_counter() - start, "mean": mean, "peak_rss_mb": peak_rss_mb()}
+
+def bench_store(args):
+    """JSON parse vs the memory-mapped score store, cold (first sync), warm,
+    and after a small append."""
+    import processing
+
+    def corpus(count, seed):
+        return scored_posts(processing.clean_records(synthetic_posts(count, seed=seed), workers=1))
+
+    def load(path, use_store):
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            return pool.submit(load_frame, path, use_store).result()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "scored.jsonl")
+        storage.write_records(path, corpus(args.posts, args.seed))
+        print(f"{args.posts} scored posts, {os.path.getsize(path) / 2**20:.0f}MB of JSONL")
+        runs = [("json parse", False), ("store (first sync)", True), ("store (warm)", True)]
+        results = [(name, load(path, use_store)) for name, use_store in runs]
+        storage.append_records(path, corpus(args.append, args.seed + 1))
+        results.append((f"store (+{args.append} posts)", load(path, True)))
+        for name, result in results:
+            print(f"  {name:<24} {result['rows']:>9} rows {result['seconds']:8.3f}s  "
+                  f"rss={result['peak_rss_mb']:.0f}MB  mean={result['mean']:.4f}")
+
+
+# ===== SYNTHETIC CORPORA =====
+COUNTRIES = [("US", "United States"), ("GB", "United Kingdom"), ("CA", "Canada"), ("DE", "Germany"),
+             ("AU", "Australia"), ("FR", "France"), ("NL", "Netherlands"), ("SE", "Sweden"),
+             ("PL", "Poland"), ("BR", "Brazil"), ("IN", "India"), ("FI", "Finland")]
+COUNTRY_WEIGHTS = [40, 12, 9, 7, 6, 5, 4, 3, 3, 3, 2, 2]
+FIRST_POST = 400000000
+
+def synthetic_posts(count, seed=0, posts_per_thread=50):
+    """Raw posts in the `post_entry` schema written by data_collection.collect_posts."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    for i in range(count):
+        post_id = FIRST_POST + i
+        thread_id = post_id - i % posts_per_thread
+        is_op = post_id == thread_id
+        timestamp = now - (count - i) * 3
+        country, country_name = rng.choices(COUNTRIES, weights=COUNTRY_WEIGHTS)[0]
+        yield {
+            "post_id": post_id,
+            "thread_id": thread_id,
+            "timestamp": timestamp,
+            "datetime_utc": datetime.utcfromtimestamp(timestamp).isoformat(),
+            "comment_html": mock_servers.synthetic_comment(rng, post_id),
+            "metadata": {
+                "name": "Anonymous",
+                "trip": None,
+                "poster_id": f"{rng.getrandbits(32):08x}",
+                "country": country,
+                "country_name": country_name,
+                "subject": f"thread {thread_id}" if is_op else None,
+                "replies": posts_per_thread - 1 if is_op else None,
+                "images": 0 if is_op else None,
+            },
+        }
+
+def scored_posts(posts):
+    """Processed posts with the fields api_integration.enrich_post adds, from the mocks' scores."""
+    attributes = ["TOXICITY", "SEVERE_TOXICITY", "INSULT", "PROFANITY", "THREAT",
+                  "IDENTITY_ATTACK", "SEXUALLY_EXPLICIT", "FLIRTATION", "SPAM", "OBSCENE"]
+    for post in posts:
+        text = post.get("comment_text", "")
+        moderation = mock_servers.mock_moderation_result(text)
+        perspective = mock_servers.mock_perspective_scores(text, attributes)
+        scores = moderation["category_scores"]
+        post["openai_moderation"] = moderation
+        post["openai_toxicity"] = sum(scores[c] for c in ("hate", "harassment", "violence", "sexual", "self-harm"))
+        post["perspective_scores"] = perspective
+        post["persp_toxicity"] = perspective["TOXICITY"]
+        yield post
+
+# ===== STAGE MEASUREMENTS =====
+# Each stage runs in a fresh (spawned) interpreter, so its peak RSS is its
+# own and not a high-water mark left behind by an earlier, bigger stage.
+def peak_rss_mb():
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(self_kb, children_kb) / 1024, 1)
+
+def latency_stats(samples):
+    if not samples:
+        return None
+    p50, p95, p99 = np.percentile(np.asarray(samples) * 1000, [50, 95, 99])
+    return {"count": len(samples), "p50_ms": round(p50, 4), "p95_ms": round(p95, 4),
+            "p99_ms": round(p99, 4), "max_ms": round(max(samples) * 1000, 4)}
+
+def record_latency(func, samples):
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+    return timed
+
+def stage_clean(raw_file):
+    import processing
+    comments = [post.get("comment_html", "") for post in storage.iter_records(raw_file)]
+    samples = []
+    clean = record_latency(processing.clean_comment, samples)
+    start = time.perf_counter()
+    for html in comments:
+        clean(html)
+    return len(comments), time.perf_counter() - start, {"per_post": latency_stats(samples)}
+
+def stage_process(raw_file, processed_file):
+    import processing
+    processing.RAW_FILE, processing.PROCESSED_FILE = raw_file, processed_file
+    start = time.perf_counter()
+    kept = processing.process_posts()
+    return kept, time.perf_counter() - start, {}
+
+def stage_score(processed_file, scored_file, cache_file, openai_url, perspective_url, limit, rate):
+    import api_integration
+    from openai import OpenAI
+    api_integration.INPUT_FILE, api_integration.OUTPUT_FILE = processed_file, scored_file
+    api_integration.CACHE_FILE = cache_file
+    api_integration.client = OpenAI(api_key="mock", base_url=f"{openai_url}/v1", max_retries=0)
+    api_integration.PERSPECTIVE_URL = f"{perspective_url}{mock_servers.PERSPECTIVE_PATH}"
+    api_integration.OPENAI_RATE = api_integration.PERSPECTIVE_RATE = rate
+    api_integration.OPENAI_MAX_RATE = api_integration.PERSPECTIVE_MAX_RATE = rate
+    api_integration.PERSPECTIVE_CONCURRENCY = api_integration.OPENAI_CONCURRENCY
+
+    openai_samples, perspective_samples = [], []
+    api_integration.openai_moderation_request = record_latency(api_integration.openai_moderation_request, openai_samples)
+    api_integration.perspective_request = record_latency(api_integration.perspective_request, perspective_samples)
+    posts = itertools.islice(storage.iter_records(processed_file), limit)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        api_integration.run_api_analysis(use_cache=False, posts=posts)
+    elapsed = time.perf_counter() - start
+    return storage.count_records(scored_file), elapsed, {
+        "openai_request": latency_stats(openai_samples),
+        "perspective_request": latency_stats(perspective_samples),
+    }
+
+def stage_analysis(scored_file, out_dir, bootstrap_replicates):
+    import logging
+    import analysis
+    logging.disable(logging.INFO)
+    start = time.perf_counter()
+    analysis.run_analysis(fast=True, input_file=scored_file, results_dir=out_dir, tables_dir=out_dir,
+                          summary_dir=out_dir, bootstrap_replicates=bootstrap_replicates)
+    return storage.count_records(scored_file), time.perf_counter() - start, {}
+
+STAGE_FUNCS = {
+    "clean_comment": stage_clean,
+    "process_posts": stage_process,
+    "run_api_analysis": stage_score,
+    "analysis": stage_analysis,
+}
+
+def measure(stage, *args):
+    """Runs in a spawned child: time one stage, report its own peak RSS."""
+    items, seconds, extra = STAGE_FUNCS[stage](*args)
+    return {"items": items, "seconds": round(seconds, 4),
+            "items_per_sec": round(items / seconds, 1) if seconds else None,
+            "peak_rss_mb": peak_rss_mb(), **extra}
+
+def run_stage(stage, *args):
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(measure, stage, *args).result()
+
+# ===== SUITE =====
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def print_result(size, stage, result):
+    latency = next((v for v in result.values() if isinstance(v, dict)), None)
+    line = (f"{size:>9} {stage:<18} {result['items']:>9} items {result['seconds']:9.2f}s "
+            f"{result['items_per_sec'] or 0:11.1f}/s  rss={result['peak_rss_mb']:.0f}MB")
+    if latency:
+        line += f"  p50={latency['p50_ms']:.3f}ms p95={latency['p95_ms']:.3f}ms p99={latency['p99_ms']:.3f}ms"
+    print(line)
+
+def bench_suite(args):
+    stages = args.stages
+    servers = []
+    if "run_api_analysis" in stages:
+        openai_server, openai_url = mock_servers.start_openai_mock(latency=args.latency, error_rate=args.error_rate)
+        perspective_server, perspective_url = mock_servers.start_perspective_mock(
+            latency=args.latency, error_rate=args.error_rate)
+        servers = [("openai", openai_server), ("perspective", perspective_server)]
+
+    report = {
+        "commit": git_commit(),
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "python": sys.version.split()[0],
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key != "func"},
+        "results": {},
+    }
+    try:
+        for size in args.sizes:
+            results = report["results"][str(size)] = {}
+            with tempfile.TemporaryDirectory() as workdir:
+                path = lambda name: os.path.join(workdir, name)
+                storage.write_records(path("raw.jsonl"), synthetic_posts(size, seed=args.seed))
+
+                if "clean_comment" in stages:
+                    results["clean_comment"] = run_stage("clean_comment", path("raw.jsonl"))
+                    print_result(size, "clean_comment", results["clean_comment"])
+                if "process_posts" in stages or "run_api_analysis" in stages or "analysis" in stages:
+                    result = run_stage("process_posts", path("raw.jsonl"), path("processed.jsonl"))
+                    if "process_posts" in stages:
+                        results["process_posts"] = result
+                        print_result(size, "process_posts", result)
+                if "run_api_analysis" in stages:
+                    for _, server in servers:
+                        server.requests_served = server.throttled = 0
+                    result = run_stage("run_api_analysis", path("processed.jsonl"), path("scored_api.jsonl"),
+                                       path("cache.sqlite"), openai_url, perspective_url,
+                                       min(size, args.api_posts), args.api_rate)
+                    result["mock"] = {name: {"requests": server.requests_served, "throttled_429": server.throttled}
+                                      for name, server in servers}
+                    results["run_api_analysis"] = result
+                    print_result(size, "run_api_analysis", result)
+                if "analysis" in stages:
+                    processed = storage.iter_records(path("processed.jsonl"))
+                    storage.write_records(path("scored.jsonl"), scored_posts(processed))
+                    os.makedirs(path("analysis"))
+                    results["analysis"] = run_stage("analysis", path("scored.jsonl"), path("analysis"), args.bootstrap)
+                    print_result(size, "analysis", results["analysis"])
+    finally:
+        for _, server in servers:
+            server.shutdown()
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}_{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved benchmark results to {output}")
+
+def bench_compare(args):
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, "r", encoding="utf-8") as f:
+        candidate = json.load(f)
+    print(f"baseline {baseline['commit']}  vs  candidate {candidate['commit']}")
+    for size, stages in candidate["results"].items():
+        for stage, new in stages.items():
+            old = baseline["results"].get(size, {}).get(stage)
+            if not old or not old.get("items_per_sec") or not new.get("items_per_sec"):
+                continue
+            speedup = new["items_per_sec"] / old["items_per_sec"]
+            rss = new["peak_rss_mb"] - old["peak_rss_mb"]
+            line = (f"{size:>9} {stage:<18} {old['items_per_sec']:11.1f}/s -> {new['items_per_sec']:11.1f}/s "
+                    f"({speedup:5.2f}x)  rss {rss:+.0f}MB")
+            for name, latency in new.items():
+                before = old.get(name)
+                if isinstance(latency, dict) and isinstance(before, dict) and "p95_ms" in latency:
+                    line += f"  {name} p95 {before['p95_ms']:.3f} -> {latency['p95_ms']:.3f}ms"
+            print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    fetch = sub.add_parser("fetch", help="Thread fetch throughput against a local 4chan stand-in")
+    fetch.add_argument("--threads", type=int, default=150, help="Threads in the mock catalog")
+    fetch.add_argument("--latency", type=float, default=0.25, help="Simulated response latency (s)")
+    fetch.add_argument("--rate", type=float, default=1 / data_collection.RATE_LIMIT_SECONDS,
+                       help="Global request rate (req/s)")
+    fetch.add_argument("--workers", type=int, default=data_collection.MAX_WORKERS)
+    fetch.set_defaults(func=bench_fetch)
+
+    clean = sub.add_parser("clean", help="HTML cleaning throughput and equivalence with BeautifulSoup")
+    clean.add_argument("--posts", type=int, default=50000)
+    clean.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    clean.add_argument("--seed", type=int, default=0)
+    clean.set_defaults(func=bench_clean)
+
+    moderation = sub.add_parser("moderation", help="Batched vs per-post OpenAI moderation against a local mock")
+    moderation.add_argument("--posts", type=int, default=500)
+    moderation.add_argument("--latency", type=float, default=0.1, help="Simulated response latency (s)")
+    moderation.add_argument("--batch-size", type=int, default=32)
+    moderation.set_defaults(func=bench_moderation)
+
+    ratelimit = sub.add_parser("ratelimit", help="Adaptive rate limiting against a mock that enforces a quota")
+    ratelimit.add_argument("--quota", type=int, default=20, help="Requests/sec the mock accepts")
+    ratelimit.add_argument("--start-rate", type=float, default=5, help="Configured (initial) request rate")
+    ratelimit.add_argument("--max-rate", type=float, default=100, help="Ceiling the adaptive limiter may probe to")
+    ratelimit.add_argument("--concurrency", type=int, default=8)
+    ratelimit.add_argument("--latency", type=float, default=0.02)
+    ratelimit.add_argument("--seconds", type=float, default=20)
+    ratelimit.set_defaults(func=bench_ratelimit)
+
+    triage = sub.add_parser("triage", help="Near-duplicate clustering precision/recall and requests saved")
+    triage.add_argument("--posts", type=int, default=50000)
+    triage.add_argument("--dup-share", type=float, default=0.3, help="Share of posts that are near-duplicates")
+    triage.add_argument("--thresholds", type=float, nargs="+", default=[1.0, 0.9, 0.8])
+    triage.add_argument("--seed", type=int, default=0)
+    triage.set_defaults(func=bench_triage)
+
+    prefilter_cmd = sub.add_parser("prefilter", help="Local pre-filter skip rate, precision traded away and speed")
+    prefilter_cmd.add_argument("--train", type=int, default=20000, help="Labelled posts to train on")
+    prefilter_cmd.add_argument("--posts", type=int, default=50000, help="Fresh posts to evaluate on")
+    prefilter_cmd.add_argument("--target-recall", type=float, default=0.98)
+    prefilter_cmd.add_argument("--seed", type=int, default=0)
+    prefilter_cmd.set_defaults(func=bench_prefilter)
+
+    graph = sub.add_parser("graph", help="Reply index build and graph analyses on synthetic quote edges")
+    graph.add_argument("--posts", type=int, default=2_000_000)
+    graph.add_argument("--edges-per-post", type=float, default=1.5)
+    graph.add_argument("--seed", type=int, default=0)
+    graph.set_defaults(func=bench_graph)
+
+    store = sub.add_parser("store", help="Score frame load: JSON parse vs the memory-mapped score store")
+    store.add_argument("--posts", type=int, default=200000)
+    store.add_argument("--append", type=int, default=1000, help="Posts appended before the last load")
+    store.add_argument("--seed", type=int, default=0)
+    store.set_defaults(func=bench_store)
+
+    suite = sub.add_parser("suite", help="Stage throughput, latency percentiles and peak RSS on synthetic corpora")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000],
+                       help="Corpus sizes in posts (e.g. 1000 100000 1000000)")
+    suite.add_argument("--stages", nargs="+", choices=list(STAGE_FUNCS), default=list(STAGE_FUNCS))
+    suite.add_argument("--latency", type=float, default=0.02, help="Simulated API latency (s)")
+    suite.add_argument("--error-rate", type=float, default=0.01, help="Share of API requests answered with 429")
+    suite.add_argument("--api-posts", type=int, default=2000, help="Posts scored per size (API stage is quota-bound)")
+    suite.add_argument("--api-rate", type=float, default=200, help="Per-provider request rate for the API stage")
+    suite.add_argument("--bootstrap", type=int, default=200, help="Bootstrap replicates in the analysis stage")
+    suite.add_argument("--seed", type=int, default=0)
+    suite.add_argument("--output", help=f"Results JSON (default: {RESULTS_DIR}/<time>_<commit>.json)")
+    suite.set_defaults(func=bench_suite)
+
+    compare = sub.add_parser("compare", help="Compare two suite result files")
+    compare.add_argument("baseline")
+    compare.add_argument("candidate")
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
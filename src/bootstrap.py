@@ -0,0 +1,78 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# ===== BOOTSTRAP RESAMPLING =====
+# Every statistic in the summary is a function of a few sums over posts
+# (sum of x, of x*y, of flags per country, ...). So a replicate never needs
+# its resampled rows, only their sums. A batch of replicates is drawn as a
+# (B, n) matrix of resample counts W: row b says how often each post was
+# drawn. One matrix product W @ X then gives every sum for all B
+# replicates at once. Batches are spread over a process pool. Each batch
+# has its own child of one SeedSequence, so results depend on `seed` but
+# not on the number of workers.
+
+BOOTSTRAP_WORKERS = os.cpu_count() or 1
+BOOTSTRAP_BATCH = 64   # replicates per matrix product (B x n counts in memory)
+
+_columns = None   # worker-side copy of the design matrix, set once per process
+
+def _init_worker(columns):
+    global _columns
+    _columns = columns
+
+def resample_counts(rng, n, replicates):
+    """(replicates, n) matrix: how often each of n rows was drawn, n draws per row."""
+    draws = rng.integers(0, n, size=(replicates, n), dtype=np.int64)
+    draws += (np.arange(replicates, dtype=np.int64) * n)[:, None]
+    return np.bincount(draws.ravel(), minlength=replicates * n).reshape(replicates, n)
+
+def _resample_sums(task):
+    seed, replicates = task
+    rng = np.random.default_rng(seed)
+    counts = resample_counts(rng, len(_columns), replicates)
+    return counts.astype(np.float64) @ _columns
+
+def resampled_sums(columns, replicates, seed=0, workers=BOOTSTRAP_WORKERS, batch=BOOTSTRAP_BATCH):
+    """Column sums of `columns` (n, k) for each of `replicates` bootstrap
+    resamples of its rows: a (replicates, k) array."""
+    columns = np.ascontiguousarray(columns, dtype=np.float64)
+    sizes = [batch] * (replicates // batch) + ([replicates % batch] if replicates % batch else [])
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_worker,
+                                 initargs=(columns,)) as pool:
+            parts = list(pool.map(_resample_sums, tasks))
+    else:
+        _init_worker(columns)
+        parts = [_resample_sums(task) for task in tasks]
+    return np.vstack(parts) if parts else np.empty((0, columns.shape[1]))
+
+def percentile_ci(values, confidence=0.95):
+    """Percentile interval of replicate values along axis 0 (NaN replicates ignored)."""
+    alpha = (1 - confidence) / 2
+    with np.errstate(invalid="ignore"):
+        lo, hi = np.nanpercentile(values, [100 * alpha, 100 * (1 - alpha)], axis=0)
+    return lo, hi
+
+# ===== STATISTICS FROM SUMS =====
+# Inputs are per-replicate sums over the rows where a pair is complete:
+# count, x, y, x^2, y^2, x*y. Columns are centred before summing, which
+# keeps these raw-moment formulas numerically stable.
+def safe_divide(num, den):
+    return np.divide(num, den, out=np.full(np.shape(num), np.nan), where=den > 0)
+
+def pearson_from_sums(n, sx, sy, sxx, syy, sxy):
+    cov = sxy - sx * sy / np.maximum(n, 1)
+    var_x = sxx - sx * sx / np.maximum(n, 1)
+    var_y = syy - sy * sy / np.maximum(n, 1)
+    return safe_divide(cov, np.sqrt(np.clip(var_x, 0, None) * np.clip(var_y, 0, None)))
+
+def cohens_d_from_sums(n, sx, sy, sxx, syy, sxy, shift=0.0):
+    """Paired Cohen's d of x - y: mean(d) / sd(d, ddof=1). `shift` is
+    mean(x) - mean(y) removed by centring, added back to the mean."""
+    sd = sx - sy
+    sdd = sxx - 2 * sxy + syy
+    var = safe_divide(sdd - sd * sd / np.maximum(n, 1), n - 1)
+    return safe_divide(safe_divide(sd, n) + shift, np.sqrt(np.clip(var, 0, None)))
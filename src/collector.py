@@ -0,0 +1,119 @@
+import argparse
+import heapq
+import os
+import signal
+import threading
+import time
+
+import data_collection
+import metrics
+import storage
+
+# ===== CONFIGURATION =====
+BOARDS = os.getenv("FOURCHAN_BOARDS", data_collection.BOARD).split(",")
+MIN_INTERVAL = 30      # seconds between polls of the busiest board
+MAX_INTERVAL = 900     # ...and of the quietest
+TARGET_NEW_POSTS = 150  # aim to find about this many new posts per poll
+CHURN_SMOOTHING = 0.5   # weight of the latest poll in the churn estimate
+METRICS_EVERY = 60      # seconds between metrics snapshots (0 disables)
+METRICS_FILE = os.path.join(data_collection.BASE_DIR, "summary", "collector_metrics.prom")
+
+# ===== SCHEDULER =====
+# Boards share one request budget (data_collection.limiter), so the
+# scheduler decides which board gets it next. Each board's churn (new posts
+# per second, smoothed) sets its poll interval: TARGET_NEW_POSTS / churn,
+# clamped to [MIN_INTERVAL, MAX_INTERVAL]. A busy board is polled before its
+# threads scroll off the catalog, and a quiet one does not spend requests
+# on 304s. A heap of (due time, board) always polls the most overdue board
+# first. Per board, memory is its live-thread state and a fixed-size dedup
+# bitmap (data_collection.RecentPosts). Posts are fsynced to the raw file
+# thread by thread, so memory stays flat however long the daemon runs.
+
+def next_interval(churn):
+    if churn <= 0:
+        return MAX_INTERVAL
+    return min(MAX_INTERVAL, max(MIN_INTERVAL, TARGET_NEW_POSTS / churn))
+
+class BoardPoller:
+    def __init__(self, board):
+        self.board = board
+        self.state = data_collection.load_board_state(board)
+        self.writer = storage.JsonlWriter(data_collection.raw_file(board))
+        self.churn = self.state.get("churn", 0.0)
+        self.last_poll = None
+
+    def poll(self):
+        """One poll; returns the number of new posts and updates the churn estimate."""
+        stats = {}
+        start = time.monotonic()
+        with metrics.timer("board_poll_seconds", board=self.board):
+            for _ in data_collection.poll_board(self.board, self.state, self.writer, stats=stats):
+                pass  # already on disk; nothing is kept in memory
+        if stats["catalog"] != "failed":
+            # The first poll finds the whole backlog at once; treat it as MIN_INTERVAL worth
+            elapsed = start - self.last_poll if self.last_poll is not None else MIN_INTERVAL
+            rate = stats["posts"] / max(elapsed, 1e-6)
+            self.churn = CHURN_SMOOTHING * rate + (1 - CHURN_SMOOTHING) * self.churn
+            self.last_poll = start
+        self.state["churn"] = self.churn
+        data_collection.save_board_state(self.board, self.state)
+
+        metrics.inc("board_polls_total", board=self.board, catalog=stats["catalog"])
+        metrics.inc("board_posts_total", stats["posts"], board=self.board)
+        metrics.set_gauge("board_churn_posts_per_second", round(self.churn, 4), board=self.board)
+        print(f"/{self.board}/ catalog {stats['catalog']}: {stats['changed']} changed threads, "
+              f"{stats['posts']} new posts, churn {self.churn:.2f} posts/s")
+        return stats["posts"]
+
+    def close(self):
+        self.writer.close()
+        data_collection.save_board_state(self.board, self.state)
+
+
+def run_daemon(boards=None, stop=None, max_polls=None):
+    """Poll `boards` until `stop` (a threading.Event) is set, or for
+    `max_polls` polls in total. Returns the number of posts collected."""
+    boards = boards or BOARDS
+    stop = stop or threading.Event()
+    pollers = {board: BoardPoller(board) for board in boards}
+    queue = [(time.monotonic(), i, board) for i, board in enumerate(boards)]
+    heapq.heapify(queue)
+    polls = collected = 0
+    last_metrics = time.monotonic()
+    try:
+        while not stop.is_set() and (max_polls is None or polls < max_polls):
+            due, order, board = heapq.heappop(queue)
+            if stop.wait(max(0.0, due - time.monotonic())):
+                break
+            poller = pollers[board]
+            try:
+                collected += poller.poll()
+            except Exception as e:  # one bad poll must not kill a week-long run
+                print(f"[ERROR] Poll of /{board}/ failed: {e}")
+            polls += 1
+            interval = next_interval(poller.churn)
+            metrics.set_gauge("board_poll_interval_seconds", round(interval, 1), board=board)
+            heapq.heappush(queue, (time.monotonic() + interval, order, board))
+
+            if METRICS_EVERY and time.monotonic() - last_metrics >= METRICS_EVERY:
+                metrics.set_gauge("process_peak_rss_bytes", metrics.peak_rss_bytes())
+                metrics.REGISTRY.save(METRICS_FILE)
+                last_metrics = time.monotonic()
+    finally:
+        for poller in pollers.values():
+            poller.close()
+    return collected
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously collect posts from several boards")
+    parser.add_argument("--boards", nargs="+", default=BOARDS, help="Boards to poll (default: $FOURCHAN_BOARDS or pol)")
+    parser.add_argument("--max-polls", type=int, help="Stop after this many polls (default: run until stopped)")
+    args = parser.parse_args()
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+    total = run_daemon(args.boards, stop=stop, max_polls=args.max_polls)
+    print(f"✅ Collector stopped after {total} new posts")
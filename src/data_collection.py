@@ -1,116 +1,353 @@
 import requests
-import time
+import threading
+import base64
 import json
 import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+
+import metrics
+import storage
+from rate_limiting import AdaptiveTokenBucket
 
 # ===== CONFIGURATION =====
 BOARD = "pol"  # 4chan board to scrape
+API_BASE = os.getenv("FOURCHAN_API_BASE", "https://a.4cdn.org")  # overridable for offline benchmarks
 
 # Base paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-OUTPUT_FILE = os.path.join(DATA_DIR, f"{BOARD}_posts_raw.json")  # raw data file
+def raw_file(board):
+    return os.path.join(DATA_DIR, f"{board}_posts_raw.jsonl")  # raw data file (append-only)
+
+def state_file(board):
+    return os.path.join(DATA_DIR, f"{board}_thread_state.json")  # per-thread polling state
+
+OUTPUT_FILE = raw_file(BOARD)
+STATE_FILE = state_file(BOARD)
 
-RATE_LIMIT_SECONDS = 1
-MAX_POSTS = 10000  # Stop after collecting this many posts
+RATE_LIMIT_SECONDS = 1  # Global budget: one request per second across all workers
+MAX_WORKERS = 4  # Concurrent thread fetches (overlaps latency, not the rate limit)
+REQUEST_TIMEOUT = 10
+MAX_POSTS = 10000  # One-shot runs stop once the board's raw file holds this many posts
+RECENT_WINDOW = 1 << 21  # Post numbers remembered for dedup per board (a 256 KiB ring bitmap)
+
+# ===== HTTP ENGINE =====
+# One bucket shared by every worker so the board-wide request rate is respected,
+# and one keep-alive session per worker thread (requests.Session is not thread-safe).
+# A 429 pauses every worker for Retry-After and lowers the rate below the
+# 1/sec budget until requests succeed again.
+limiter = AdaptiveTokenBucket(rate=1 / RATE_LIMIT_SECONDS)
+_local = threading.local()
+
+def get_session():
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _local.session = session
+    return session
+
+def get_json(url, if_modified_since=None, endpoint="other"):
+    """GET a JSON endpoint. Returns (data, last_modified_header); data is
+    None when the server answers 304 Not Modified."""
+    with metrics.timer("rate_limit_wait_seconds", limiter="4chan"):
+        limiter.acquire()
+    headers = {"If-Modified-Since": if_modified_since} if if_modified_since else None
+    start = time.perf_counter()
+    try:
+        r = get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException:
+        metrics.inc("http_requests_total", endpoint=endpoint, status="error")
+        raise
+    finally:
+        metrics.observe("http_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+    metrics.inc("http_requests_total", endpoint=endpoint, status=r.status_code)
+    if r.status_code == 429:
+        limiter.throttled(r.headers)
+    elif r.ok:
+        limiter.succeeded()
+    if r.status_code == 304:
+        return None, if_modified_since
+    r.raise_for_status()
+    return r.json(), r.headers.get("Last-Modified")
 
 # ===== DUPLICATE TRACKING =====
-seen_posts = set()
-collected_data = []
-
-# ===== LOAD EXISTING DATA (resume capability) =====
-if os.path.exists(OUTPUT_FILE):
-    with open(OUTPUT_FILE, "r", encoding="utf-8") as f:
-        try:
-            collected_data = json.load(f)
-            seen_posts = {post["post_id"] for post in collected_data}
-            print(f"Loaded {len(collected_data)} existing posts from {OUTPUT_FILE}")
-        except json.JSONDecodeError:
-            print("Warning: Could not parse existing JSON file. Starting fresh.")
+# Post numbers only grow on a board, so "seen" only has to be remembered for
+# recent numbers: a ring bitmap over the last RECENT_WINDOW post numbers
+# (bit = post_no % window) costs the same memory after a week as after a
+# minute. Per-thread `last_post` marks in the thread state cover everything
+# older, and threads are forgotten once they fall off the catalog.
+class RecentPosts:
+    def __init__(self, window=RECENT_WINDOW, high=0, bits=None):
+        self.window = window
+        self.high = high  # highest post number added
+        self.bits = bytearray(bits) if bits is not None else bytearray(window // 8)
+
+    def _clear(self, start, stop):
+        """Forget ring slots for post numbers in [start, stop)."""
+        if stop - start >= self.window:
+            self.bits[:] = bytes(len(self.bits))
+            return
+        for post_no in range(start, stop):
+            slot = post_no % self.window
+            self.bits[slot >> 3] &= ~(1 << (slot & 7)) & 0xFF
+
+    def __contains__(self, post_no):
+        if post_no > self.high or post_no <= self.high - self.window:
+            return False
+        slot = post_no % self.window
+        return bool(self.bits[slot >> 3] & (1 << (slot & 7)))
+
+    def add(self, post_no):
+        if post_no > self.high:
+            self._clear(max(self.high + 1, post_no - self.window + 1), post_no + 1)
+            self.high = post_no
+        elif post_no <= self.high - self.window:
+            return  # older than the window: per-thread marks handle it
+        slot = post_no % self.window
+        self.bits[slot >> 3] |= 1 << (slot & 7)
+
+    def to_dict(self):
+        return {"window": self.window, "high": self.high,
+                "bits": base64.b64encode(zlib.compress(bytes(self.bits))).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, data):
+        if not data or data.get("window") != RECENT_WINDOW:
+            return cls()
+        return cls(data["window"], data["high"], zlib.decompress(base64.b64decode(data["bits"])))
+
+# ===== BOARD STATE (incremental polling) =====
+# Per board: catalog Last-Modified, per-thread catalog `last_modified`, reply
+# count, HTTP Last-Modified and highest post number collected (so unchanged
+# threads are never refetched), the dedup bitmap, how many posts the raw
+# file holds and the raw file's size when the state was saved.
+def new_board_state():
+    return {"catalog_last_modified": None, "threads": {}, "recent": RecentPosts(), "collected": 0, "raw_bytes": 0}
+
+CATCH_UP_BATCH = 10000
+
+def catch_up(board, state):
+    """Fold posts appended to the raw file after the state was saved (a crash
+    between the two) back into the dedup state, reading only that tail."""
+    recovered = 0
+    while True:
+        posts, state["raw_bytes"] = storage.read_tail(raw_file(board), state["raw_bytes"], limit=CATCH_UP_BATCH)
+        if not posts:
+            return recovered
+        for post in posts:
+            post_id, thread = post.get("post_id"), state["threads"].get(str(post.get("thread_id")))
+            state["recent"].add(post_id)
+            if thread is not None:
+                thread["last_post"] = max(thread.get("last_post", 0), post_id)
+        state["collected"] += len(posts)
+        recovered += len(posts)
+
+def load_board_state(board):
+    path, state = state_file(board), new_board_state()
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                saved = json.load(f)
+            except json.JSONDecodeError:
+                print(f"Warning: Could not parse thread state file for /{board}/. Polling every thread.")
+                saved = {}
+        state.update(saved)
+        state["recent"] = RecentPosts.from_dict(saved.get("recent"))
+        if "raw_bytes" not in saved:  # state from before the dedup bitmap: index the raw file once
+            state["raw_bytes"] = 0
+    storage.migrate_legacy(raw_file(board))
+    recovered = catch_up(board, state)
+    if recovered:
+        print(f"Loaded {recovered} /{board}/ post ids from {raw_file(board)}")
+    return state
+
+def save_board_state(board, state):
+    path = state_file(board)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({**state, "recent": state["recent"].to_dict()}, f)
+    os.replace(tmp_path, path)
+
+def thread_changed(entry, state):
+    return (state is None
+            or entry.get("last_modified") != state.get("last_modified")
+            or entry.get("replies") != state.get("replies"))
 
 # ===== FETCH CATALOG =====
-def fetch_catalog():
-    url = f"https://a.4cdn.org/{BOARD}/catalog.json"
+def fetch_catalog(if_modified_since=None, board=BOARD):
+    url = f"{API_BASE}/{board}/catalog.json"
     try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        return r.json()
+        return get_json(url, if_modified_since, endpoint="catalog")
     except Exception as e:
-        print(f"[ERROR] Failed to fetch catalog: {e}")
-        return []
+        print(f"[ERROR] Failed to fetch /{board}/ catalog: {e}")
+        return [], None
 
 # ===== FETCH THREAD =====
-def fetch_thread(thread_id):
-    url = f"https://a.4cdn.org/{BOARD}/thread/{thread_id}.json"
+def fetch_thread(thread_id, if_modified_since=None, board=BOARD):
+    url = f"{API_BASE}/{board}/thread/{thread_id}.json"
     try:
-        r = requests.get(url, timeout=10)
-        r.raise_for_status()
-        return r.json()
+        return get_json(url, if_modified_since, endpoint="thread")
     except Exception as e:
         print(f"[ERROR] Failed to fetch thread {thread_id}: {e}")
-        return None
+        return None, None
 
-# ===== MAIN COLLECTION =====
-def collect_posts():
-    total_collected = len(collected_data)
-    catalog = fetch_catalog()
+# ===== CONCURRENT FETCH =====
+def fetch_threads(thread_ids, since=None, max_workers=MAX_WORKERS, board=BOARD):
+    """Yield (thread_id, thread_data, last_modified) in catalog order while up
+    to `max_workers` requests are in flight. `since` maps thread_id to the
+    If-Modified-Since value to send; thread_data is None for 304s and errors.
+    Closing the generator early cancels every fetch that has not started yet."""
+    since = since or {}
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    futures = [(thread_id, executor.submit(fetch_thread, thread_id, since.get(thread_id), board))
+               for thread_id in thread_ids]
+    try:
+        for thread_id, future in futures:
+            yield (thread_id, *future.result())
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
 
-    for page in catalog:
-        for thread in page.get("threads", []):
-            thread_id = thread.get("no")
-            thread_data = fetch_thread(thread_id)
-            time.sleep(RATE_LIMIT_SECONDS)  # Respect rate limit
+def post_entry(post, thread_id):
+    """Structured post entry (raw HTML only)."""
+    return {
+        "post_id": post.get("no"),
+        "thread_id": thread_id,
+        "timestamp": post.get("time"),
+        "datetime_utc": datetime.utcfromtimestamp(post.get("time")).isoformat() if post.get("time") else None,
+        "comment_html": post.get("com", ""),  # raw HTML only
+        "metadata": {
+            "name": post.get("name"),
+            "trip": post.get("trip"),
+            "poster_id": post.get("id"),
+            "country": post.get("country"),
+            "country_name": post.get("country_name"),
+            "subject": post.get("sub"),
+            "replies": post.get("replies"),
+            "images": post.get("images")
+        }
+    }
 
+# ===== POLLING =====
+def poll_board(board, state, writer, limit=None, stats=None):
+    """Poll one board once and yield its new post entries. Each thread's posts
+    are appended to `writer` (and fsynced) as soon as the thread is parsed,
+    so nothing accumulates in memory. Stops after `limit` new posts; counts
+    go into `stats` (catalog status, threads, changed, not modified, failed, posts)."""
+    stats = stats if stats is not None else {}
+    stats.update(catalog="ok", threads=0, changed=0, not_modified=0, failed=0, posts=0)
+    catalog, catalog_last_modified = fetch_catalog(state["catalog_last_modified"], board)
+    if catalog is None:
+        stats["catalog"] = "not_modified"
+        return
+    if not catalog:
+        stats["catalog"] = "failed"
+        return  # keep the previous state untouched
+
+    # Only refetch threads whose catalog entry moved since the last poll;
+    # threads that fell off the catalog are dropped from the state.
+    entries = {thread.get("no"): thread for page in catalog for thread in page.get("threads", [])}
+    known = state["threads"]
+    state["threads"] = known = {key: known[key] for key in map(str, entries) if key in known}
+    changed = [thread_id for thread_id, entry in entries.items() if thread_changed(entry, known.get(str(thread_id)))]
+    since = {thread_id: known[str(thread_id)].get("http_last_modified")
+             for thread_id in changed if str(thread_id) in known}
+    stats.update(threads=len(entries), changed=len(changed))
+
+    recent = state["recent"]
+    threads = fetch_threads(changed, since=since, board=board)
+    try:
+        for thread_id, thread_data, last_modified in threads:
+            thread = known.setdefault(str(thread_id), {"last_post": 0})
             if not thread_data:
+                if last_modified is None:
+                    stats["failed"] += 1
+                    continue
+                # 304: nothing new, so the catalog entry is current; without
+                # this the thread would look changed again on every poll
+                stats["not_modified"] += 1
+                entry = entries[thread_id]
+                thread.update(last_modified=entry.get("last_modified"), replies=entry.get("replies"))
                 continue
 
+            complete = True
             for post in thread_data.get("posts", []):
-                # ✅ Check limit BEFORE adding anything
-                if total_collected >= MAX_POSTS:
-                    print(f"Reached {MAX_POSTS} posts. Stopping collection.")
-                    return
-
                 post_id = post.get("no")
-                if post_id in seen_posts:
-                    continue  # Skip duplicates
-
-                # Build structured post entry (raw HTML only)
-                post_entry = {
-                    "post_id": post_id,
-                    "thread_id": thread_id,
-                    "timestamp": post.get("time"),
-                    "datetime_utc": datetime.utcfromtimestamp(post.get("time")).isoformat() if post.get("time") else None,
-                    "comment_html": post.get("com", ""),  # raw HTML only
-                    "metadata": {
-                        "name": post.get("name"),
-                        "trip": post.get("trip"),
-                        "poster_id": post.get("id"),
-                        "country": post.get("country"),
-                        "country_name": post.get("country_name"),
-                        "subject": post.get("sub"),
-                        "replies": post.get("replies"),
-                        "images": post.get("images")
-                    }
-                }
-
-                collected_data.append(post_entry)
-                seen_posts.add(post_id)
-                total_collected += 1
-
-                if total_collected % 100 == 0:
-                    print(f"Collected {total_collected} posts so far...")
-
-
-# ===== SAVE FUNCTION =====
-def save_data():
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        json.dump(collected_data, f, ensure_ascii=False, indent=2)
-    print(f"✅ Saved {len(collected_data)} raw posts to {OUTPUT_FILE}")
+                if post_id <= thread["last_post"] or post_id in recent:
+                    continue  # Skip posts collected on an earlier poll / duplicates
+                if limit is not None and stats["posts"] >= limit:
+                    complete = False
+                    break
+                entry = post_entry(post, thread_id)
+                writer.write(entry)
+                recent.add(post_id)
+                thread["last_post"] = post_id
+                stats["posts"] += 1
+                yield entry
+
+            # Durable before the state (saved by the caller) can claim it
+            with metrics.timer("checkpoint_seconds", stage="collect"):
+                writer.flush()
+            if not complete:
+                return
+            # Mark the thread up to date only once all of its posts were taken
+            entry = entries[thread_id]
+            thread.update(last_modified=entry.get("last_modified"), replies=entry.get("replies"),
+                          http_last_modified=last_modified)
+
+        # A conditional catalog request is only safe once every changed thread was taken
+        if not stats["failed"]:
+            state["catalog_last_modified"] = catalog_last_modified
+    finally:
+        threads.close()
+        writer.flush()
+        state["collected"] += stats["posts"]
+        state["raw_bytes"] = os.path.getsize(writer.path)
+        metrics.inc("records_total", stats["posts"], stage="collect")
+
+# ===== MAIN COLLECTION =====
+def collect_posts(state):
+    """One poll of BOARD with its `load_board_state` state, stopping once its
+    raw file holds MAX_POSTS posts. Returns the post entries collected by
+    this run so an in-process pipeline can hand them to processing."""
+    limit = max(0, MAX_POSTS - state["collected"])
+    if not limit:
+        print(f"Reached {MAX_POSTS} posts. Nothing to collect.")
+        return []
+    stats = {}
+    with storage.JsonlWriter(OUTPUT_FILE) as writer:
+        new_posts = list(poll_board(BOARD, state, writer, limit=limit, stats=stats))
+    if stats["catalog"] == "not_modified":
+        print("Catalog not modified since last poll. Nothing to collect.")
+    elif stats["catalog"] == "ok":
+        print(f"Catalog: {stats['threads']} threads, {stats['changed']} changed since last poll.")
+        print(f"{stats['not_modified']} threads answered 304 Not Modified.")
+    if len(new_posts) >= limit:
+        print(f"Reached {MAX_POSTS} posts. Stopping collection.")
+    return new_posts
+
+
+# ===== SAVE FUNCTIONS =====
+def save_data(state):
+    save_board_state(BOARD, state)
+    print(f"✅ Saved {state['collected']} raw posts to {OUTPUT_FILE}")
+
+def run_collection():
+    """Load BOARD's polling state, poll once and save the state. The state is
+    only read here, so importing this module touches no files."""
+    state = load_board_state(BOARD)
+    new_posts = collect_posts(state)
+    save_data(state)
+    return new_posts
 
 # ===== RUN ONLY IF EXECUTED DIRECTLY =====
 if __name__ == "__main__":
-    collect_posts()
-    save_data()
+    run_collection()
@@ -0,0 +1,209 @@
+import fcntl
+import json
+import os
+import time
+from array import array
+from contextlib import contextmanager
+
+import metrics
+import storage
+
+# ===== SCORING JOURNAL =====
+# Scored posts first go to a write-ahead journal next to the dataset
+# (`<dataset>.journal`). Records are fsynced in batches, so one fsync covers
+# many posts. A crash can lose at most the records since the last batch, and
+# those are simply rescored. Compaction moves the journal into the dataset:
+#
+#   1. append the journal's new records to the dataset, and their post ids to
+#      `<dataset>.ids` (raw int64), then fsync both;
+#   2. atomically replace `<dataset>.state.json`, which records the dataset's
+#      committed byte size and id count. This is the commit point;
+#   3. empty the journal.
+#
+# Anything past the committed sizes is an interrupted compaction and is
+# truncated away before the next one. Its records are still in the journal,
+# and committed ids are skipped, so nothing is lost or duplicated. Resume
+# reads the int64 id file plus whatever is still in the journal, never the
+# whole JSONL dataset. Every step runs under an exclusive lock file, so any
+# number of scoring processes can share one journal.
+#
+# A record with RESCORED_FIELD set supersedes an earlier record of the same
+# post (e.g. one the pre-filter saved unscored). It is indexed under the
+# negated id, so it is appended exactly once, after the record it replaces.
+
+JOURNAL_SUFFIX = ".journal"
+IDS_SUFFIX = ".ids"
+STATE_SUFFIX = ".state.json"
+LOCK_SUFFIX = ".lock"
+RESCORED_FIELD = "rescored"
+
+FSYNC_EVERY = 100        # records per group commit
+FSYNC_SECONDS = 2.0      # ...or this long since the last one, whichever comes first
+COMPACT_EVERY = 10000    # records journalled by this process between compactions
+
+def fsync_dir(path):
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write_json(path, payload):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(path)
+
+def append_durably(path, data, lines=True):
+    """Append bytes and fsync. In a line file, a torn last line (crash
+    mid-write) is sealed first."""
+    with open(path, "ab") as f:
+        if lines and f.tell() > 0 and not storage.ends_with_newline(path):
+            f.write(b"\n")
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ScoreJournal:
+    """Write-ahead journal in front of an append-only JSONL dataset."""
+
+    def __init__(self, dataset, key="post_id", fsync_every=FSYNC_EVERY, fsync_seconds=FSYNC_SECONDS,
+                 compact_every=COMPACT_EVERY):
+        self.dataset = dataset
+        self.key = key
+        self.journal_path = dataset + JOURNAL_SUFFIX
+        self.ids_path = dataset + IDS_SUFFIX
+        self.state_path = dataset + STATE_SUFFIX
+        self.lock_path = dataset + LOCK_SUFFIX
+        self.fsync_every = fsync_every
+        self.fsync_seconds = fsync_seconds
+        self.compact_every = compact_every
+        self.count = 0            # records written by this process
+        self._pending = []
+        self._since_compaction = 0
+        self._last_sync = time.monotonic()
+
+    @contextmanager
+    def locked(self):
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    # ===== WRITE PATH =====
+    def write(self, record):
+        self._pending.append(storage.dumps(record) + "\n")
+        self.count += 1
+        if len(self._pending) >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_seconds:
+            self.flush()
+
+    def flush(self):
+        """Group commit: one locked append and one fsync for every pending record."""
+        self._last_sync = time.monotonic()
+        if not self._pending:
+            return
+        data = "".join(self._pending).encode("utf-8")
+        with metrics.timer("checkpoint_seconds", stage="score"), self.locked():
+            append_durably(self.journal_path, data)
+        self._since_compaction += len(self._pending)
+        self._pending.clear()
+        if self.compact_every and self._since_compaction >= self.compact_every:
+            self.compact()
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def entry_id(self, record):
+        """Id `record` is indexed and deduplicated under (negated for a rescore)."""
+        post_id = record.get(self.key)
+        if post_id is None:
+            return None
+        return -post_id if record.get(RESCORED_FIELD) else post_id
+
+    # ===== COMMITTED STATE =====
+    def _read_state(self):
+        """Committed (dataset bytes, id count). A dataset from before the
+        journal existed, one replaced behind the journal's back (shorter
+        than committed) or an unreadable state file is indexed once by a
+        full scan."""
+        size = os.path.getsize(self.dataset) if os.path.exists(self.dataset) else 0
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+                if size >= state["dataset_bytes"]:
+                    return state["dataset_bytes"], state["ids"]
+            except (ValueError, KeyError, TypeError):
+                print(f"Warning: Unreadable {self.state_path}; re-indexing {self.dataset}")
+        ids = array("q", (self.entry_id(record) for record in storage.iter_records(self.dataset)
+                          if record.get(self.key) is not None))
+        with open(self.ids_path, "wb") as f:
+            ids.tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        atomic_write_json(self.state_path, {"dataset_bytes": size, "ids": len(ids)})
+        return size, len(ids)
+
+    def _committed_ids(self, count):
+        ids = array("q")
+        if count:
+            with open(self.ids_path, "rb") as f:
+                ids.fromfile(f, count)
+        return ids
+
+    def committed_ids(self):
+        with self.locked():
+            return set(self._committed_ids(self._read_state()[1]))
+
+    def processed_ids(self):
+        """Ids in the dataset or in the journal: committed ids plus the journal
+        tail (rescored posts also appear negated)."""
+        with self.locked():
+            ids = set(self._committed_ids(self._read_state()[1]))
+            ids.update(self.entry_id(record) for record in storage.iter_records(self.journal_path))
+        ids.discard(None)
+        return ids
+
+    # ===== COMPACTION =====
+    def compact(self):
+        """Move journalled records into the dataset (see the protocol above).
+        Returns the number of records added."""
+        with metrics.timer("compaction_seconds"), self.locked():
+            dataset_bytes, id_count = self._read_state()
+            # Roll back whatever an interrupted compaction left past the commit point
+            for path, size in ((self.dataset, dataset_bytes), (self.ids_path, id_count * 8)):
+                if os.path.exists(path) and os.path.getsize(path) > size:
+                    os.truncate(path, size)
+
+            seen = set(self._committed_ids(id_count))
+            lines, ids = [], array("q")
+            for record in storage.iter_records(self.journal_path):
+                post_id = self.entry_id(record)
+                if post_id is None or post_id in seen:
+                    continue  # already compacted, or scored twice by two workers
+                seen.add(post_id)
+                lines.append(storage.dumps(record) + "\n")
+                ids.append(post_id)
+
+            if lines:
+                append_durably(self.dataset, "".join(lines).encode("utf-8"))
+                append_durably(self.ids_path, ids.tobytes(), lines=False)
+                atomic_write_json(self.state_path, {"dataset_bytes": os.path.getsize(self.dataset),
+                                                    "ids": id_count + len(ids)})
+            if os.path.exists(self.journal_path):
+                os.truncate(self.journal_path, 0)
+        self._since_compaction = 0
+        metrics.inc("records_compacted_total", len(lines))
+        return len(lines)
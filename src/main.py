@@ -1,41 +1,168 @@
-import subprocess
-import sys
+import argparse
+import json
 import os
+import sys
+import time
+import traceback
+from datetime import datetime
+
+import metrics
 
 # === PATH SETUP ===
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # project root
 SRC_DIR = os.path.join(BASE_DIR, "src")
 DATA_DIR = os.path.join(BASE_DIR, "data")
+SUMMARY_DIR = os.path.join(BASE_DIR, "summary")
+TIMINGS_FILE = os.path.join(SUMMARY_DIR, "pipeline_timings.json")
+METRICS_FILE = os.path.join(SUMMARY_DIR, "pipeline_metrics.prom")  # .json for JSON export
+PROFILE_DIR = os.path.join(SUMMARY_DIR, "profiles")
 
 # Ensure output directories exist
 for folder in ["results", "tables", "summary"]:
     os.makedirs(os.path.join(BASE_DIR, folder), exist_ok=True)
 
-# Helper to run each stage and stop if it fails
-def run_stage(description, script_name):
-    script_path = os.path.join(SRC_DIR, script_name)
-    print(f"\n=== {description} ===")
-    result = subprocess.run([sys.executable, script_path], cwd=SRC_DIR)
-    if result.returncode != 0:
-        print(f"[ERROR] {description} failed. Stopping pipeline.")
-        sys.exit(1)
+STAGES = ["collect", "process", "score", "analyze"]
+STAGE_TITLES = {
+    "collect": "Data Collection",
+    "process": "Processing",
+    "score": "API Integration",
+    "analyze": "Analysis",
+}
 
-if __name__ == "__main__":
-    # 1. Data Collection
-    run_stage("Data Collection", "data_collection.py")
+# ===== STAGE TIMING =====
+def timed(iterable, timings, stage):
+    """Yield from `iterable`, charging the time spent producing each item to
+    `stage`. Lazy stages run inside their consumer, so this is how their cost
+    is separated from the consumer's."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+        yield item
+
+# ===== STAGES =====
+# Every stage runs in this interpreter and receives the previous stage's
+# records in memory: collected posts go straight into processing, and the
+# processing generator feeds scoring without re-reading pol_posts.jsonl.
+def run_collect(ctx):
+    import data_collection
+    ctx["raw"] = data_collection.run_collection()
+
+def run_process(ctx):
+    import processing
+    if "raw" in ctx:
+        # Only this run's posts: append them to the processed dataset
+        posts = processing.iter_processed_posts(ctx.pop("raw"), output_path=processing.PROCESSED_FILE, append=True)
+    else:
+        posts = processing.iter_processed_posts(output_path=processing.PROCESSED_FILE)
+    posts = timed(posts, ctx["timings"], "process")
+    if "score" in ctx["stages"]:
+        ctx["processed"] = posts  # consumed lazily by the scoring stage
+    else:
+        for _ in posts:
+            pass
+
+def run_score(ctx):
+    import api_integration
+    api_integration.run_api_analysis(posts=ctx.pop("processed", None))
+
+def run_analyze(ctx):
+    import analysis
+    analysis.main([f"--{flag}" for flag in ("fast", "preview", "incremental") if ctx[flag]])
 
-    # 2. Processing
-    run_stage("Processing", "processing.py")
+STAGE_RUNNERS = {
+    "collect": run_collect,
+    "process": run_process,
+    "score": run_score,
+    "analyze": run_analyze,
+}
 
-    # 3. API Integration
-    run_stage("API Integration", "api_integration.py")
+# ===== ORCHESTRATOR =====
+def run_pipeline(stages=None, resume_from=None, fast=False, preview=False, incremental=False, profile=None):
+    """Run the selected stages in order (default: all, or all from `resume_from`).
+    With `profile` ("cpu" or "memory") each stage runs under cProfile or
+    tracemalloc and its hot spots go to PROFILE_DIR. Returns per-stage wall
+    time in seconds."""
+    if resume_from:
+        stages = STAGES[STAGES.index(resume_from):]
+    stages = [stage for stage in STAGES if stage in (stages or STAGES)]
+    ctx = {"stages": stages, "fast": fast, "preview": preview, "incremental": incremental, "timings": {}}
+    timings = ctx["timings"]
 
-    # 4. Analysis
-    run_stage("Analysis", "analysis.py")
+    for stage in stages:
+        print(f"\n=== {STAGE_TITLES[stage]} ===")
+        before = dict(timings)
+        start = time.perf_counter()
+        try:
+            with metrics.profiled(stage, profile, PROFILE_DIR):
+                STAGE_RUNNERS[stage](ctx)
+        except Exception as e:
+            traceback.print_exc()
+            print(f"[ERROR] {STAGE_TITLES[stage]} failed: {e}. Stopping pipeline.")
+            raise
+        elapsed = time.perf_counter() - start
+        # Time spent inside an upstream generator was already charged to that stage
+        charged = sum(seconds - before.get(other, 0.0) for other, seconds in timings.items() if other != stage)
+        timings[stage] = before.get(stage, 0.0) + elapsed - charged
+        metrics.set_gauge("stage_peak_rss_bytes", metrics.peak_rss_bytes(), stage=stage)
+
+    return timings
+
+def save_metrics(timings, path=None):
+    """Add stage wall times and records/sec to the registry and export it."""
+    path = path or METRICS_FILE
+    records = {entry["labels"]["stage"]: entry["value"]
+               for entry in metrics.REGISTRY.to_dict()["counters"].get("records_total", [])}
+    for stage, seconds in timings.items():
+        metrics.set_gauge("stage_seconds", round(seconds, 6), stage=stage)
+        if records.get(stage) and seconds > 0:
+            metrics.set_gauge("records_per_second", round(records[stage] / seconds, 3), stage=stage)
+    metrics.REGISTRY.save(path)
+    print(f"📈 Metrics saved to {path}")
+
+def save_timings(timings):
+    report = {
+        "stages": {stage: round(seconds, 3) for stage, seconds in timings.items()},
+        "total": round(sum(timings.values()), 3),
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+    }
+    with open(TIMINGS_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print("\n⏱️ Stage timings:")
+    for stage, seconds in report["stages"].items():
+        print(f"   - {STAGE_TITLES[stage]:<16} {seconds:9.2f}s")
+    print(f"   Saved to {TIMINGS_FILE}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the 4chan toxicity pipeline in-process")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, help="Run only these stages.")
+    parser.add_argument("--from", dest="resume_from", choices=STAGES,
+                        help="Resume from this stage and run every later one.")
+    parser.add_argument("--fast", action="store_true", help="Pass --fast to the analysis stage.")
+    parser.add_argument("--preview", action="store_true", help="Pass --preview to the analysis stage.")
+    parser.add_argument("--incremental", action="store_true", help="Pass --incremental to the analysis stage.")
+    parser.add_argument("--metrics", default=METRICS_FILE,
+                        help="Metrics export path: Prometheus text (.prom) or JSON (.json).")
+    parser.add_argument("--profile", choices=["cpu", "memory"],
+                        help="Profile each stage with cProfile (cpu) or tracemalloc (memory).")
+    args = parser.parse_args()
+
+    try:
+        timings = run_pipeline(args.stages, args.resume_from, fast=args.fast, preview=args.preview,
+                               incremental=args.incremental, profile=args.profile)
+    except Exception:
+        sys.exit(1)
+    save_timings(timings)
+    save_metrics(timings, args.metrics)
 
     print("\n✅ Pipeline complete! Check outputs in:")
     print(f"   - Data:     {DATA_DIR}")
     print(f"   - Results:  {os.path.join(BASE_DIR, 'results')}")
     print(f"   - Tables:   {os.path.join(BASE_DIR, 'tables')}")
     print(f"   - Summary:  {os.path.join(BASE_DIR, 'summary')}")
-
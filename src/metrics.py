@@ -0,0 +1,256 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# ===== METRICS REGISTRY =====
+# Process-wide counters, gauges and histograms, keyed by metric name plus
+# labels (e.g. endpoint="thread"). Stages record into the module-level
+# REGISTRY. main.py exports it as Prometheus text or JSON. Recording takes
+# one lock and, for histograms, one binary search, so it is cheap enough
+# to call on every HTTP request.
+
+# Upper bounds in seconds: covers sub-ms regex cleaning up to slow retried API calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HELP = {
+    "http_requests_total": "4chan API requests by endpoint and status",
+    "http_request_seconds": "4chan API request latency (excluding rate-limit waits)",
+    "rate_limit_wait_seconds": "Time spent waiting for a rate-limit token",
+    "api_requests_total": "Scoring API calls by provider and outcome",
+    "api_request_seconds": "Scoring API call latency by provider",
+    "api_retries_total": "Scoring API calls retried after an error",
+    "api_connection_errors_total": "Scoring API connection errors (offline waits)",
+    "cache_lookups_total": "Score cache lookups by namespace and result",
+    "prefilter_posts_total": "Posts by local pre-filter decision (scored, skipped, sampled)",
+    "triage_posts_total": "Posts by near-duplicate triage role (representative, member, audited)",
+    "triage_audit_mae": "Mean absolute error of propagated scores against audited members' own scores",
+    "triage_audit_flag_disagreement": "Share of audited members flagged differently from their representative",
+    "records_total": "Records produced by each stage",
+    "reply_graph_edges": "Quote edges in the reply index written by processing",
+    "records_per_second": "Records produced per second of stage wall time",
+    "clean_chunk_seconds": "Time cleaning one chunk of comments (serial or process pool)",
+    "checkpoint_seconds": "Duration of durable appends to the stage outputs",
+    "compaction_seconds": "Time moving the scoring journal into the scored dataset",
+    "records_compacted_total": "Scored records moved from the journal into the dataset",
+    "score_store_sync_seconds": "Time bringing the columnar score store up to date with the dataset",
+    "score_store_rows_total": "Rows appended to the columnar score store",
+    "board_poll_seconds": "Wall time of one collector poll of a board",
+    "board_polls_total": "Collector polls by board and catalog outcome",
+    "board_posts_total": "New posts collected per board",
+    "board_churn_posts_per_second": "Smoothed new-post rate per board (drives its poll interval)",
+    "board_poll_interval_seconds": "Current poll interval per board",
+    "process_peak_rss_bytes": "Peak resident set size of the process",
+    "stage_seconds": "Wall time of each pipeline stage",
+    "stage_peak_rss_bytes": "Peak resident set size of the process after each stage",
+    "plot_render_seconds": "Wall time rendering the plots that changed",
+    "plots_total": "Plots rendered or skipped as unchanged",
+    "analysis_section_seconds": "Wall time of each analysis section",
+}
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus layout) with count and sum."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.bounds = tuple(buckets)
+        self.counts = [0] * (len(self.bounds) + 1)  # last slot: above every bound (+Inf)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate by linear interpolation inside the bucket holding rank q*count."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.bounds[i - 1] if i > 0 else 0.0
+                if i == len(self.bounds):
+                    return lo  # only known to be above the largest bound
+                return lo + (self.bounds[i] - lo) * (rank - seen) / n
+            seen += n
+        return self.bounds[-1]
+
+    def to_dict(self):
+        cumulative, buckets = 0, {}
+        for bound, n in zip(self.bounds + ("+Inf",), self.counts):
+            cumulative += n
+            buckets[str(bound)] = cumulative
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            **{f"p{int(q * 100)}": self.quantile(q) for q in (0.5, 0.95, 0.99)},
+            "buckets": buckets,
+        }
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observe the duration of the block (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    # ===== EXPORT =====
+    def to_dict(self):
+        def group(items, convert):
+            out = {}
+            for (name, labels), value in sorted(items):
+                out.setdefault(name, []).append({"labels": dict(labels), "value": convert(value)})
+            return out
+
+        with self._lock:
+            return {
+                "counters": group(self.counters.items(), lambda v: v),
+                "gauges": group(self.gauges.items(), lambda v: v),
+                "histograms": group(self.histograms.items(), lambda h: h.to_dict()),
+            }
+
+    def to_prometheus(self):
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            escaped = (v.replace("\\", "\\\\").replace('"', '\\"') for _, v in pairs)
+            return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+        lines, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in HELP:
+                    lines.append(f"# HELP {name} {HELP[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                header(name, "counter")
+                lines.append(f"{name}{fmt(labels)} {value}")
+            for (name, labels), value in sorted(self.gauges.items()):
+                header(name, "gauge")
+                lines.append(f"{name}{fmt(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                header(name, "histogram")
+                cumulative = 0
+                for bound, n in zip(histogram.bounds + ("+Inf",), histogram.counts):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', str(bound))])} {cumulative}")
+                lines.append(f"{name}_sum{fmt(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{fmt(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """Write Prometheus text (`.prom`/`.txt`) or JSON (anything else), atomically."""
+        text = (self.to_prometheus() if path.endswith((".prom", ".txt"))
+                else json.dumps(self.to_dict(), indent=2))
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+
+def peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # ru_maxrss is KiB on Linux
+
+# ===== PROFILING =====
+PROFILE_TOP = 25  # hot spots listed per profiled stage
+
+def _cpu_report(profiler, top):
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top)
+    return out.getvalue()
+
+def _memory_report(label, top):
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Traced memory: current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB",
+             f"Top {top} allocation sites still live at the end of {label}:"]
+    lines += [str(stat) for stat in snapshot.statistics("lineno")[:top]]
+    return "\n".join(lines) + "\n"
+
+@contextmanager
+def profiled(label, mode, out_dir, top=PROFILE_TOP):
+    """Run the block under cProfile ("cpu") or tracemalloc ("memory") and
+    write the top hot spots to `out_dir/<label>_<mode>.txt`, also when the
+    block fails. cProfile also leaves a `.prof` file for pstats/snakeviz."""
+    if not mode:
+        yield
+        return
+    if mode not in ("cpu", "memory"):
+        raise ValueError(f"unknown profile mode {mode!r} (expected 'cpu' or 'memory')")
+    os.makedirs(out_dir, exist_ok=True)
+    profiler = cProfile.Profile() if mode == "cpu" else None
+    if profiler:
+        profiler.enable()
+    else:
+        tracemalloc.start(10)
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(out_dir, f"{label}.prof"))
+            report = _cpu_report(profiler, top)
+        else:
+            report = _memory_report(label, top)
+            tracemalloc.stop()
+        path = os.path.join(out_dir, f"{label}_{mode}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(report)
+        print(f"🔬 Profile of {label} ({mode}) saved to {path}")
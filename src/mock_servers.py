@@ -0,0 +1,273 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ===== LOCAL API STAND-INS =====
+# Offline replacements for the remote endpoints the pipeline talks to, so
+# throughput can be benchmarked without touching the real services.
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real CDN
+
+    def log_message(self, format, *args):
+        pass  # silence per-request logging
+
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_conditional_json(self, payload, last_modified):
+        """Honour If-Modified-Since against a unix `last_modified` like the 4chan CDN."""
+        since = self.headers.get("If-Modified-Since")
+        if since and parsedate_to_datetime(since).timestamp() >= last_modified:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_json(payload, headers={"Last-Modified": formatdate(last_modified, usegmt=True)})
+
+    def simulate_latency(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+    def maybe_throttle(self):
+        """Answer 429 when the request is over `quota` (requests per second,
+        counted in fixed one-second windows) or, independently, for an
+        `error_rate` share of requests. Quota 429s carry the headers OpenAI
+        sends: Retry-After, retry-after-ms and x-ratelimit-*."""
+        server = self.server
+        if not server.error_rate and not server.quota:
+            return False
+        with server.lock:
+            headers = None
+            if server.quota:
+                now = time.monotonic()
+                if now - server.window_start >= 1.0:
+                    server.window_start, server.window_count = now, 0
+                reset = server.window_start + 1.0 - now
+                if server.window_count < server.quota:
+                    server.window_count += 1
+                else:
+                    headers = {
+                        "Retry-After": str(max(1, round(reset))),
+                        "retry-after-ms": str(int(reset * 1000)),
+                        "x-ratelimit-limit-requests": str(server.quota),
+                        "x-ratelimit-remaining-requests": "0",
+                        "x-ratelimit-reset-requests": f"{int(reset * 1000)}ms",
+                    }
+            if headers is None and server.error_rate and server.rng.random() < server.error_rate:
+                headers = {"Retry-After": str(server.retry_after)}
+            server.throttled += headers is not None
+        if headers is not None:
+            self.send_json({"error": {"message": "rate limit exceeded", "code": 429}}, status=429, headers=headers)
+        return headers is not None
+
+
+# ===== 4CHAN READ-ONLY API =====
+CATALOG_RE = re.compile(r"^/(\w+)/catalog\.json$")
+THREAD_RE = re.compile(r"^/(\w+)/thread/(\d+)\.json$")
+
+WORDS = ("based", "anon", "the", "economy", "is", "glowie", "thread", "kek", "source", "lmao",
+         "they", "will", "never", "tell", "you", "this", "election", "bread", "cope", "seethe")
+
+def synthetic_comment(rng, post_no):
+    """A `com` field in 4chan's markup: quotelinks, greentext, <br>, <wbr>,
+    entities, spoilers, dead links and the occasional unexpected tag."""
+    def words(n):
+        return " ".join(rng.choice(WORDS) for _ in range(n))
+    parts = []
+    for _ in range(rng.randint(1, 5)):
+        kind = rng.random()
+        if kind < 0.25:
+            target = post_no - rng.randint(1, 500)
+            parts.append(f'<a href="#p{target}" class="quotelink">&gt;&gt;{target}</a>')
+        elif kind < 0.4:
+            parts.append(f'<span class="quote">&gt;{words(rng.randint(2, 8))}</span>')
+        elif kind < 0.45:
+            parts.append(f'<span class="deadlink">&gt;&gt;{post_no - rng.randint(1, 5000)}</span>')
+        elif kind < 0.5:
+            parts.append(f"https://example.com/some/long<wbr>/path?id={rng.randint(0, 10**6)}")
+        elif kind < 0.55:
+            parts.append(f"<s>{words(3)}</s>")
+        elif kind < 0.6:
+            parts.append(f"it&#039;s {words(2)} &amp; {words(2)} &quot;{words(1)}&quot;")
+        elif kind < 0.62:
+            parts.append(f'<pre class="prettyprint">{words(4)}</pre>')
+        elif kind < 0.63:
+            parts.append(f'<font color="red">{words(2)}</font>')  # not in the fast-path set
+        else:
+            parts.append(words(rng.randint(1, 30)))
+    return "<br>".join(parts)
+
+def make_board(num_threads=150, posts_per_thread=50, seed=0):
+    """Build a synthetic board: {thread_id: [post, ...]} in 4chan's JSON shape."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    threads = {}
+    post_no = 100000000
+    for _ in range(num_threads):
+        thread_id = post_no
+        posts = []
+        for i in range(posts_per_thread):
+            posts.append({
+                "no": post_no,
+                "time": now - rng.randint(0, 86400),
+                "name": "Anonymous",
+                "id": f"{rng.getrandbits(32):08x}",
+                "country": rng.choice(["US", "GB", "CA", "DE", "AU"]),
+                "com": synthetic_comment(rng, post_no),
+                **({"sub": f"thread {thread_id}", "replies": posts_per_thread - 1, "images": 0} if i == 0 else {}),
+            })
+            post_no += 1
+        threads[thread_id] = posts
+    return threads
+
+
+class FourChanHandler(MockHandler):
+    def do_GET(self):
+        self.simulate_latency()
+        if self.maybe_throttle():
+            return
+        board = self.server.board
+        match = CATALOG_RE.match(self.path)
+        if match:
+            threads = [
+                {"no": thread_id, "replies": len(posts) - 1, "last_modified": max(p["time"] for p in posts)}
+                for thread_id, posts in board.items()
+            ]
+            catalog = [{"page": 1, "threads": threads}]
+            return self.send_conditional_json(catalog, max(t["last_modified"] for t in threads))
+        match = THREAD_RE.match(self.path)
+        if match and int(match.group(2)) in board:
+            posts = board[int(match.group(2))]
+            return self.send_conditional_json({"posts": posts}, max(p["time"] for p in posts))
+        self.send_json({"error": "not found"}, status=404)
+
+
+# ===== OPENAI MODERATION API =====
+OPENAI_CATEGORIES = [
+    "sexual", "sexual/minors", "hate", "hate/threatening", "violence",
+    "violence/graphic", "harassment", "harassment/threatening",
+    "self-harm", "self-harm/intent", "self-harm/instructions",
+]
+REJECT_MARKER = "MOCK_REJECT"  # an input containing this makes the whole request fail with 400
+
+def mock_scores(text, names):
+    """Deterministic pseudo-scores in [0, 1) derived from the text, so a
+    benchmark can check every result was mapped back to the right post."""
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return {name: digest[i % len(digest)] / 256 for i, name in enumerate(names)}
+
+def mock_moderation_result(text):
+    scores = mock_scores(text, OPENAI_CATEGORIES)
+    categories = {name: score >= 0.5 for name, score in scores.items()}
+    return {"flagged": any(categories.values()), "categories": categories, "category_scores": scores}
+
+
+class OpenAIHandler(MockHandler):
+    def do_POST(self):
+        self.simulate_latency()
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.rstrip("/") != "/v1/moderations":
+            return self.send_json({"error": {"message": "not found"}}, status=404)
+        inputs = payload.get("input", [])
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        if self.maybe_throttle():
+            return
+        self.server.requests_served += 1
+        if self.server.max_inputs and len(inputs) > self.server.max_inputs:
+            return self.send_json({"error": {"message": "request too large", "type": "invalid_request_error"}},
+                                  status=413)
+        if any(REJECT_MARKER in text for text in inputs):
+            return self.send_json({"error": {"message": "invalid input", "type": "invalid_request_error"}},
+                                  status=400)
+        self.send_json({
+            "id": f"modr-{self.server.requests_served}",
+            "model": payload.get("model", "text-moderation-latest"),
+            "results": [mock_moderation_result(text) for text in inputs],
+        })
+
+
+# ===== PERSPECTIVE API =====
+PERSPECTIVE_PATH = "/v1alpha1/comments:analyze"
+
+def mock_perspective_scores(text, attributes):
+    return mock_scores("perspective:" + text, attributes)
+
+class PerspectiveHandler(MockHandler):
+    def do_POST(self):
+        self.simulate_latency()
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path.split("?")[0] != PERSPECTIVE_PATH:
+            return self.send_json({"error": {"message": "not found"}}, status=404)
+        if self.maybe_throttle():
+            return
+        self.server.requests_served += 1
+        text = payload.get("comment", {}).get("text", "")
+        scores = mock_perspective_scores(text, list(payload.get("requestedAttributes", {})))
+        self.send_json({
+            "attributeScores": {
+                attr: {"summaryScore": {"value": value, "type": "PROBABILITY"}} for attr, value in scores.items()
+            },
+            "languages": payload.get("languages", ["en"]),
+        })
+
+
+# ===== SERVER LIFECYCLE =====
+def start_server(handler, port=0, latency=0.0, error_rate=0.0, retry_after=1, seed=0, quota=None, **state):
+    """Start `handler` on localhost in a daemon thread. Returns (server, base_url).
+    `error_rate` of requests get a 429 with `Retry-After: retry_after`; with
+    `quota`, requests beyond `quota` per second get a 429 as well."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.retry_after = retry_after
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.throttled = 0
+    server.quota = quota
+    server.window_start, server.window_count = time.monotonic(), 0
+    for key, value in state.items():
+        setattr(server, key, value)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def start_4chan_mock(num_threads=150, posts_per_thread=50, latency=0.0, port=0, error_rate=0.0):
+    return start_server(FourChanHandler, port=port, latency=latency, error_rate=error_rate,
+                        board=make_board(num_threads, posts_per_thread))
+
+def start_openai_mock(latency=0.0, port=0, error_rate=0.0, quota=None, max_inputs=None):
+    """Point the SDK at it with OpenAI(base_url=f"{url}/v1"). Requests with more
+    than `max_inputs` inputs get a 413."""
+    return start_server(OpenAIHandler, port=port, latency=latency, error_rate=error_rate, quota=quota,
+                        requests_served=0, max_inputs=max_inputs)
+
+def start_perspective_mock(latency=0.0, port=0, error_rate=0.0, quota=None):
+    """Point api_integration at it with PERSPECTIVE_URL=f"{url}{PERSPECTIVE_PATH}"."""
+    return start_server(PerspectiveHandler, port=port, latency=latency, error_rate=error_rate, quota=quota,
+                        requests_served=0)
+
+
+if __name__ == "__main__":
+    servers = [("4chan", *start_4chan_mock(latency=0.2, port=8404)),
+               ("OpenAI", *start_openai_mock(latency=0.3, port=8405)),
+               ("Perspective", *start_perspective_mock(latency=0.3, port=8406))]
+    for name, _, url in servers:
+        print(f"Mock {name} API serving on {url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for _, server, _ in servers:
+            server.shutdown()
@@ -0,0 +1,326 @@
+import json
+import math
+import os
+
+import numpy as np
+
+import time_series
+
+# ===== MERGEABLE SUFFICIENT STATISTICS =====
+# Everything the analysis summary reports can be rebuilt from a handful of
+# counters that merge in O(1): moments/co-moments for Pearson, the paired
+# t-test and Cohen's d, a 2x2 contingency table for chi-square and
+# precision/recall, per-group counters for the OP and country breakdowns,
+# and a binned rank sketch for Spearman. A newly scored batch is folded in
+# without touching the rows already counted.
+
+THRESHOLD = 0.5
+SKETCH_BINS = 512
+SKETCH_FLOOR = 1e-6   # smallest bin edge above 0; bins are log-spaced from here
+
+
+class PairedMoments:
+    """Running means, sums of squares and co-moment of (x, y) and of d = x - y,
+    merged with Chan et al.'s parallel update. Only complete pairs count."""
+
+    FIELDS = ("n", "mean_x", "mean_y", "m2_x", "m2_y", "c_xy", "mean_d", "m2_d")
+
+    def __init__(self):
+        self.n = 0
+        self.mean_x = self.mean_y = self.mean_d = 0.0
+        self.m2_x = self.m2_y = self.c_xy = self.m2_d = 0.0
+
+    def update(self, x, y):
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        keep = ~(np.isnan(x) | np.isnan(y))
+        x, y = x[keep], y[keep]
+        if len(x) == 0:
+            return
+        batch = PairedMoments()
+        batch.n = len(x)
+        batch.mean_x, batch.mean_y = x.mean(), y.mean()
+        dx, dy = x - batch.mean_x, y - batch.mean_y
+        d = x - y
+        batch.mean_d = d.mean()
+        batch.m2_x, batch.m2_y, batch.c_xy = dx @ dx, dy @ dy, dx @ dy
+        batch.m2_d = ((d - batch.mean_d) ** 2).sum()
+        self.merge(batch)
+
+    def merge(self, other):
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        dx, dy, dd = other.mean_x - self.mean_x, other.mean_y - self.mean_y, other.mean_d - self.mean_d
+        w = self.n * other.n / n
+        self.m2_x += other.m2_x + dx * dx * w
+        self.m2_y += other.m2_y + dy * dy * w
+        self.c_xy += other.c_xy + dx * dy * w
+        self.m2_d += other.m2_d + dd * dd * w
+        self.mean_x += dx * other.n / n
+        self.mean_y += dy * other.n / n
+        self.mean_d += dd * other.n / n
+        self.n = n
+
+    def pearson(self):
+        """(r, two-sided p) as scipy.stats.pearsonr reports them."""
+        from scipy.stats import t as t_dist
+        if self.n < 2 or self.m2_x == 0 or self.m2_y == 0:
+            return float("nan"), float("nan")
+        r = max(-1.0, min(1.0, self.c_xy / math.sqrt(self.m2_x * self.m2_y)))
+        return r, correlation_p(r, self.n, t_dist)
+
+    def t_test(self):
+        """Paired t-test of x against y: (t, two-sided p)."""
+        from scipy.stats import t as t_dist
+        if self.n < 2:
+            return float("nan"), float("nan")
+        sd = math.sqrt(self.m2_d / (self.n - 1))
+        t_stat = self.mean_d / (sd / math.sqrt(self.n)) if sd else float("nan")
+        return t_stat, float(2 * t_dist.sf(abs(t_stat), self.n - 1))
+
+    def cohens_d(self):
+        if self.n < 2 or self.m2_d == 0:
+            return float("nan")
+        return self.mean_d / math.sqrt(self.m2_d / (self.n - 1))
+
+    def to_dict(self):
+        return {field: float(getattr(self, field)) for field in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, state):
+        moments = cls()
+        for field in cls.FIELDS:
+            setattr(moments, field, state[field])
+        moments.n = int(moments.n)
+        return moments
+
+
+def correlation_p(r, n, t_dist):
+    """Two-sided p of a correlation coefficient via the t distribution (n - 2 dof)."""
+    if n < 3:
+        return float("nan")
+    if abs(r) >= 1:
+        return 0.0
+    t_stat = r * math.sqrt((n - 2) / ((1 - r) * (1 + r)))
+    return float(2 * t_dist.sf(abs(t_stat), n - 2))
+
+
+def sketch_edges(hi, bins=SKETCH_BINS, floor=SKETCH_FLOOR):
+    """Bin edges over [0, hi]: one bin for [0, floor), then log-spaced up to
+    `hi`. Moderation scores pile up near 0, which is where resolution is needed."""
+    return np.concatenate([[0.0], np.geomspace(floor, hi, bins)])
+
+
+class RankSketch:
+    """Approximate Spearman correlation from a joint histogram of (x, y).
+
+    Every value is replaced by the midrank of its bin. A point whose
+    marginal bin holds c values is then off its exact (mid)rank by at most
+    (c - 1) / 2, so the whole rank vector moves by at most
+    delta = sqrt(sum_b c_b * ((c_b - 1) / 2) ** 2) in L2. Spearman is the
+    cosine of the angle between the centred rank vectors, and moving a
+    vector of norm N by delta turns it by at most asin(delta / N), so
+
+        |rho - rho_sketch| <= asin(delta_x / N_x) + asin(delta_y / N_y)
+
+    with N the norm of the centred sketch ranks. `spearman()` reports this
+    bound next to the estimate. It is computed from the actual bin counts,
+    so it stays honest for skewed data. Values outside [0, hi] are clipped
+    into the end bins. The bound still holds for them. It is a worst case
+    (every bin's points in adversarial order). On real score distributions
+    the observed error is usually orders of magnitude smaller.
+    """
+
+    def __init__(self, hi_x=1.0, hi_y=1.0, bins=SKETCH_BINS):
+        self.edges_x = sketch_edges(hi_x, bins)
+        self.edges_y = sketch_edges(hi_y, bins)
+        self.counts = np.zeros((bins, bins), dtype=np.int64)
+
+    def _bin(self, values, edges):
+        return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+    def update(self, x, y):
+        x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+        keep = ~(np.isnan(x) | np.isnan(y))
+        bins = self.counts.shape[0]
+        flat = self._bin(x[keep], self.edges_x) * bins + self._bin(y[keep], self.edges_y)
+        self.counts += np.bincount(flat, minlength=bins * bins).reshape(bins, bins)
+
+    def merge(self, other):
+        self.counts += other.counts
+
+    @staticmethod
+    def _midranks(marginal):
+        ends = np.cumsum(marginal)
+        return ends - (marginal - 1) / 2.0
+
+    def spearman(self):
+        """(rho, two-sided p, error bound) for the pairs counted so far."""
+        from scipy.stats import t as t_dist
+        n = int(self.counts.sum())
+        if n < 2:
+            return float("nan"), float("nan"), float("nan")
+        cx = self.counts.sum(axis=1).astype(np.float64)
+        cy = self.counts.sum(axis=0).astype(np.float64)
+        mean_rank = (n + 1) / 2.0
+        rx, ry = self._midranks(cx) - mean_rank, self._midranks(cy) - mean_rank
+        norm_x, norm_y = math.sqrt(cx @ (rx * rx)), math.sqrt(cy @ (ry * ry))
+        if norm_x == 0 or norm_y == 0:
+            return float("nan"), float("nan"), float("nan")
+        rho = float(rx @ self.counts @ ry) / (norm_x * norm_y)
+        rho = max(-1.0, min(1.0, rho))
+
+        delta_x = math.sqrt(cx @ ((cx - 1) / 2.0) ** 2)
+        delta_y = math.sqrt(cy @ ((cy - 1) / 2.0) ** 2)
+        bound = math.asin(min(1.0, delta_x / norm_x)) + math.asin(min(1.0, delta_y / norm_y))
+        return rho, correlation_p(rho, n, t_dist), min(2.0, bound)
+
+
+class Contingency:
+    """2x2 counts of (openai_flag, persp_flag); NaN scores count as not flagged."""
+
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.counts = np.zeros((2, 2), dtype=np.int64)
+
+    def flags(self, x, y):
+        with np.errstate(invalid="ignore"):
+            return np.asarray(x) >= self.threshold, np.asarray(y) >= self.threshold
+
+    def update(self, x, y):
+        openai_flag, persp_flag = self.flags(x, y)
+        self.counts += np.bincount(openai_flag * 2 + persp_flag, minlength=4).reshape(2, 2)
+
+    def merge(self, other):
+        self.counts += other.counts
+
+
+class GroupRates:
+    """Per-group post and disagreement counts, e.g. OP vs reply or by country."""
+
+    def __init__(self):
+        self.totals = {}
+
+    def update(self, codes, labels, disagreement):
+        """`codes` index into `labels`; -1 means no group (e.g. unknown country)."""
+        codes = np.asarray(codes)
+        present = codes >= 0
+        posts = np.bincount(codes[present], minlength=len(labels))
+        disagreements = np.bincount(codes[present], weights=np.asarray(disagreement)[present], minlength=len(labels))
+        for group, n, k in zip(labels, posts, disagreements):
+            if n == 0:
+                continue
+            entry = self.totals.setdefault(group, [0, 0])
+            entry[0] += int(n)
+            entry[1] += int(k)
+
+    def merge(self, other):
+        for group, (n, k) in other.totals.items():
+            entry = self.totals.setdefault(group, [0, 0])
+            entry[0] += n
+            entry[1] += k
+
+    def rates(self, min_posts=1):
+        """Disagreement % per group with at least `min_posts` posts."""
+        return {group: k / n * 100 for group, (n, k) in self.totals.items() if n >= min_posts}
+
+
+# ===== SUMMARY STATE =====
+class SummaryState:
+    """All sufficient statistics behind analysis_summary.json, plus the byte
+    offset of the scored JSONL they cover, so the next update reads only the
+    records appended since."""
+
+    def __init__(self, category_mapping=(), hi_x=5.0, hi_y=1.0, threshold=THRESHOLD):
+        self.offset = 0
+        self.head = ""
+        self.moments = PairedMoments()
+        self.sketch = RankSketch(hi_x, hi_y)
+        self.contingency = Contingency(threshold)
+        self.by_op = GroupRates()
+        self.by_country = GroupRates()
+        self.categories = {pair: (PairedMoments(), RankSketch()) for pair in category_mapping}
+        self.time_series = time_series.TimeSeries(threshold=threshold)
+
+    @property
+    def n(self):
+        return self.contingency.counts.sum()
+
+    def update(self, df):
+        """Fold in a score frame (analysis.score_frame) of new posts."""
+        x, y = df["openai_toxicity"].to_numpy(), df["persp_toxicity"].to_numpy()
+        self.moments.update(x, y)
+        self.sketch.update(x, y)
+        self.contingency.update(x, y)
+        openai_flag, persp_flag = self.contingency.flags(x, y)
+        disagreement = openai_flag != persp_flag
+        is_op = df["thread_id"].to_numpy() == df["post_id"].to_numpy()
+        self.by_op.update(is_op.astype(np.int64), [False, True], disagreement)
+        country = df["country"].cat
+        self.by_country.update(country.codes.to_numpy(), list(country.categories), disagreement)
+        for (openai_col, persp_col), (moments, sketch) in self.categories.items():
+            if openai_col in df.columns and persp_col in df.columns:
+                moments.update(df[openai_col].to_numpy(), df[persp_col].to_numpy())
+                sketch.update(df[openai_col].to_numpy(), df[persp_col].to_numpy())
+        self.time_series.update(df)  # only the windows these posts fall into
+
+    def merge(self, other):
+        """Fold in the statistics of another state, e.g. one built from a
+        different slice of the data. Offsets are per file and not merged."""
+        self.moments.merge(other.moments)
+        self.sketch.merge(other.sketch)
+        self.contingency.merge(other.contingency)
+        self.by_op.merge(other.by_op)
+        self.by_country.merge(other.by_country)
+        for pair, (moments, sketch) in other.categories.items():
+            own_moments, own_sketch = self.categories.setdefault(pair, (PairedMoments(), RankSketch()))
+            own_moments.merge(moments)
+            own_sketch.merge(sketch)
+        self.time_series.merge(other.time_series)
+
+    # --- persistence ---
+    def save(self, path):
+        meta = {
+            "offset": self.offset,
+            "head": self.head,
+            "threshold": self.contingency.threshold,
+            "moments": self.moments.to_dict(),
+            "by_op": [[bool(k), v] for k, v in self.by_op.totals.items()],
+            "by_country": [[k, v] for k, v in self.by_country.totals.items()],
+            "categories": [[list(pair), moments.to_dict()] for pair, (moments, _) in self.categories.items()],
+        }
+        meta["time_series"], series_arrays = self.time_series.to_state()
+        arrays = {
+            "sketch_counts": self.sketch.counts,
+            "sketch_edges_x": self.sketch.edges_x,
+            "sketch_edges_y": self.sketch.edges_y,
+            "contingency": self.contingency.counts,
+        }
+        for i, (_, sketch) in enumerate(self.categories.values()):
+            arrays[f"category_sketch_{i}"] = sketch.counts
+        arrays.update(series_arrays)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez_compressed(f, meta=np.array(json.dumps(meta)), **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            state = cls(threshold=meta["threshold"])
+            state.offset, state.head = meta["offset"], meta["head"]
+            state.moments = PairedMoments.from_dict(meta["moments"])
+            state.sketch.counts = data["sketch_counts"]
+            state.sketch.edges_x, state.sketch.edges_y = data["sketch_edges_x"], data["sketch_edges_y"]
+            state.contingency.counts = data["contingency"]
+            state.by_op.totals = {k: v for k, v in meta["by_op"]}
+            state.by_country.totals = {k: v for k, v in meta["by_country"]}
+            for i, (pair, moments) in enumerate(meta["categories"]):
+                sketch = RankSketch()
+                sketch.counts = data[f"category_sketch_{i}"]
+                state.categories[tuple(pair)] = (PairedMoments.from_dict(moments), sketch)
+            # None for state files written before the time series existed
+            state.time_series = time_series.TimeSeries.from_state(meta["time_series"], data) \
+                if "time_series" in meta else None
+        return state
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# ===== PLOT JOBS =====
+# A plot is described by a job: {"kind", "file", "data", "params"}. Jobs are
+# plain data, so they can be hashed (an unchanged plot is not re-rendered)
+# and shipped to worker processes, which import matplotlib with the Agg
+# backend themselves. Rendering ~25 figures at dpi=300 is CPU-bound, so a
+# process pool is what actually parallelises it.
+
+PLOT_WORKERS = os.cpu_count() or 1
+MANIFEST_FILE = ".plot_manifest.json"   # file name -> digest of what was last rendered
+
+FULL_DPI = 300
+PREVIEW_DPI = 72
+PREVIEW_BINS = 50
+
+def plot_params(preview=False):
+    """Rendering parameters. Preview mode: low DPI, fixed-bin histograms, no KDE."""
+    if preview:
+        return {"dpi": PREVIEW_DPI, "kde": False, "bins": PREVIEW_BINS, "binned": True}
+    return {"dpi": FULL_DPI, "kde": True, "bins": "auto", "binned": False}
+
+def binned(values, bins=PREVIEW_BINS):
+    """Histogram counts over [0, 1]; preview jobs ship these instead of raw scores."""
+    counts, edges = np.histogram(values, bins=bins, range=(0.0, 1.0))
+    return {"counts": counts, "edges": edges}
+
+# ===== CACHING =====
+def _update_digest(digest, value):
+    if isinstance(value, dict):
+        for key in sorted(value):
+            digest.update(str(key).encode("utf-8"))
+            _update_digest(digest, value[key])
+    elif isinstance(value, np.ndarray):
+        digest.update(str(value.dtype).encode("utf-8"))
+        digest.update(str(value.shape).encode("utf-8"))
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif hasattr(value, "to_numpy"):  # pandas Series/DataFrame: values plus labels
+        digest.update(repr(getattr(value, "columns", None)).encode("utf-8"))
+        digest.update(repr(list(value.index)).encode("utf-8"))
+        _update_digest(digest, value.to_numpy())
+    else:
+        digest.update(json.dumps(value, sort_keys=True, default=str).encode("utf-8"))
+
+def job_digest(job):
+    digest = hashlib.sha256()
+    _update_digest(digest, {"kind": job["kind"], "data": job["data"], "params": job["params"]})
+    return digest.hexdigest()
+
+def load_manifest(results_dir):
+    path = os.path.join(results_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, OSError):
+        return {}
+
+def save_manifest(results_dir, manifest):
+    path = os.path.join(results_dir, MANIFEST_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+# ===== RENDERERS =====
+def _histogram(plt, sns, data, params, color, label=None, alpha=None):
+    if "counts" in data:
+        plt.stairs(data["counts"], data["edges"], fill=True, color=color,
+                   edgecolor="black", label=label, alpha=alpha)
+    else:
+        sns.histplot(data["values"], kde=params["kde"] and len(data["values"]) >= 2, bins=params["bins"],
+                     color=color, edgecolor="black", label=label, alpha=alpha)
+
+def plot_distribution(plt, sns, job):
+    data, params = job["data"], job["params"]
+    plt.figure(figsize=(6, 4))
+    _histogram(plt, sns, data, params, color="#4C72B0")
+    plt.axvline(data["mean"], color="red", linestyle="--", linewidth=1.2,
+                label=f"Mean: {data['mean']:.2f}")
+    plt.axvline(data["median"], color="green", linestyle=":",
+                linewidth=1.2, label=f"Median: {data['median']:.2f}")
+    plt.title(f"{data['column'].replace('_', ' ').title()} Distribution", fontsize=14, weight="bold")
+    plt.xlabel("Score")
+    plt.ylabel("Frequency")
+    plt.legend()
+
+def plot_combined(plt, sns, job):
+    data, params = job["data"], job["params"]
+    plt.figure(figsize=(6, 4))
+    _histogram(plt, sns, data["openai"], params, color="#4C72B0", label="OpenAI", alpha=0.5)
+    _histogram(plt, sns, data["perspective"], params, color="#E24A33", label="Perspective", alpha=0.5)
+    plt.axvline(data["openai"]["mean"], color="#4C72B0", linestyle="--", linewidth=1.2,
+                label=f"OpenAI Mean: {data['openai']['mean']:.2f}")
+    plt.axvline(data["perspective"]["mean"], color="#E24A33", linestyle="--", linewidth=1.2,
+                label=f"Perspective Mean: {data['perspective']['mean']:.2f}")
+    plt.title("Toxicity Score Distributions", fontsize=14, weight="bold")
+    plt.xlabel("Score")
+    plt.ylabel("Frequency")
+    plt.legend()
+
+def plot_correlation_heatmap(plt, sns, job):
+    plt.figure(figsize=(5, 4))
+    sns.heatmap(job["data"]["corr"], annot=True, cmap="coolwarm", vmin=-1, vmax=1)
+    plt.title("Correlation between OpenAI and Perspective Toxicity Scores")
+
+def plot_agreement_matrix(plt, sns, job):
+    plt.figure(figsize=(4, 3))
+    sns.heatmap(job["data"]["conf_matrix"], annot=True, fmt="d", cmap="Blues", cbar=False)
+    plt.title("Agreement/Disagreement Matrix")
+
+def plot_scatter(plt, sns, job):
+    plt.figure(figsize=(7, 7))
+    sns.scatterplot(
+        x=job["data"]["openai"],
+        y=job["data"]["perspective"],
+        alpha=0.4,
+        s=20,
+        edgecolor=None
+    )
+    plt.xlabel("OpenAI Toxicity Score")
+    plt.ylabel("Perspective Toxicity Score")
+    plt.title("OpenAI vs Perspective Toxicity Scores", fontsize=14, weight="bold")
+    plt.xlim(0, 1)
+    plt.ylim(0, 1)
+
+def plot_threshold_sweep(plt, sns, job):
+    data = job["data"]
+    fig, axes = plt.subplots(1, 3, figsize=(15, 4.5))
+    ax = axes[0]
+    for metric, color in (("agreement", "#4C72B0"), ("kappa", "#E24A33"), ("f1", "#55A868")):
+        ax.plot(data["thresholds"], data[metric], color=color, label=metric.replace("f1", "F1 (toxic)").title())
+    ax.axvline(data["reference_threshold"], color="gray", linestyle=":", linewidth=1.2)
+    ax.set_xlabel("Threshold (both providers)")
+    ax.set_ylabel("Score")
+    ax.set_title("Agreement vs Threshold", fontsize=14, weight="bold")
+    ax.legend()
+
+    ax = axes[1]
+    ax.plot(data["roc"]["fpr"], data["roc"]["tpr"], color="#4C72B0", label=f"AUC = {data['roc_auc']:.3f}")
+    ax.plot([0, 1], [0, 1], color="gray", linestyle="--", linewidth=1)
+    ax.set_xlabel("False Positive Rate")
+    ax.set_ylabel("True Positive Rate")
+    ax.set_title("ROC: OpenAI vs Perspective", fontsize=14, weight="bold")
+    ax.legend(loc="lower right")
+
+    ax = axes[2]
+    ax.plot(data["pr"]["recall"], data["pr"]["precision"], color="#E24A33",
+            label=f"AP = {data['average_precision']:.3f}")
+    ax.set_xlabel("Recall")
+    ax.set_ylabel("Precision")
+    ax.set_xlim(0, 1)
+    ax.set_ylim(0, 1.02)
+    ax.set_title("Precision-Recall", fontsize=14, weight="bold")
+    ax.legend(loc="lower left")
+    fig.suptitle(f"Perspective >= {data['reference_threshold']} as reference", fontsize=10)
+
+PLOTTERS = {
+    "distribution": plot_distribution,
+    "combined": plot_combined,
+    "correlation_heatmap": plot_correlation_heatmap,
+    "agreement_matrix": plot_agreement_matrix,
+    "scatter": plot_scatter,
+    "threshold_sweep": plot_threshold_sweep,
+}
+
+SEABORN_KINDS = ("correlation_heatmap", "agreement_matrix", "scatter")
+
+def render_job(job):
+    """Render one job to its file. Runs in a worker process."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    sns = None
+    if job["kind"] in SEABORN_KINDS or (job["kind"] in ("distribution", "combined") and not job["params"]["binned"]):
+        import seaborn as sns
+        sns.set_theme(style="whitegrid")
+
+    PLOTTERS[job["kind"]](plt, sns, job)
+    plt.tight_layout()
+    plt.savefig(job["file"], dpi=job["params"]["dpi"], **job.get("savefig", {}))
+    plt.close()
+    return os.path.basename(job["file"])
+
+def render_jobs(jobs, results_dir, workers=PLOT_WORKERS, force=False):
+    """Render the jobs whose digest changed since the last run (or whose file
+    is gone), in a process pool. Returns (rendered, skipped) file names."""
+    manifest = {} if force else load_manifest(results_dir)
+    todo, skipped = [], []
+    for job in jobs:
+        name = os.path.basename(job["file"])
+        job["digest"] = job_digest(job)
+        if manifest.get(name) == job["digest"] and os.path.exists(job["file"]):
+            skipped.append(name)
+        else:
+            todo.append(job)
+
+    rendered = []
+    try:
+        if workers > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+                for job, name in zip(todo, pool.map(render_job, todo)):
+                    manifest[name] = job["digest"]
+                    rendered.append(name)
+        else:
+            for job in todo:
+                name = render_job(job)
+                manifest[name] = job["digest"]
+                rendered.append(name)
+    finally:
+        # Record whatever did render, so a failed run doesn't redo it
+        save_manifest(results_dir, manifest)
+    return rendered, skipped
@@ -0,0 +1,182 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+import storage
+
+# ===== LOCAL PRE-FILTER =====
+# Most /pol/ posts are greentext, links and short replies that both
+# providers score near zero. A linear model over hashed character n-grams,
+# trained on our own scored dataset, estimates P(a post needs scoring):
+# OpenAI or Perspective toxicity >= BENIGN_SCORE. Posts below the model's
+# threshold skip the APIs. A SAMPLE_RATE share of them is scored anyway, so
+# every run measures how many non-benign posts the skip really costs.
+#
+# The threshold is chosen on a held-out split. It is the highest one that
+# still sends TARGET_RECALL of the non-benign held-out posts to the APIs.
+# The held-out skip rate, skip precision (share of skipped posts that really
+# were benign) and toxic posts lost are saved with the model and printed.
+# Hashing keeps the model a fixed-size weight vector, and inference is one
+# sparse matrix product per batch, so no vocabulary is stored.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+TRAIN_FILE = os.path.join(DATA_DIR, "pol_posts_with_scores.jsonl")
+MODEL_FILE = os.path.join(DATA_DIR, "prefilter.npz")
+
+BENIGN_SCORE = 0.1     # both providers below this: the post did not need scoring
+TOXIC_SCORE = 0.5      # reported separately: toxic posts the filter would have skipped
+TARGET_RECALL = 0.98   # share of non-benign held-out posts that must still be sent
+SAMPLE_RATE = 0.05     # share of skippable posts scored anyway (live precision check)
+HOLDOUT = 0.2
+N_FEATURES = 2 ** 20
+NGRAMS = (2, 4)
+BATCH = 2048           # posts per vectorized prediction
+SEED = 0
+
+def vectorizer(n_features=N_FEATURES, ngrams=NGRAMS):
+    from sklearn.feature_extraction.text import HashingVectorizer
+    return HashingVectorizer(analyzer="char_wb", ngram_range=tuple(ngrams), n_features=n_features,
+                             alternate_sign=False, lowercase=True)
+
+def label(record):
+    """True if the providers scored the post as not benign, None if unscored."""
+    openai_score, persp_score = record.get("openai_toxicity"), record.get("persp_toxicity")
+    if openai_score is None or persp_score is None:
+        return None
+    return max(openai_score, persp_score) >= BENIGN_SCORE
+
+def skipped(record):
+    """True for a record saved unscored because the pre-filter skipped it,
+    unless it was scored since (`api_integration.py --rescore-prefiltered`)."""
+    if record.get("rescored"):
+        return False
+    prefilter = record.get("prefilter")
+    return bool(record.get("prefiltered") or (isinstance(prefilter, dict) and prefilter.get("skipped")))
+
+def training_data(records):
+    texts, needs, toxic = [], [], []
+    for record in records:
+        needs_scoring = label(record)
+        if needs_scoring is None:
+            continue  # failed, or skipped by an earlier pre-filter run
+        texts.append(record.get("comment_text", ""))
+        needs.append(needs_scoring)
+        toxic.append(max(record["openai_toxicity"], record["persp_toxicity"]) >= TOXIC_SCORE)
+    return texts, np.array(needs, dtype=bool), np.array(toxic, dtype=bool)
+
+def choose_threshold(p, needs, target_recall=TARGET_RECALL):
+    """Highest threshold t with recall(p >= t on needs-scoring posts) >= target."""
+    positives = np.sort(p[needs])
+    if not len(positives):
+        return 0.0
+    # Skipping the lowest floor((1 - target) * positives) of them keeps the recall
+    allowed = int(np.floor((1 - target_recall) * len(positives)))
+    return float(positives[allowed])
+
+def tradeoff(p, needs, toxic, threshold):
+    """What skipping p < threshold costs on labelled posts."""
+    skip = p < threshold
+    skipped = int(skip.sum())
+    return {
+        "posts": int(len(p)),
+        "skip_rate": round(float(skip.mean()), 4) if len(p) else 0.0,
+        "skip_precision": round(float((~needs[skip]).mean()), 4) if skipped else 1.0,
+        "recall": round(float((~skip[needs]).mean()), 4) if needs.any() else 1.0,
+        "toxic_lost": int((skip & toxic).sum()),
+        "toxic_lost_rate": round(float(skip[toxic].mean()), 4) if toxic.any() else 0.0,
+    }
+
+def train(records=None, model_file=None, target_recall=TARGET_RECALL, seed=SEED):
+    """Fit the pre-filter on scored records (default: TRAIN_FILE), save it
+    to `model_file` and return the held-out report."""
+    from sklearn.linear_model import LogisticRegression
+
+    model_file = model_file or MODEL_FILE
+    if records is None:
+        storage.migrate_legacy(TRAIN_FILE)
+        records = storage.iter_records(TRAIN_FILE)
+    texts, needs, toxic = training_data(records)
+    if len(texts) < 10 or needs.all() or not needs.any():
+        raise ValueError(f"need scored posts of both classes to train, got {len(texts)} ({int(needs.sum())} non-benign)")
+
+    order = np.random.default_rng(seed).permutation(len(texts))
+    cut = int(len(texts) * (1 - HOLDOUT))
+    train_idx, test_idx = order[:cut], order[cut:]
+    hashing = vectorizer()
+    X = hashing.transform(texts)
+    model = LogisticRegression(solver="liblinear", class_weight="balanced", max_iter=1000)
+    model.fit(X[train_idx], needs[train_idx])
+
+    p = model.predict_proba(X[test_idx])[:, 1]
+    threshold = choose_threshold(p, needs[test_idx], target_recall)
+    report = {"trained_on": len(train_idx), "threshold": threshold, "target_recall": target_recall,
+              "benign_score": BENIGN_SCORE, "holdout": tradeoff(p, needs[test_idx], toxic[test_idx], threshold)}
+
+    tmp_path = model_file + ".tmp.npz"
+    np.savez(tmp_path, coef=model.coef_[0].astype(np.float32), intercept=model.intercept_[0],
+             n_features=N_FEATURES, ngrams=np.array(NGRAMS), report=json.dumps(report))
+    os.replace(tmp_path, model_file)
+    return report
+
+
+class Prefilter:
+    """A trained pre-filter: `scores(texts)` and the skip decision per post."""
+
+    def __init__(self, model_file=None, threshold=None, sample_rate=SAMPLE_RATE, seed=SEED):
+        with np.load(model_file or MODEL_FILE) as saved:
+            self.coef = saved["coef"]
+            self.intercept = float(saved["intercept"])
+            self.report = json.loads(str(saved["report"]))
+            self.hashing = vectorizer(int(saved["n_features"]), saved["ngrams"].tolist())
+        self.threshold = self.report["threshold"] if threshold is None else threshold
+        self.sample_rate = sample_rate
+        self.rng = np.random.default_rng(seed)
+        self.posts = self.skipped = self.sampled = 0
+
+    def scores(self, texts):
+        """P(needs scoring) for each text, one sparse product for the batch."""
+        logits = self.hashing.transform(texts) @ self.coef + self.intercept
+        return 1.0 / (1.0 + np.exp(-logits))
+
+    def annotate(self, posts):
+        """Set post["prefilter"] = {score, skipped[, sampled]} on a batch of posts."""
+        p = self.scores([post.get("comment_text", "") for post in posts])
+        below = p < self.threshold
+        sampled = below & (self.rng.random(len(posts)) < self.sample_rate)
+        for post, score, skip, sample in zip(posts, p, below & ~sampled, sampled):
+            post["prefilter"] = {"score": round(float(score), 4), "skipped": bool(skip)}
+            if sample:
+                post["prefilter"]["sampled"] = True
+        self.posts += len(posts)
+        self.skipped += int((below & ~sampled).sum())
+        self.sampled += int(sampled.sum())
+        return posts
+
+    def stats(self):
+        return {"posts": self.posts, "skipped": self.skipped, "sampled": self.sampled,
+                "threshold": self.threshold}
+
+
+def print_report(report):
+    holdout = report["holdout"]
+    print(f"Pre-filter threshold {report['threshold']:.4f} (trained on {report['trained_on']} posts; "
+          f"keeps {holdout['recall']:.1%} of non-benign held-out posts)")
+    print(f"  held-out: skips {holdout['skip_rate']:.1%} of {holdout['posts']} posts, "
+          f"{holdout['skip_precision']:.1%} of them benign; "
+          f"{holdout['toxic_lost']} toxic posts (>= {TOXIC_SCORE}) skipped ({holdout['toxic_lost_rate']:.2%})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train or inspect the local toxicity pre-filter")
+    parser.add_argument("command", choices=["train", "report"])
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL,
+                        help="Share of non-benign posts that must still be scored by the APIs")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        print_report(train(target_recall=args.target_recall))
+        print(f"✅ Saved pre-filter to {MODEL_FILE}")
+    else:
+        print_report(Prefilter().report)
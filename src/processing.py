@@ -1,48 +1,202 @@
-import json
 import os
+import re
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup
 import html as htmllib
 
+import metrics
+import reply_graph
+import storage
+
 # ===== PATHS =====
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
 os.makedirs(DATA_DIR, exist_ok=True)
 
-RAW_FILE = os.path.join(DATA_DIR, "pol_posts_raw.json")
-PROCESSED_FILE = os.path.join(DATA_DIR, "pol_posts.json")
+RAW_FILE = os.path.join(DATA_DIR, "pol_posts_raw.jsonl")
+PROCESSED_FILE = os.path.join(DATA_DIR, "pol_posts.jsonl")
+
+# ===== PARALLELISM =====
+CLEAN_WORKERS = os.cpu_count() or 1
+CLEAN_CHUNK_SIZE = 20000      # posts cleaned per pool round-trip (bounds memory)
+PARALLEL_MIN_POSTS = 5000     # below this, process start-up costs more than it saves
 
 # ===== CLEANING FUNCTION =====
-def clean_comment(html_text: str) -> str:
+# 4chan only emits a handful of tags (<br>, <wbr>, quote/deadlink <span>s,
+# quotelink <a>s, spoiler <s>, ...). Those are stripped with one regex;
+# anything else (including unusual entities, where html.parser has its own
+# quirks) falls back to BeautifulSoup. Output is identical: a tag boundary
+# becomes a separator and whitespace is collapsed either way, and entities
+# are decoded twice to mirror the parser's pass plus unescape(). Attribute
+# values may not contain quotes or "<>": `<a href='x>y'>` is left unmatched,
+# so the comment falls back to the parser, which reads the attribute right.
+# Numeric entities only take the fast path for printable characters: the
+# parser treats control characters, surrogates and noncharacters its own way.
+KNOWN_TAG_RE = re.compile(
+    r"""</?(?:br|wbr|span|a|s|b|i|u|strong|em|pre|code)"""
+    r"""(?:\s+[\w:-]+(?:\s*=\s*(?:"[^"'<>]*"|'[^"'<>]*'|[^\s"'<>=`]+))?)*\s*/?>""",
+    re.IGNORECASE,
+)
+KNOWN_ENTITY_RE = re.compile(r"&(?:amp|lt|gt|quot|apos|nbsp);")
+NUMERIC_ENTITY_RE = re.compile(r"&#(?:([0-9]{1,7})|[xX]([0-9a-fA-F]{1,6}));")
+
+def _printable_entity(match):
+    """Drop a numeric entity the fast path decodes like the parser; keep the rest."""
+    code = int(match[1]) if match[1] else int(match[2], 16)
+    if code < 0x110000 and (chr(code).isprintable() or chr(code) in "\t\n\r"):
+        return ""
+    return match[0]
+
+def _unknown_entities(text):
+    rest = KNOWN_ENTITY_RE.sub("", text)
+    if "&#" in rest:
+        rest = NUMERIC_ENTITY_RE.sub(_printable_entity, rest)
+    return "&" in rest
+
+def clean_comment_bs4(html_text: str) -> str:
     if not html_text:
         return ""
     text = BeautifulSoup(html_text, "html.parser").get_text(separator=" ")
     text = htmllib.unescape(text)
     return " ".join(text.split())
 
-# ===== MAIN PROCESSING =====
-def process_posts():
-    if not os.path.exists(RAW_FILE):
-        print(f"[ERROR] Raw file {RAW_FILE} not found.")
-        return
+def clean_comment(html_text: str) -> str:
+    if not html_text:
+        return ""
+    stripped = KNOWN_TAG_RE.sub(" ", html_text)
+    if "<" in stripped or ("&" in stripped and _unknown_entities(stripped)):
+        return clean_comment_bs4(html_text)  # unknown markup
+    text = htmllib.unescape(htmllib.unescape(stripped))
+    return " ".join(text.split())
 
-    with open(RAW_FILE, "r", encoding="utf-8") as f:
-        posts = json.load(f)
+def _clean_map(pool, texts, workers):
+    if pool is None:
+        return map(clean_comment, texts)
+    return pool.map(clean_comment, texts, chunksize=max(1, len(texts) // (workers * 4)))
 
-    # Clean comment text
+def clean_records(posts, workers=CLEAN_WORKERS, chunk_size=CLEAN_CHUNK_SIZE):
+    """Yield posts with `comment_text` set. Posts are cleaned `chunk_size` at a
+    time (bounded memory); full chunks go through one shared process pool."""
+    pool = None
+    try:
+        for chunk in _chunks(posts, chunk_size):
+            if pool is None and workers > 1 and len(chunk) >= PARALLEL_MIN_POSTS:
+                pool = ProcessPoolExecutor(max_workers=workers)
+            active = pool if len(chunk) >= PARALLEL_MIN_POSTS else None
+            with metrics.timer("clean_chunk_seconds", parallel=active is not None):
+                texts = list(_clean_map(active, _html_of(chunk), workers))
+            yield from _attach_text(chunk, texts)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+def clean_comments(html_texts, workers=CLEAN_WORKERS):
+    """Clean a list of comments, spread over a process pool when it is large."""
+    posts = clean_records(({"comment_html": text} for text in html_texts), workers, max(1, len(html_texts)))
+    return [post["comment_text"] for post in posts]
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _html_of(chunk):
+    return [post.get("comment_html", "") or "" for post in chunk]
+
+def _attach_text(chunk, texts):
+    for post, text in zip(chunk, texts):
+        post["comment_text"] = text
+        post["quotes"] = reply_graph.quotelinks(post.get("comment_html"))  # lost with the markup otherwise
+        yield post
+
+# ===== PIPELINE STAGES =====
+# parse -> clean -> filter -> serialize, each a generator over post dicts, so
+# only one cleaning chunk is ever in memory and the output can be chained
+# straight into scoring (api_integration.run_api_analysis(posts=...)).
+MIN_COMMENT_LENGTH = 10
+
+def parse_records(path=None):
+    path = path or RAW_FILE
+    storage.migrate_legacy(path)
+    return storage.iter_records(path)
+
+def filter_records(posts, min_length=MIN_COMMENT_LENGTH, counts=None):
+    """Drop short/empty comments; tallies seen/kept posts into `counts`."""
+    counts = counts if counts is not None else {}
+    counts.setdefault("seen", 0)
+    counts.setdefault("kept", 0)
     for post in posts:
-        post["comment_text"] = clean_comment(post.get("comment_html", ""))
+        counts["seen"] += 1
+        if len(post["comment_text"]) > min_length:
+            counts["kept"] += 1
+            yield post
 
-    # Filter out short/empty comments
-    before = len(posts)
-    posts = [post for post in posts if len(post["comment_text"]) > 10]
-    after = len(posts)
-    print(f"Filtered out {before - after} short/empty comments. {after} posts retained.")
+def serialize_records(posts, path=None, append=False):
+    """Pass posts through while writing them to `path` (default PROCESSED_FILE).
+    The file is replaced only once the stream is exhausted, never with a
+    partial run; with `append` the posts are added to the existing file."""
+    path = path or PROCESSED_FILE
+    if append:
+        with storage.JsonlWriter(path) as writer:
+            for post in posts:
+                writer.write(post)
+                yield post
+            with metrics.timer("checkpoint_seconds", stage="process"):
+                writer.flush()
+        metrics.inc("records_total", writer.count, stage="process")
+        return
+    tmp_path = path + ".tmp"
+    with storage.JsonlWriter(tmp_path, mode="w") as writer:
+        for post in posts:
+            writer.write(post)
+            yield post
+        with metrics.timer("checkpoint_seconds", stage="process"):
+            writer.flush()
+    os.replace(tmp_path, path)
+    metrics.inc("records_total", writer.count, stage="process")
+
+def index_replies(posts, path, append=False):
+    """Pass posts through while collecting their quote edges; the reply
+    index (see reply_graph.py) is saved to `path` once the stream is
+    exhausted. With `append` the existing index is extended."""
+    existing = reply_graph.ReplyGraph.load(path) if append and os.path.exists(path) else None
+    builder = reply_graph.ReplyGraphBuilder(existing)
+    for post in posts:
+        builder.add(post)
+        yield post
+    with metrics.timer("checkpoint_seconds", stage="reply_graph"):
+        graph = builder.build()
+        graph.save(path)
+    metrics.set_gauge("reply_graph_edges", graph.num_edges)
 
-    # Save processed data
-    with open(PROCESSED_FILE, "w", encoding="utf-8") as f:
-        json.dump(posts, f, ensure_ascii=False, indent=2)
+def iter_processed_posts(records=None, counts=None, output_path=None, append=False):
+    """Compose the stages over `records` (default: the raw file). With
+    `output_path` the processed posts are also written there on the way,
+    and the reply index of every cleaned post (short ones included, so
+    cascades stay connected) next to them."""
+    posts = clean_records(records if records is not None else parse_records())
+    if output_path:
+        posts = index_replies(posts, reply_graph.graph_path(output_path), append=append)
+    posts = filter_records(posts, counts=counts)
+    return serialize_records(posts, output_path, append=append) if output_path else posts
+
+# ===== MAIN PROCESSING =====
+def process_posts(records=None):
+    if records is None and not os.path.exists(RAW_FILE) and not os.path.exists(storage.legacy_path(RAW_FILE)):
+        print(f"[ERROR] Raw file {RAW_FILE} not found.")
+        return 0
 
-    print(f"✅ Processed {after} posts and saved to {PROCESSED_FILE}")
+    counts = {}
+    for _ in iter_processed_posts(records, counts=counts, output_path=PROCESSED_FILE):
+        pass
+    print(f"Filtered out {counts['seen'] - counts['kept']} short/empty comments. {counts['kept']} posts retained.")
+    print(f"✅ Processed {counts['kept']} posts and saved to {PROCESSED_FILE}")
+    return counts["kept"]
 
 # ===== RUN ONLY IF EXECUTED DIRECTLY =====
 if __name__ == "__main__":
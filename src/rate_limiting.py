@@ -0,0 +1,171 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# ===== TOKEN BUCKET =====
+class TokenBucket:
+    """Thread-safe token bucket shared by every worker that talks to one host.
+
+    `rate` tokens are added per second up to `capacity`; `acquire` blocks
+    until a token is available, so N workers together never exceed `rate`
+    requests/sec while still overlapping their network latency.
+    """
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take tokens without blocking. Returns 0 on success, else seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens=1):
+        """asyncio flavour of `acquire`: waits without blocking the event loop."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+# ===== RETRY / BACKOFF =====
+class RetryPolicy:
+    """Exponential backoff with jitter: base * 2**attempt + U(0, 1), capped."""
+
+    def __init__(self, retries=3, base_delay=1.0, max_delay=30.0):
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt):
+        return min(self.max_delay, self.base_delay * (2 ** attempt) + random.random())
+
+
+# ===== ADAPTIVE RATE (AIMD) =====
+# A provider's real quota is rarely the configured rate: Perspective projects
+# get raised quotas, OpenAI limits depend on the account tier. The adaptive
+# bucket probes upward (additive increase, `increase` req/s per second of
+# successful traffic) and backs off by a factor on every 429 (multiplicative
+# decrease). It also stops sending entirely until the server's Retry-After
+# (or rate-limit reset) has passed. So the sending rate settles just under
+# the quota, whatever it is.
+
+THROTTLE_STATUS = 429
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_duration(value):
+    """OpenAI reset durations: "1s", "6m0s", "20ms", "1h2m3.5s"; None if unparseable."""
+    parts = DURATION_RE.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+def retry_after_seconds(headers):
+    """How long a 429 asks us to wait, from (in order of precision)
+    `retry-after-ms`, `Retry-After` (seconds or HTTP date) or OpenAI's
+    `x-ratelimit-reset-requests`. None when the response does not say."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    return parse_duration(headers.get("x-ratelimit-reset-requests"))
+
+def throttle_of(exc):
+    """For an HTTP 429 error (requests.HTTPError or an OpenAI APIStatusError,
+    both carry the response), return the response headers; else None."""
+    response = getattr(exc, "response", None)
+    if response is None or getattr(response, "status_code", None) != THROTTLE_STATUS:
+        return None
+    return response.headers
+
+
+class AdaptiveTokenBucket(TokenBucket):
+    """TokenBucket whose rate follows AIMD between `min_rate` and `max_rate`."""
+
+    def __init__(self, rate, capacity=1, min_rate=None, max_rate=None, increase=None, decrease=0.7,
+                 default_pause=1.0):
+        super().__init__(rate, capacity)
+        self.min_rate = float(min_rate if min_rate is not None else rate / 20)
+        self.max_rate = float(max(rate, max_rate if max_rate is not None else rate))
+        self.increase = float(increase if increase is not None else max(rate / 4, 0.05))
+        self.decrease = decrease
+        self.default_pause = default_pause
+        self.throttle_events = 0
+        self._paused_until = 0.0
+        self._last_decrease = float("-inf")
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+        return super().try_acquire(tokens)
+
+    def succeeded(self):
+        """Additive increase: `increase` req/s gained per second spent at the current rate."""
+        with self._lock:
+            if self.rate < self.max_rate:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def throttled(self, headers=None):
+        """Record a 429. Pauses until the server's reset time, and cuts the
+        rate once per throttling episode: the other requests already in flight
+        get their 429s during the pause and do not cut it again. Returns
+        (pause seconds, whether the rate was cut)."""
+        pause = retry_after_seconds(headers)
+        pause = self.default_pause if pause is None else pause
+        with self._lock:
+            now = time.monotonic()
+            self.throttle_events += 1
+            self._refill(now)
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, now + pause)
+            cut = now >= self._last_decrease
+            if cut:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._last_decrease = self._paused_until
+        return pause, cut
+
+    def snapshot(self):
+        with self._lock:
+            return {"rate": round(self.rate, 4), "throttle_events": self.throttle_events,
+                    "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 4)}
@@ -0,0 +1,248 @@
+import os
+import re
+from array import array
+
+import numpy as np
+
+# ===== REPLY GRAPH INDEX =====
+# Quotelinks (">>123456") are reply edges: the quoting post is the child,
+# the quoted post its parent. Processing extracts them from the raw HTML
+# before cleaning drops the markup, and stores a CSR index next to the
+# processed posts (`<dataset>_graph.npz`):
+#
+#   node_ids    sorted post ids (int64); a node's index is its row
+#   thread_ids  thread of each node
+#   indptr      row i's parents are indices[indptr[i]:indptr[i + 1]]
+#   indices     parent rows (int32)
+#
+# Only edges to an earlier post that is itself in the index are kept. Links
+# to unknown posts (other boards, pruned threads) are dropped. Self-quotes
+# and forward links are dropped too, so the graph is a DAG whose edges
+# always point to a lower row. Every analysis below is a handful of array
+# operations over all edges at once: no per-row joins.
+
+QUOTELINK_RE = re.compile(r'class="quotelink"[^>]*>&gt;&gt;(\d+)</a>')
+MAX_DEPTH = 10_000     # relaxation rounds for cascade depth (chains are far shorter)
+
+def quotelinks(html_text):
+    """Post numbers quoted by a comment, in order, without repeats. Links to
+    other boards (">>>/g/123") do not match."""
+    if not html_text or "quotelink" not in html_text:
+        return []
+    return list(dict.fromkeys(int(n) for n in QUOTELINK_RE.findall(html_text)))
+
+def _first_of_runs(sorted_values):
+    """Mask of the first element of each run of equal values."""
+    mask = np.ones(len(sorted_values), dtype=bool)
+    mask[1:] = sorted_values[1:] != sorted_values[:-1]
+    return mask
+
+def _segment_positions(indptr, rows):
+    """Positions of rows' CSR segments, concatenated, and where each starts."""
+    lengths = indptr[rows + 1] - indptr[rows]
+    starts = np.zeros(len(rows), dtype=np.int64)
+    np.cumsum(lengths[:-1], out=starts[1:])
+    positions = np.arange(lengths.sum(), dtype=np.int64) + np.repeat(indptr[rows] - starts, lengths)
+    return positions, starts
+
+def graph_path(dataset):
+    """Where the reply index of `dataset` (a JSONL file) is stored."""
+    return os.path.splitext(dataset)[0] + "_graph.npz"
+
+
+class ReplyGraph:
+    def __init__(self, node_ids, thread_ids, indptr, indices):
+        self.node_ids = node_ids
+        self.thread_ids = thread_ids
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_edges(cls, post_ids, thread_ids, children, parents):
+        """Build the index from per-post arrays and (child, parent) post-id pairs."""
+        post_ids, thread_ids = np.asarray(post_ids, dtype=np.int64), np.asarray(thread_ids, dtype=np.int64)
+        order = np.argsort(post_ids, kind="stable")
+        first = _first_of_runs(post_ids[order])
+        node_ids, node_threads = post_ids[order][first], thread_ids[order][first]
+
+        children, parents = np.asarray(children, dtype=np.int64), np.asarray(parents, dtype=np.int64)
+        child_rows, parent_rows = cls._rows(node_ids, children), cls._rows(node_ids, parents)
+        keep = (child_rows >= 0) & (parent_rows >= 0) & (parent_rows < child_rows)
+        # One edge per (child, parent) pair, sorted by child
+        pairs = np.sort(child_rows[keep] * len(node_ids) + parent_rows[keep])
+        pairs = pairs[_first_of_runs(pairs)]
+        child_rows, parent_rows = np.divmod(pairs, max(len(node_ids), 1))
+
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(child_rows, minlength=len(node_ids)), out=indptr[1:])
+        return cls(node_ids, node_threads, indptr, parent_rows.astype(np.int32))
+
+    @staticmethod
+    def _rows(node_ids, post_ids):
+        if not len(node_ids):
+            return np.full(len(post_ids), -1, dtype=np.int64)
+        # Sorted queries keep the binary searches cache-friendly (several times faster)
+        order = np.argsort(post_ids, kind="stable")
+        rows = np.empty(len(post_ids), dtype=np.int64)
+        rows[order] = np.minimum(np.searchsorted(node_ids, post_ids[order]), len(node_ids) - 1)
+        return np.where(node_ids[rows] == post_ids, rows, -1)
+
+    def rows(self, post_ids):
+        """Row of each post id, -1 where the post is not in the index."""
+        return self._rows(self.node_ids, np.asarray(post_ids, dtype=np.int64))
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.indices)
+
+    def edges(self):
+        """(child rows, parent rows) of every edge."""
+        children = np.repeat(np.arange(self.num_nodes, dtype=np.int64), np.diff(self.indptr))
+        return children, self.indices.astype(np.int64)
+
+    def edge_ids(self):
+        """(child post ids, parent post ids) of every edge."""
+        children, parents = self.edges()
+        return self.node_ids[children], self.node_ids[parents]
+
+    def reply_counts(self):
+        """Direct replies each post received (its in-degree)."""
+        return np.bincount(self.indices, minlength=self.num_nodes)
+
+    # ===== STORAGE =====
+    def save(self, path):
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, node_ids=self.node_ids, thread_ids=self.thread_ids, indptr=self.indptr,
+                 indices=self.indices)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as saved:
+            return cls(saved["node_ids"], saved["thread_ids"], saved["indptr"], saved["indices"])
+
+
+class ReplyGraphBuilder:
+    """Collect posts (post_id, thread_id, quotes) as they stream past."""
+
+    def __init__(self, graph=None):
+        self.post_ids, self.thread_ids = array("q"), array("q")
+        self.children, self.parents = array("q"), array("q")
+        if graph is not None:  # extend an existing index
+            self.post_ids.frombytes(graph.node_ids.astype(np.int64).tobytes())
+            self.thread_ids.frombytes(graph.thread_ids.astype(np.int64).tobytes())
+            children, parents = graph.edge_ids()
+            self.children.frombytes(children.tobytes())
+            self.parents.frombytes(parents.tobytes())
+
+    def add(self, post):
+        post_id = post.get("post_id")
+        if post_id is None:
+            return
+        self.post_ids.append(post_id)
+        self.thread_ids.append(post.get("thread_id") or post_id)
+        for parent in post.get("quotes") or ():
+            self.children.append(post_id)
+            self.parents.append(parent)
+
+    def build(self):
+        as_array = lambda values: np.frombuffer(values, dtype=np.int64) if values else np.zeros(0, dtype=np.int64)
+        return ReplyGraph.from_edges(as_array(self.post_ids), as_array(self.thread_ids),
+                                     as_array(self.children), as_array(self.parents))
+
+
+# ===== ANALYSES =====
+def cascade_depth(graph):
+    """Length of the longest quote chain ending at each post (0 = quotes
+    nothing in the index). Topological peeling, one vectorized round per
+    level: once every parent of a post is final, so is the post, at one
+    more than its deepest parent. Each edge is touched once in total."""
+    depth = np.zeros(graph.num_nodes, dtype=np.int32)
+    waiting = np.diff(graph.indptr)                      # parents not final yet
+    children, _ = graph.edges()
+    by_parent = np.argsort(graph.indices, kind="stable")
+    reply_indptr = np.zeros(graph.num_nodes + 1, dtype=np.int64)
+    np.cumsum(graph.reply_counts(), out=reply_indptr[1:])
+    replies = children[by_parent]
+
+    final = np.flatnonzero(waiting == 0)
+    for _ in range(MAX_DEPTH):
+        if not len(final):
+            break
+        positions, starts = _segment_positions(reply_indptr, final)
+        reached = replies[positions]
+        np.maximum.at(depth, reached, np.repeat(depth[final] + 1, np.diff(np.append(starts, len(positions)))))
+        np.subtract.at(waiting, reached, 1)
+        reached = np.sort(reached[waiting[reached] == 0])
+        final = reached[_first_of_runs(reached)]
+    return depth
+
+def reply_vs_parent(graph, scores, threshold):
+    """Toxicity of replies against the post they quote, over every edge with
+    both scores. `scores` is aligned with graph rows (NaN = unscored)."""
+    children, parents = graph.edges()
+    child, parent = scores[children], scores[parents]
+    both = ~(np.isnan(child) | np.isnan(parent))
+    child, parent = child[both].astype(np.float64), parent[both].astype(np.float64)
+    result = {"edges": int(both.sum())}
+    if len(child) < 2:
+        return result
+    child_toxic, parent_toxic = child >= threshold, parent >= threshold
+    toxic_after_toxic = float(child_toxic[parent_toxic].mean()) if parent_toxic.any() else None
+    toxic_after_clean = float(child_toxic[~parent_toxic].mean()) if (~parent_toxic).any() else None
+    result.update({
+        "reply_mean": float(child.mean()),
+        "parent_mean": float(parent.mean()),
+        "mean_difference": float((child - parent).mean()),
+        "pearson_r": float(np.corrcoef(child, parent)[0, 1]) if child.std() and parent.std() else None,
+        "p_toxic_reply_given_toxic_parent": toxic_after_toxic,
+        "p_toxic_reply_given_clean_parent": toxic_after_clean,
+        "propagation_lift": toxic_after_toxic / toxic_after_clean
+        if toxic_after_toxic is not None and toxic_after_clean else None,
+    })
+    return result
+
+def toxicity_by_depth(depth, scores, threshold, max_depth=10):
+    """Posts, mean toxicity and toxic share per cascade depth (deeper ones
+    are pooled into `max_depth`)."""
+    scored = ~np.isnan(scores)
+    level = np.minimum(depth[scored], max_depth)
+    values = scores[scored].astype(np.float64)
+    posts = np.bincount(level, minlength=max_depth + 1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "depth": np.arange(max_depth + 1),
+            "posts": posts,
+            "mean_toxicity": np.bincount(level, weights=values, minlength=max_depth + 1) / posts,
+            "toxic_share": np.bincount(level, weights=values >= threshold, minlength=max_depth + 1) / posts,
+        }
+
+def thread_aggregates(graph, scores, threshold, depth=None):
+    """Per-thread posts, reply edges, deepest cascade, mean toxicity, toxic
+    share and OP toxicity, via one np.unique and a few bincounts."""
+    depth = cascade_depth(graph) if depth is None else depth
+    threads, thread_rows = np.unique(graph.thread_ids, return_inverse=True)
+    k = len(threads)
+    scored = ~np.isnan(scores)
+    values = np.where(scored, scores, 0.0).astype(np.float64)
+    scored_posts = np.bincount(thread_rows, weights=scored, minlength=k)
+    max_depth = np.zeros(k, dtype=np.int32)
+    np.maximum.at(max_depth, thread_rows, depth)
+    op_toxicity = np.full(k, np.nan)
+    is_op = (graph.node_ids == graph.thread_ids) & scored
+    op_toxicity[thread_rows[is_op]] = scores[is_op]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "thread_id": threads,
+            "posts": np.bincount(thread_rows, minlength=k),
+            "reply_edges": np.bincount(thread_rows, weights=np.diff(graph.indptr), minlength=k).astype(np.int64),
+            "max_depth": max_depth,
+            "scored_posts": scored_posts.astype(np.int64),
+            "mean_toxicity": np.bincount(thread_rows, weights=values, minlength=k) / scored_posts,
+            "toxic_share": np.bincount(thread_rows, weights=scored & (values >= threshold), minlength=k) / scored_posts,
+            "op_toxicity": op_toxicity,
+        }
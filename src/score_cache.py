@@ -0,0 +1,104 @@
+import hashlib
+import json
+import sqlite3
+import time
+import unicodedata
+
+import metrics
+
+# ===== CONTENT-HASH SCORE CACHE =====
+# Scores keyed by (provider namespace, normalized text), so copypasta and
+# previously scored texts never cost another API call. The namespace carries
+# provider, model and requested attributes; changing any of them misses.
+
+def normalize_text(text):
+    """Unicode NFC and collapsed whitespace. Case is kept: it can change scores."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+def cache_key(namespace, text):
+    digest = hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+    return f"{namespace}|{digest}"
+
+def make_namespace(provider, model, attributes=()):
+    attrs = hashlib.sha256(",".join(sorted(attributes)).encode("utf-8")).hexdigest()[:12]
+    return f"{provider}:{model}:{attrs}"
+
+
+class ScoreCache:
+    """SQLite-backed cache with size-bounded LRU eviction and hit/miss stats."""
+
+    def __init__(self, path, max_entries=1_000_000, commit_every=500):
+        self.path = path
+        self.max_entries = max_entries
+        self.commit_every = commit_every
+        self.hits = {}
+        self.misses = {}
+        self._pending = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores ("
+            "key TEXT PRIMARY KEY, result TEXT NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS scores_lru ON scores(last_access)")
+        self._size = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def get(self, namespace, text):
+        """Cached result or None on a miss."""
+        key = cache_key(namespace, text)
+        row = self._conn.execute("SELECT result FROM scores WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses[namespace] = self.misses.get(namespace, 0) + 1
+            metrics.inc("cache_lookups_total", namespace=namespace, result="miss")
+            return None
+        self.hits[namespace] = self.hits.get(namespace, 0) + 1
+        metrics.inc("cache_lookups_total", namespace=namespace, result="hit")
+        self._conn.execute("UPDATE scores SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._written()
+        return json.loads(row[0])
+
+    def put(self, namespace, text, result):
+        if result is None:
+            return  # failures are retried next time, never cached
+        row = (cache_key(namespace, text), json.dumps(result, separators=(",", ":")), time.time())
+        # Only a new key grows the cache (INSERT OR REPLACE reports a refresh as a row too)
+        cur = self._conn.execute("INSERT OR IGNORE INTO scores (key, result, last_access) VALUES (?, ?, ?)", row)
+        if cur.rowcount > 0:
+            self._size += 1
+        else:
+            self._conn.execute("UPDATE scores SET result = ?, last_access = ? WHERE key = ?", (*row[1:], row[0]))
+        if self._size > self.max_entries:
+            self.evict()
+        self._written()
+
+    def evict(self):
+        """Drop least-recently-used entries down to 90% of `max_entries`."""
+        excess = self._size - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM scores WHERE key IN (SELECT key FROM scores ORDER BY last_access LIMIT ?)",
+            (excess,),
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM scores").fetchone()[0]
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self._conn.commit()
+        self._pending = 0
+
+    def stats(self):
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {
+            "entries": self._size,
+            "by_namespace": {
+                ns: {"hits": self.hits.get(ns, 0), "misses": self.misses.get(ns, 0)} for ns in namespaces
+            },
+        }
+
+    def close(self):
+        self.commit()
+        self._conn.close()
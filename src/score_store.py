@@ -0,0 +1,215 @@
+import fcntl
+import hashlib
+import json
+import os
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+import metrics
+import prefilter
+import storage
+
+# ===== COLUMNAR SCORE STORE =====
+# The analysis needs a few dozen numbers per post, not the nested JSON
+# around them. Next to the scored dataset, `<dataset>.columns/` keeps one
+# flat little-endian file per column:
+#
+#   post_id, thread_id, timestamp   int64
+#   country                         int32 code into meta["countries"] (-1 = unknown)
+#   one column per score            float32 (NaN = missing)
+#
+# plus meta.json, which holds the row count, the dataset byte offset
+# covered, a digest of the dataset's head, and the country dictionary.
+# Posts the pre-filter skipped have no scores and get no row.
+# `sync` appends the rows of records added to the dataset since the last
+# sync. It fsyncs the columns, then atomically replaces meta.json, which is
+# the commit point. Bytes past the committed row count are from an
+# interrupted sync and are truncated first. A rewritten dataset (shorter,
+# or a different head) rebuilds the store. Readers np.memmap the columns:
+# opening costs a few milliseconds, and only the pages a statistic touches
+# are ever read.
+
+# Score columns, in frame order, with where each value lives in a record
+PERSP_ATTRIBUTES = [
+    "TOXICITY", "SEVERE_TOXICITY", "INSULT", "PROFANITY", "THREAT",
+    "IDENTITY_ATTACK", "SEXUALLY_EXPLICIT", "FLIRTATION", "SPAM", "OBSCENE"
+]
+OPENAI_CATEGORIES = [
+    "sexual", "sexual/minors", "hate", "hate/threatening", "violence",
+    "violence/graphic", "harassment", "harassment/threatening",
+    "self-harm", "self-harm/intent"
+]
+PERSP_COLUMNS = {f"persp_{attr.lower()}": attr for attr in PERSP_ATTRIBUTES}
+OPENAI_COLUMNS = {f"openai_{cat.replace('/', '_')}": cat for cat in OPENAI_CATEGORIES}
+SCORE_COLUMNS = ["openai_toxicity", *PERSP_COLUMNS, *OPENAI_COLUMNS]
+
+ID_COLUMNS = ["post_id", "thread_id", "timestamp"]
+DTYPES = {**{col: "<i8" for col in ID_COLUMNS}, "country": "<i4", **{col: "<f4" for col in SCORE_COLUMNS}}
+STORE_SUFFIX = ".columns"
+SYNC_BATCH = 10000   # records parsed per append (bounds memory)
+STORE_VERSION = 2    # bumped when the rows kept change; older stores are rebuilt
+
+def score_columns(records, countries):
+    """Flatten scored records into typed column arrays in one streaming pass,
+    leaving out posts the pre-filter skipped (unscored, not scored benign).
+    `countries` (label -> code) is extended with unseen countries. Returns
+    (columns, whether any record had `openai_toxicity`)."""
+    scores = {col: array("f") for col in SCORE_COLUMNS}
+    post_ids, thread_ids, timestamps, country_codes = array("q"), array("q"), array("q"), array("i")
+    has_openai_toxicity = False
+    nan = float("nan")
+
+    for record in records:
+        if prefilter.skipped(record):
+            continue
+        post_ids.append(record.get("post_id") or 0)
+        thread_ids.append(record.get("thread_id") or 0)
+        timestamps.append(record.get("timestamp") or 0)
+
+        toxicity = record.get("openai_toxicity")
+        has_openai_toxicity = has_openai_toxicity or "openai_toxicity" in record
+        scores["openai_toxicity"].append(nan if toxicity is None else toxicity)
+
+        persp = record.get("perspective_scores")
+        persp = persp if isinstance(persp, dict) else {}
+        for col, attr in PERSP_COLUMNS.items():
+            value = persp.get(attr)
+            scores[col].append(nan if value is None else value)
+
+        moderation = record.get("openai_moderation")
+        category_scores = moderation.get("category_scores", {}) if isinstance(moderation, dict) else {}
+        for col, cat in OPENAI_COLUMNS.items():
+            value = category_scores.get(cat)
+            scores[col].append(nan if value is None else value)
+
+        metadata = record.get("metadata")
+        country = metadata.get("country") if isinstance(metadata, dict) else None
+        country_codes.append(-1 if country is None else countries.setdefault(country, len(countries)))
+
+    columns = {
+        "post_id": np.frombuffer(post_ids, dtype=np.int64),
+        "thread_id": np.frombuffer(thread_ids, dtype=np.int64),
+        "timestamp": np.frombuffer(timestamps, dtype=np.int64),
+        "country": np.frombuffer(country_codes, dtype=np.int32),
+    }
+    for col in SCORE_COLUMNS:
+        columns[col] = np.frombuffer(scores[col], dtype=np.float32)
+    return columns, has_openai_toxicity
+
+def to_frame(columns, countries):
+    """Score frame over `columns` (arrays or memmaps; not copied) with
+    `country` as a categorical over the `countries` labels."""
+    import pandas as pd
+
+    frame = {col: columns[col] for col in (*ID_COLUMNS, *SCORE_COLUMNS)}
+    frame["country"] = pd.Categorical.from_codes(columns["country"], categories=list(countries))
+    return pd.DataFrame(frame, copy=False)
+
+
+class ScoreStore:
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.directory = dataset + STORE_SUFFIX
+        self.meta_path = os.path.join(self.directory, "meta.json")
+        self.lock_path = os.path.join(self.directory, ".lock")
+
+    def column_path(self, col):
+        return os.path.join(self.directory, f"{col}.bin")
+
+    @contextmanager
+    def locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _head(self, offset):
+        return hashlib.sha256(storage.file_head(self.dataset, min(offset, 4096))).hexdigest()
+
+    def read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self, meta):
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    # ===== WRITE PATH =====
+    def sync(self, batch_size=SYNC_BATCH):
+        """Append the records added to the dataset since the last sync (all
+        of them the first time). Returns the number of rows added."""
+        with metrics.timer("score_store_sync_seconds"), self.locked():
+            meta = self.read_meta()
+            size = os.path.getsize(self.dataset) if os.path.exists(self.dataset) else 0
+            if meta is not None and (size < meta["dataset_bytes"] or self._head(meta["dataset_bytes"]) != meta["head"]
+                                     or meta.get("version") != STORE_VERSION):
+                meta = None  # the dataset was rewritten, not appended to (or the format changed)
+            if meta is None:
+                meta = {"version": STORE_VERSION, "rows": 0, "dataset_bytes": 0, "head": self._head(0),
+                        "countries": [], "has_openai_toxicity": False, "dtypes": DTYPES}
+
+            # Roll back whatever an interrupted sync left past the commit point
+            for col, dtype in DTYPES.items():
+                path = self.column_path(col)
+                committed = meta["rows"] * np.dtype(dtype).itemsize
+                if not os.path.exists(path) or os.path.getsize(path) < committed:
+                    meta.update(rows=0, dataset_bytes=0, countries=[], has_openai_toxicity=False)  # rebuild
+                    break
+            for col, dtype in DTYPES.items():
+                path = self.column_path(col)
+                committed = meta["rows"] * np.dtype(dtype).itemsize
+                with open(path, "ab") as f:
+                    f.truncate(committed)
+
+            countries = {label: code for code, label in enumerate(meta["countries"])}
+            added = 0
+            offset = meta["dataset_bytes"]
+            while True:
+                records, new_offset = storage.read_tail(self.dataset, offset, limit=batch_size)
+                if records:
+                    columns, has_openai_toxicity = score_columns(records, countries)
+                    for col, dtype in DTYPES.items():
+                        with open(self.column_path(col), "ab") as f:
+                            f.write(columns[col].astype(dtype, copy=False).tobytes())
+                    meta["has_openai_toxicity"] = meta["has_openai_toxicity"] or has_openai_toxicity
+                    added += len(columns["post_id"])
+                if new_offset == offset:
+                    break
+                offset = new_offset
+
+            if added or offset != meta["dataset_bytes"] or not os.path.exists(self.meta_path):
+                for col in DTYPES:
+                    with open(self.column_path(col), "rb+") as f:
+                        os.fsync(f.fileno())
+                meta.update(rows=meta["rows"] + added, dataset_bytes=offset, head=self._head(offset),
+                            countries=list(countries))
+                self._write_meta(meta)
+        metrics.inc("score_store_rows_total", added)
+        return added
+
+    # ===== READ PATH =====
+    def columns(self):
+        """(memory-mapped columns, country labels, whether openai_toxicity
+        was present); None if the store was never synced. Columns are plain
+        read-only ndarray views of the maps, so results computed from them
+        are ordinary arrays."""
+        meta = self.read_meta()
+        if meta is None:
+            return None
+        rows = meta["rows"]
+        columns = {}
+        for col, dtype in meta["dtypes"].items():
+            columns[col] = np.memmap(self.column_path(col), dtype=dtype, mode="r", shape=(rows,)).view(np.ndarray) \
+                if rows else np.zeros(0, dtype=dtype)
+        return columns, meta["countries"], meta["has_openai_toxicity"]
@@ -0,0 +1,230 @@
+import asyncio
+import time
+
+import metrics
+from rate_limiting import AdaptiveTokenBucket, RetryPolicy, throttle_of
+from score_cache import cache_key
+
+# ===== CONNECTIVITY =====
+class Connectivity:
+    """Online/offline state shared by all providers, inferred from request
+    outcomes instead of probe requests. After a connection error one task
+    becomes the prober: it sleeps, then retries its own real request while
+    every other task waits for the connection to come back. Once a prober
+    runs out of retries the connection counts as lost and every task fails."""
+
+    def __init__(self, retry_seconds=10):
+        self.retry_seconds = retry_seconds
+        self.online = asyncio.Event()
+        self.online.set()
+        self.lost = None  # the connection error a prober gave up on
+        self._probing = False
+
+    def succeeded(self):
+        if not self.online.is_set():
+            print("🌐 Connection restored.")
+            self.online.set()
+
+    def give_up(self, error):
+        self.lost = error
+        self.online.set()  # wake the waiting tasks so they fail too
+
+    async def failed(self):
+        """Wait out a connection error. Returns True if the caller is the prober
+        and should retry immediately without waiting for `online`."""
+        if self.online.is_set():
+            print(f"🌐 No internet connection. Retrying in {self.retry_seconds} seconds...")
+            self.online.clear()
+        if self._probing:
+            await self.online.wait()
+            return False
+        self._probing = True
+        try:
+            await asyncio.sleep(self.retry_seconds)
+        finally:
+            self._probing = False
+        return True
+
+
+# ===== PROVIDER =====
+class Provider:
+    """A blocking scoring call with its own rate limiter, concurrency cap and
+    retry policy. `call` runs it in a worker thread so providers overlap.
+
+    The limiter adapts to the provider's real quota (see
+    rate_limiting.AdaptiveTokenBucket): it starts at `rate`, probes up to
+    `max_rate` and backs off on 429s. A 429 waits out Retry-After and is
+    retried without using up `retry` attempts, up to `max_throttles` times
+    per call. Connection errors do use them up, and the last one is raised."""
+
+    def __init__(self, name, func, rate, concurrency, retry=None, connection_errors=(), namespace=None,
+                 max_rate=None, max_throttles=50):
+        self.name = name
+        self.namespace = namespace or name  # score cache namespace (provider, model, attributes)
+        self.func = func
+        self.limiter = AdaptiveTokenBucket(rate=rate, capacity=max(1, concurrency), max_rate=max_rate)
+        self.concurrency = concurrency
+        self.retry = retry or RetryPolicy()
+        self.max_throttles = max_throttles
+        self.connection_errors = tuple(connection_errors)
+        self._semaphore = None
+        metrics.set_gauge("api_rate_limit", self.limiter.rate, provider=name)
+
+    def _throttled(self, headers):
+        old_rate = self.limiter.rate
+        pause, cut = self.limiter.throttled(headers)
+        metrics.inc("api_throttled_total", provider=self.name)
+        if cut:
+            metrics.set_gauge("api_rate_limit", self.limiter.rate, provider=self.name)
+            print(f"[WARN] {self.name} throttled (429): rate {old_rate:.2f} -> {self.limiter.rate:.2f} req/s, "
+                  f"pausing {pause:.2f}s")
+
+    def _record(self, outcome, start):
+        metrics.observe("api_request_seconds", time.perf_counter() - start, provider=self.name)
+        metrics.inc("api_requests_total", provider=self.name, outcome=outcome)
+
+    async def call(self, connectivity, *args):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)  # bound to the running loop
+        attempt = throttles = 0
+        probe = False
+        while True:
+            if not probe:
+                await connectivity.online.wait()
+            if connectivity.lost is not None:
+                raise connectivity.lost
+            with metrics.timer("rate_limit_wait_seconds", limiter=self.name):
+                await self.limiter.acquire_async()
+            async with self._semaphore:
+                start = time.perf_counter()
+                try:
+                    result = await asyncio.to_thread(self.func, *args)
+                except self.connection_errors as e:
+                    metrics.inc("api_connection_errors_total", provider=self.name)
+                    if attempt >= self.retry.retries:
+                        print(f"[ERROR] {self.name} connection failed after {attempt + 1} attempts: {e}")
+                        connectivity.give_up(e)
+                        raise
+                    attempt += 1
+                    probe = await connectivity.failed()
+                    continue
+                except Exception as e:
+                    connectivity.succeeded()  # the service answered, so we are online
+                    headers = throttle_of(e)
+                    if headers is not None and throttles < self.max_throttles:
+                        self._record("throttled", start)
+                        self._throttled(headers)
+                        throttles += 1
+                        continue  # the limiter holds every request until the pause is over
+                    self._record("error", start)
+                    if attempt >= self.retry.retries:
+                        print(f"[ERROR] {self.name} failed after {attempt + 1} attempts: {e}")
+                        return None
+                    print(f"[WARN] {self.name} failed (attempt {attempt + 1}): {e}")
+                    metrics.inc("api_retries_total", provider=self.name)
+                    delay = self.retry.delay(attempt)
+                    attempt += 1
+                else:
+                    self._record("ok", start)
+                    self.limiter.succeeded()
+                    metrics.set_gauge("api_rate_limit", self.limiter.rate, provider=self.name)
+                    connectivity.succeeded()
+                    return result
+            await asyncio.sleep(delay)  # back off outside the concurrency slot
+
+
+# ===== DUAL-PROVIDER SCORING =====
+async def score_batches(batches, openai, perspective, on_scored, max_in_flight=256, offline_retry=10,
+                        cache=None, text_of=None):
+    """Score batches of (idx, post) with both providers concurrently.
+
+    `openai` takes [(post_id, text), ...] and returns {post_id: result};
+    `perspective` takes one text. `on_scored(idx, post, openai_result,
+    perspective_result)` is called as soon as both scores of a post are in,
+    and at most `max_in_flight` posts are pending at any time. With a
+    ScoreCache, cached texts are answered locally and only misses are sent.
+    `text_of(post)` picks the text to score (default: `comment_text`), e.g.
+    a near-duplicate cluster's representative text (see triage.py).
+    """
+    text_of = text_of or (lambda post: post.get("comment_text", ""))
+    connectivity = Connectivity(offline_retry)
+
+    inflight = {}  # cache key -> future shared by every post with that text
+
+    def claim(provider, items):
+        """Split items into cached results, futures to await and texts to send.
+        Identical texts already in flight share one request instead of paying twice."""
+        results, waiting, to_send = {}, {}, []
+        for post_id, text in items:
+            hit = cache.get(provider.namespace, text) if cache is not None else None
+            if hit is not None:
+                results[post_id] = hit
+                continue
+            key = cache_key(provider.namespace, text)
+            if key not in inflight:
+                inflight[key] = asyncio.get_running_loop().create_future()
+                to_send.append((key, post_id, text))
+            waiting[post_id] = inflight[key]
+        return results, waiting, to_send
+
+    def settle(provider, key, text, result):
+        if cache is not None:
+            cache.put(provider.namespace, text, result)
+        inflight.pop(key).set_result(result)
+
+    async def send_moderations(to_send):
+        fresh = {}
+        try:
+            fresh = await openai.call(connectivity, [(post_id, text) for _, post_id, text in to_send]) or {}
+        finally:
+            for key, post_id, text in to_send:
+                settle(openai, key, text, fresh.get(post_id))
+
+    async def send_perspective(key, text):
+        result = None
+        try:
+            result = await perspective.call(connectivity, text)
+        finally:
+            settle(perspective, key, text, result)
+
+    in_flight = asyncio.Semaphore(max_in_flight)
+    tasks = set()
+    errors = []
+
+    def finished(task):
+        tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            errors.append(task.exception())
+
+    async def score_batch(batch):
+        try:
+            items = [(post["post_id"], text_of(post)) for _, post in batch]
+            moderations, moderation_waits, moderation_sends = claim(openai, items)
+            perspectives, perspective_waits, perspective_sends = claim(perspective, items)
+
+            senders = [asyncio.create_task(send_moderations(moderation_sends))] if moderation_sends else []
+            senders += [asyncio.create_task(send_perspective(key, text)) for key, _, text in perspective_sends]
+
+            for idx, post in batch:
+                post_id = post["post_id"]
+                if post_id not in moderations:
+                    moderations[post_id] = await moderation_waits[post_id]
+                if post_id not in perspectives:
+                    perspectives[post_id] = await perspective_waits[post_id]
+                on_scored(idx, post, moderations[post_id], perspectives[post_id])
+            await asyncio.gather(*senders)
+        finally:
+            for _ in batch:
+                in_flight.release()
+
+    for batch in batches:
+        for _ in batch:
+            await in_flight.acquire()
+        if errors:
+            break
+        task = asyncio.create_task(score_batch(batch))
+        tasks.add(task)
+        task.add_done_callback(finished)
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if errors:
+        raise errors[0]
@@ -0,0 +1,209 @@
+import argparse
+import json
+import os
+
+# ===== APPEND-ONLY JSONL STORAGE =====
+# Every stage reads and writes one JSON record per line, so datasets are
+# streamed instead of loaded whole, and appending a checkpoint costs the
+# size of the new records rather than the size of the file.
+
+def dumps(record):
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+def legacy_path(path):
+    """`foo.jsonl` -> `foo.json`, the whole-array format used before JSONL."""
+    return path[:-1] if path.endswith(".jsonl") else None
+
+def migrate_legacy(path):
+    """Convert a legacy JSON array next to `path` into JSONL once."""
+    old = legacy_path(path)
+    if os.path.exists(path) or not old or not os.path.exists(old):
+        return
+    with open(old, "r", encoding="utf-8") as f:
+        try:
+            records = json.load(f)
+        except json.JSONDecodeError:
+            print(f"Warning: Could not parse legacy file {old}. Skipping migration.")
+            return
+    write_records(path, records)
+    print(f"🔁 Migrated {len(records)} records from {old} to {path}")
+
+def iter_records(path):
+    """Stream records from a JSONL file. A torn final line (crash mid-write) is skipped."""
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping unreadable line {line_no} in {path}")
+
+def read_tail(path, offset=0, limit=None):
+    """Up to `limit` records appended after byte `offset`, and the offset to
+    resume from. A final line without its newline (still being written) is
+    left for next time."""
+    records = []
+    if not os.path.exists(path):
+        return records, offset
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"Warning: Skipping unreadable line at byte {offset - len(line)} in {path}")
+            if limit and len(records) >= limit:
+                break
+    return records, offset
+
+def file_head(path, size=4096):
+    """First bytes of a file; tells an appended file from a rewritten one."""
+    if not os.path.exists(path):
+        return b""
+    with open(path, "rb") as f:
+        return f.read(size)
+
+def read_ids(path, key="post_id"):
+    return {record.get(key) for record in iter_records(path) if record.get(key) is not None}
+
+def count_records(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class JsonlWriter:
+    """Append records to a JSONL file; `flush()` makes them durable."""
+
+    def __init__(self, path, mode="a"):
+        self.path = path
+        self.count = 0
+        self._f = open(path, mode, encoding="utf-8")
+        if mode == "a" and self._f.tell() > 0 and not ends_with_newline(path):
+            self._f.write("\n")  # seal a torn line left by a crash mid-write
+
+    def write(self, record):
+        self._f.write(dumps(record) + "\n")
+        self.count += 1
+
+    def write_many(self, records):
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        self._f.flush()
+        os.fsync(self._f.fileno())
+
+    def close(self):
+        if not self._f.closed:
+            self.flush()
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def append_records(path, records):
+    with JsonlWriter(path) as writer:
+        writer.write_many(records)
+        return writer.count
+
+def write_records(path, records):
+    """Replace `path` atomically with the streamed `records`."""
+    tmp_path = path + ".tmp"
+    with JsonlWriter(tmp_path, mode="w") as writer:
+        writer.write_many(records)
+    os.replace(tmp_path, path)
+    return writer.count
+
+
+# ===== COLUMNAR EXPORT =====
+def flatten_record(record, prefix=""):
+    """Nested dicts become dotted columns; lists are kept as JSON strings."""
+    flat = {}
+    for key, value in record.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, prefix=f"{name}."))
+        elif isinstance(value, list):
+            flat[name] = dumps(value)
+        else:
+            flat[name] = value
+    return flat
+
+def arrow_type(pa, kinds):
+    if not kinds:
+        return pa.null()
+    if kinds == {bool}:
+        return pa.bool_()
+    if kinds == {int}:
+        return pa.int64()
+    if kinds <= {int, float}:
+        return pa.float64()  # e.g. openai_toxicity is int 0 when scores are missing
+    return pa.string()
+
+def export_parquet(src, dst, batch_size=50000):
+    """Write a flattened Parquet copy of a JSONL dataset for analysis tools.
+
+    Two streaming passes: the first settles the schema (so a column that is
+    null in early records still gets its real type), the second writes row
+    groups of `batch_size` records. Requires pyarrow.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise SystemExit("[ERROR] Parquet export needs pyarrow: pip install pyarrow")
+
+    seen = {}
+    for record in iter_records(src):
+        for name, value in flatten_record(record).items():
+            kinds = seen.setdefault(name, set())
+            if value is not None:
+                kinds.add(type(value))
+    schema = pa.schema([(name, arrow_type(pa, kinds)) for name, kinds in seen.items()])
+
+    rows = 0
+    with pq.ParquetWriter(dst, schema) as writer:
+        batch = []
+        for record in iter_records(src):
+            batch.append(flatten_record(record))
+            if len(batch) >= batch_size:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                rows += len(batch)
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+            rows += len(batch)
+    print(f"✅ Exported {rows} records to {dst}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dataset storage utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Export a JSONL dataset to Parquet")
+    export.add_argument("src")
+    export.add_argument("dst")
+    export.add_argument("--batch-size", type=int, default=50000)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export_parquet(args.src, args.dst, batch_size=args.batch_size)
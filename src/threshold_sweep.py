@@ -0,0 +1,108 @@
+import numpy as np
+
+# ===== THRESHOLD SWEEP =====
+# Agreement statistics for every (OpenAI threshold, Perspective threshold)
+# pair on a grid, from one pass over the data. Each score is bucketed by how
+# many grid thresholds it reaches (a binary search on the sorted grid). A 2D
+# suffix sum of that bucket histogram then gives, for every pair at once,
+# how many posts both providers flag. Every other confusion count follows
+# from the marginals. Cost: O(n log T + T^2) instead of T^2 passes.
+#
+# As in the rest of the analysis, Perspective is the reference ("truth")
+# and OpenAI the prediction.
+
+SWEEP_STEP = 0.005
+SWEEP_THRESHOLDS = np.round(np.arange(0.0, 1.0 + SWEEP_STEP / 2, SWEEP_STEP), 6)
+
+def paired(x, y):
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    keep = ~(np.isnan(x) | np.isnan(y))
+    return x[keep], y[keep]
+
+def threshold_counts(x, y, thresholds=SWEEP_THRESHOLDS):
+    """Flag counts for every threshold pair: (n, x_flagged[i], y_flagged[j],
+    both_flagged[i, j]), where a score is flagged at t when it is >= t."""
+    x, y = paired(x, y)
+    k = len(thresholds)
+    # Number of thresholds each score reaches: flagged at thresholds[i] <=> reached > i
+    reached_x = np.searchsorted(thresholds, x, side="right")
+    reached_y = np.searchsorted(thresholds, y, side="right")
+    hist = np.bincount(reached_x * (k + 1) + reached_y, minlength=(k + 1) ** 2).reshape(k + 1, k + 1)
+    suffix = hist[::-1, ::-1].cumsum(axis=0).cumsum(axis=1)[::-1, ::-1]
+    both = suffix[1:, 1:]
+    return len(x), suffix[1:, 0], suffix[0, 1:], both
+
+def _ratio(num, den):
+    """num / den, and 0 where den is 0 (e.g. precision with nothing flagged)."""
+    num, den = np.broadcast_arrays(np.asarray(num, dtype=np.float64), np.asarray(den, dtype=np.float64))
+    return np.divide(num, den, out=np.zeros(num.shape), where=den > 0)
+
+def sweep(x, y, thresholds=SWEEP_THRESHOLDS):
+    """Confusion counts, agreement, precision/recall/F1 (Toxic class) and
+    Cohen's kappa for every pair: each value is a (T, T) array indexed
+    [OpenAI threshold, Perspective threshold]."""
+    n, flagged_x, flagged_y, tp = threshold_counts(x, y, thresholds)
+    flagged_x, flagged_y = flagged_x[:, None].astype(np.float64), flagged_y[None, :].astype(np.float64)
+    tp = tp.astype(np.float64)
+    fp, fn = flagged_x - tp, flagged_y - tp
+    tn = n - flagged_x - flagged_y + tp
+
+    agreement = _ratio(tp + tn, n)
+    precision = _ratio(tp, tp + fp)
+    recall = _ratio(tp, tp + fn)
+    f1 = _ratio(2 * precision * recall, precision + recall)
+    expected = _ratio(flagged_x * flagged_y + (n - flagged_x) * (n - flagged_y), float(n) ** 2)
+    kappa = _ratio(agreement - expected, 1 - expected)
+    return {
+        "thresholds": np.asarray(thresholds), "n": n,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "agreement": agreement, "precision": precision, "recall": recall, "f1": f1, "kappa": kappa,
+    }
+
+def sweep_rows(result, diagonal=False):
+    """Long-format rows (one per threshold pair, or per shared threshold)."""
+    thresholds = result["thresholds"]
+    metrics = ("tp", "fp", "fn", "tn", "agreement", "precision", "recall", "f1", "kappa")
+    if diagonal:
+        idx = np.arange(len(thresholds))
+        pairs = (idx, idx)
+    else:
+        pairs = tuple(np.indices(result["kappa"].shape).reshape(2, -1))
+    rows = {"openai_threshold": thresholds[pairs[0]], "persp_threshold": thresholds[pairs[1]]}
+    for metric in metrics:
+        values = result[metric][pairs]
+        rows[metric] = values.astype(np.int64) if metric in ("tp", "fp", "fn", "tn") else values
+    return rows
+
+def best_pair(result, metric="kappa"):
+    i, j = np.unravel_index(np.argmax(result[metric]), result[metric].shape)
+    thresholds = result["thresholds"]
+    return {
+        "openai_threshold": float(thresholds[i]),
+        "persp_threshold": float(thresholds[j]),
+        **{m: float(result[m][i, j]) for m in ("agreement", "precision", "recall", "f1", "kappa")},
+    }
+
+# ===== ROC / PR =====
+def ranking_curves(scores, labels):
+    """Exact ROC and precision-recall curves of `scores` against boolean
+    `labels`: one sort, then cumulative sums at each distinct score."""
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="mergesort")
+    scores, labels = np.asarray(scores, dtype=np.float64)[order], np.asarray(labels, dtype=bool)[order]
+    # Last index of each run of equal scores: a threshold can't split ties
+    ends = np.r_[np.flatnonzero(np.diff(scores)), len(scores) - 1]
+    tps = np.cumsum(labels)[ends].astype(np.float64)
+    fps = (ends + 1) - tps
+    positives, negatives = tps[-1] if len(tps) else 0.0, fps[-1] if len(fps) else 0.0
+
+    tpr = np.r_[0.0, _ratio(tps, positives)]
+    fpr = np.r_[0.0, _ratio(fps, negatives)]
+    precision = np.r_[1.0, _ratio(tps, tps + fps)]
+    recall = tpr
+    return {
+        "thresholds": scores[ends],
+        "fpr": fpr, "tpr": tpr, "precision": precision, "recall": recall,
+        "roc_auc": float(np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)) if positives and negatives else float("nan"),
+        # Step-wise average precision, as scikit-learn defines it
+        "average_precision": float(np.sum(np.diff(recall) * precision[1:])) if positives else float("nan"),
+    }
@@ -0,0 +1,251 @@
+import numpy as np
+
+import online_stats
+
+# ===== TIME-WINDOWED AGGREGATES =====
+# Scored posts are binned by `timestamp` into fixed windows (hour, day).
+# Each (window, dimension, group) cell keeps a few sums and counts per
+# provider: posts, scored posts, score sum, flagged posts, and pairs where
+# the providers disagree. Dimensions are "all", "op" (op/reply) and
+# "country". Each (window, provider) also keeps a quantile sketch: counts
+# over online_stats' log-spaced bins, so percentiles are within one bin
+# (a few percent relative error) and sketches merge by adding counts.
+#
+# Sums, counts and sketches merge by addition. A batch therefore only
+# touches the cells of the windows it falls into. Rolling means and
+# percentiles over the last N windows are differences of cumulative sums
+# and merged sketches, computed on demand.
+
+WINDOWS = {"hour": 3600, "day": 86400}
+ROLLING = {"hour": 24, "day": 7}       # windows per rolling mean/percentile
+QUANTILES = (0.5, 0.9, 0.99)
+SKETCH_BINS = 256
+PROVIDERS = {"openai": ("openai_toxicity", 5.0), "persp": ("persp_toxicity", 1.0)}   # column, sketch range
+DIMENSIONS = ("all", "op", "country")
+FIELDS = ("posts", "openai_n", "openai_sum", "openai_flagged", "persp_n", "persp_sum", "persp_flagged",
+          "pairs", "disagreements")
+
+def _grouped(keys, weights):
+    """Unique keys and the column sums of `weights` (n, k) per key."""
+    order = np.argsort(keys, kind="stable")
+    keys, weights = keys[order], weights[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], np.add.reduceat(weights, starts, axis=0)
+
+def sketch_quantiles(counts, edges, quantiles):
+    """Quantiles of binned counts (rows: sketches), interpolated
+    geometrically inside the bin (linearly in the [0, floor) bin)."""
+    counts = np.atleast_2d(counts).astype(np.float64)
+    cumulative = np.cumsum(counts, axis=1)
+    total = cumulative[:, -1:]
+    result = np.full((len(counts), len(quantiles)), np.nan)
+    for j, q in enumerate(quantiles):
+        target = q * total
+        bins = np.minimum((cumulative < target).sum(axis=1), counts.shape[1] - 1)
+        rows = np.arange(len(counts))
+        below = cumulative[rows, bins] - counts[rows, bins]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            frac = np.clip((target[:, 0] - below) / counts[rows, bins], 0.0, 1.0)
+        lo, hi = edges[bins], edges[bins + 1]
+        value = np.where(lo > 0, lo * (hi / np.where(lo > 0, lo, 1.0)) ** frac, lo + (hi - lo) * frac)
+        result[:, j] = np.where(total[:, 0] > 0, value, np.nan)
+    return result
+
+
+class Growable:
+    """Rows of a 2D array addressed by key, with amortized O(1) appends."""
+
+    def __init__(self, width, dtype):
+        self.index = {}
+        self.keys = []
+        self.values = np.zeros((16, width), dtype=dtype)
+
+    def rows(self, keys):
+        rows = []
+        for key in keys:
+            row = self.index.get(key)
+            if row is None:
+                row = self.index[key] = len(self.keys)
+                self.keys.append(key)
+                if row >= len(self.values):
+                    self.values = np.concatenate([self.values, np.zeros_like(self.values)])
+            rows.append(row)
+        return np.asarray(rows, dtype=np.int64)
+
+    def add(self, keys, values):
+        rows = self.rows(keys)  # may grow self.values
+        np.add.at(self.values, rows, values)
+
+    def used(self):
+        return self.values[:len(self.keys)]
+
+
+class WindowAggregates:
+    """Cells and sketches at one window width (seconds)."""
+
+    def __init__(self, width, threshold=None):
+        self.width = width
+        self.threshold = online_stats.THRESHOLD if threshold is None else threshold
+        self.cells = Growable(len(FIELDS), np.float64)        # (window, dimension, group) -> FIELDS
+        self.sketches = Growable(SKETCH_BINS, np.int64)       # (window, provider) -> bin counts
+        self.edges = {name: online_stats.sketch_edges(hi, SKETCH_BINS) for name, (_, hi) in PROVIDERS.items()}
+
+    def update(self, df):
+        """Fold in a score frame (analysis.score_frame) with a `timestamp` column."""
+        timestamps = df["timestamp"].to_numpy()
+        known = timestamps > 0
+        if not known.any():
+            return
+        df = df[known]
+        windows = timestamps[known] // self.width * self.width
+
+        scores = {name: df[col].to_numpy().astype(np.float64) for name, (col, _) in PROVIDERS.items()}
+        scored = {name: ~np.isnan(values) for name, values in scores.items()}
+        with np.errstate(invalid="ignore"):
+            flagged = {name: values >= self.threshold for name, values in scores.items()}
+        pairs = scored["openai"] & scored["persp"]
+        weights = np.column_stack([
+            np.ones(len(df)),
+            scored["openai"], np.where(scored["openai"], scores["openai"], 0.0), flagged["openai"],
+            scored["persp"], np.where(scored["persp"], scores["persp"], 0.0), flagged["persp"],
+            pairs, pairs & (flagged["openai"] != flagged["persp"]),
+        ])
+
+        is_op = df["thread_id"].to_numpy() == df["post_id"].to_numpy()
+        country = df["country"].cat
+        groups = {
+            "all": (np.zeros(len(df), dtype=np.int64), ["all"]),
+            "op": (is_op.astype(np.int64), ["reply", "op"]),
+            "country": (country.codes.to_numpy().astype(np.int64), list(country.categories)),
+        }
+        for dimension, (codes, labels) in groups.items():
+            present = codes >= 0
+            span = max(len(labels), 1)
+            keys, sums = _grouped(windows[present] * span + codes[present], weights[present])
+            self.cells.add([(int(k // span), dimension, labels[k % span]) for k in keys], sums)
+
+        for name, values in scores.items():
+            edges = self.edges[name]
+            bins = np.clip(np.searchsorted(edges, values[scored[name]], side="right") - 1, 0, SKETCH_BINS - 1)
+            keys, sums = _grouped(windows[scored[name]] * SKETCH_BINS + bins,
+                                  np.ones((len(bins), 1), dtype=np.int64))
+            touched, rows = np.unique(keys // SKETCH_BINS, return_inverse=True)
+            counts = np.zeros((len(touched), SKETCH_BINS), dtype=np.int64)
+            counts[rows, keys % SKETCH_BINS] = sums[:, 0]
+            self.sketches.add([(int(w), name) for w in touched], counts)
+
+    def merge(self, other):
+        self.cells.add(other.cells.keys, other.cells.used())
+        self.sketches.add(other.sketches.keys, other.sketches.used())
+
+    # --- queries ---
+    def windows(self):
+        return sorted({key[0] for key in self.cells.keys})
+
+    def sketch_matrix(self, provider, windows):
+        """(len(windows), bins) sketch counts for `provider` (zeros where empty)."""
+        matrix = np.zeros((len(windows), SKETCH_BINS), dtype=np.int64)
+        for i, window in enumerate(windows):
+            row = self.sketches.index.get((window, provider))
+            if row is not None:
+                matrix[i] = self.sketches.values[row]
+        return matrix
+
+    def table(self, rolling=1):
+        """One row per (window, dimension, group): counts, mean scores, flag
+        and disagreement rates. "all" rows add per-window percentiles and
+        their rolling mean/percentiles over the last `rolling` windows."""
+        import pandas as pd
+
+        if not self.cells.keys:
+            return pd.DataFrame(columns=["window_start", "dimension", "group", *FIELDS])
+        frame = pd.DataFrame(self.cells.used(), columns=FIELDS)
+        frame.insert(0, "window_start", [key[0] for key in self.cells.keys])
+        frame.insert(1, "dimension", pd.Categorical([key[1] for key in self.cells.keys], categories=DIMENSIONS))
+        frame.insert(2, "group", [key[2] for key in self.cells.keys])
+        frame = frame.sort_values(["window_start", "dimension", "group"], ignore_index=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            for name in PROVIDERS:
+                frame[f"{name}_mean"] = frame[f"{name}_sum"] / frame[f"{name}_n"]
+                frame[f"{name}_toxic_rate"] = frame[f"{name}_flagged"] / frame[f"{name}_n"]
+            frame["disagreement_rate"] = frame["disagreements"] / frame["pairs"]
+
+        overall = frame[frame["dimension"] == "all"].reset_index(drop=True)
+        windows = overall["window_start"].to_numpy()
+        # Rolling spans are by time, so missing windows simply contribute nothing
+        first = np.searchsorted(windows, windows - (rolling - 1) * self.width)
+        last = np.arange(1, len(windows) + 1)
+        for name in PROVIDERS:
+            counts = self.sketch_matrix(name, windows.tolist())
+            for q, values in zip(QUANTILES, sketch_quantiles(counts, self.edges[name], QUANTILES).T):
+                overall[f"{name}_p{round(q * 100)}"] = values
+            cumulative = np.vstack([np.zeros((1, SKETCH_BINS), dtype=np.int64), np.cumsum(counts, axis=0)])
+            rolling_counts = cumulative[last] - cumulative[first]
+            sums = np.concatenate([[0.0], np.cumsum(overall[f"{name}_sum"].to_numpy())])
+            n = np.concatenate([[0.0], np.cumsum(overall[f"{name}_n"].to_numpy())])
+            with np.errstate(invalid="ignore", divide="ignore"):
+                overall[f"{name}_rolling_mean"] = (sums[last] - sums[first]) / (n[last] - n[first])
+            for q, values in zip(QUANTILES, sketch_quantiles(rolling_counts, self.edges[name], QUANTILES).T):
+                overall[f"{name}_rolling_p{round(q * 100)}"] = values
+        extra = [col for col in overall.columns if col not in frame.columns]
+        return frame.merge(overall[["window_start", "dimension", "group", *extra]],
+                           on=["window_start", "dimension", "group"], how="left")
+
+    # --- persistence (inside online_stats.SummaryState) ---
+    def to_state(self, prefix):
+        meta = {"width": self.width, "threshold": self.threshold,
+                "cells": [list(key) for key in self.cells.keys],
+                "sketches": [list(key) for key in self.sketches.keys]}
+        arrays = {f"{prefix}_cells": self.cells.used(), f"{prefix}_sketches": self.sketches.used()}
+        return meta, arrays
+
+    @classmethod
+    def from_state(cls, meta, data, prefix):
+        aggregates = cls(meta["width"], meta["threshold"])
+        aggregates.cells.add([tuple(key) for key in meta["cells"]], data[f"{prefix}_cells"])
+        aggregates.sketches.add([tuple(key) for key in meta["sketches"]], data[f"{prefix}_sketches"])
+        return aggregates
+
+
+class TimeSeries:
+    """WindowAggregates for every width in WINDOWS."""
+
+    def __init__(self, windows=None, threshold=None):
+        windows = windows or WINDOWS
+        self.levels = {name: WindowAggregates(width, threshold) for name, width in windows.items()}
+
+    def update(self, df):
+        if "timestamp" not in df.columns:
+            return
+        for aggregates in self.levels.values():
+            aggregates.update(df)
+
+    def merge(self, other):
+        for name, aggregates in other.levels.items():
+            self.levels[name].merge(aggregates)
+
+    def tables(self):
+        return {name: aggregates.table(ROLLING.get(name, 1)) for name, aggregates in self.levels.items()}
+
+    def summary(self):
+        """Window counts and covered range per width (for analysis_summary.json)."""
+        result = {}
+        for name, aggregates in self.levels.items():
+            windows = aggregates.windows()
+            result[name] = {"windows": len(windows), "first": int(windows[0]) if windows else None,
+                            "last": int(windows[-1]) if windows else None}
+        return result
+
+    def to_state(self):
+        meta, arrays = {}, {}
+        for name, aggregates in self.levels.items():
+            meta[name], level_arrays = aggregates.to_state(f"time_series_{name}")
+            arrays.update(level_arrays)
+        return meta, arrays
+
+    @classmethod
+    def from_state(cls, meta, data):
+        series = cls({})
+        series.levels = {name: WindowAggregates.from_state(level, data, f"time_series_{name}")
+                         for name, level in meta.items()}
+        return series
@@ -0,0 +1,192 @@
+import re
+
+import numpy as np
+
+from score_cache import normalize_text
+
+# ===== NEAR-DUPLICATE TRIAGE =====
+# Copypasta, spam and "quote + lol" replies differ by a few characters, so
+# the content-hash score cache never sees them as equal. Before scoring,
+# each post's text is reduced to a MinHash signature: the minimum of
+# NUM_PERM hash functions over its character shingles. Two signatures agree
+# in about a Jaccard-similarity share of positions. Locality-sensitive
+# hashing (BANDS bands of ROWS rows) turns "similar signature" into "shares
+# a band" lookups. A post whose estimated similarity to an earlier cluster
+# representative reaches `threshold` joins that cluster and is scored
+# through the representative's text. The score cache and the in-flight
+# dedup in scoring_engine then make that one request per cluster.
+#
+# threshold=1.0 is the exact mode: only posts whose text is identical up to
+# the cache's normalization share a score, with no MinHash involved.
+# `audit_rate` scores that share of cluster members on their own text
+# anyway. Each audited score is paired with its representative's (`observe`),
+# and `audit_report` gives the mean absolute error and the share of pairs
+# flagged differently: what propagation costs on this corpus.
+
+SHINGLE = 5            # characters per shingle (fits one uint64)
+NUM_PERM = 64
+BANDS = 8              # BANDS * ROWS == NUM_PERM; ~0.77 similarity where a band match turns likely
+ROWS = 8
+THRESHOLD = 0.9        # estimated Jaccard similarity needed to join a cluster
+SEED = 1
+AUDIT_SCORES = ("openai_toxicity", "persp_toxicity")
+AUDIT_FLAG_THRESHOLD = 0.5   # as analysis.THRESHOLD
+
+QUOTELINK_RE = re.compile(r">>\d+")
+
+def canonical(text):
+    """What near-duplicates are compared on: normalized as in the score cache
+    (case is kept: it can change scores), with quoted post numbers dropped
+    (">>123 lol" and ">>456 lol" are the same reply)."""
+    return normalize_text(QUOTELINK_RE.sub(">>", text or ""))
+
+def shingles(text, size=SHINGLE):
+    """Distinct byte shingles of `text` packed into uint64 values."""
+    data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+    if len(data) <= size:
+        data = np.pad(data, (0, size - len(data)))
+        return np.array([int.from_bytes(data.tobytes(), "little")], dtype=np.uint64)
+    windows = np.lib.stride_tricks.sliding_window_view(data, size).astype(np.uint64)
+    packed = windows @ (np.uint64(256) ** np.arange(size, dtype=np.uint64))
+    return np.unique(packed)
+
+def scored_own_text(post):
+    """False for a cluster member whose scores were copied from its
+    representative (see Triage.scoring_text); True for everything else."""
+    info = post.get("triage")
+    return not info or info["representative"] or bool(info.get("audited"))
+
+class MinHasher:
+    """Multiply-shift hash family: h_i(x) = (a_i * x + b_i) mod 2^64, top 32 bits."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=SEED):
+        rng = np.random.default_rng(seed)
+        self.a = (rng.integers(0, 2**63, num_perm, dtype=np.uint64) << np.uint64(1)) | np.uint64(1)
+        self.b = rng.integers(0, 2**63, num_perm, dtype=np.uint64)
+
+    def signature(self, values):
+        with np.errstate(over="ignore"):
+            hashed = values[None, :] * self.a[:, None] + self.b[:, None]
+        return (hashed >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+class Triage:
+    """Streaming clustering: the first post of a cluster is its representative."""
+
+    def __init__(self, threshold=THRESHOLD, audit_rate=0.0, bands=BANDS, rows=ROWS, seed=SEED):
+        self.threshold = threshold
+        self.audit_rate = audit_rate
+        self.bands, self.rows = bands, rows
+        self.exact = threshold >= 1.0
+        self.hasher = None if self.exact else MinHasher(bands * rows, seed)
+        self.buckets = {}              # (band, band hash) or exact text -> cluster index
+        self.signatures = []           # cluster index -> representative signature
+        self.cluster_ids = []          # cluster index -> representative post_id
+        self.texts = {}                # representative post_id -> its comment_text
+        self.rng = np.random.default_rng(seed)
+        self.posts = self.members = self.audited = 0
+        self.representative_scores = {}   # cluster_id -> scores (only kept when auditing)
+        self.pending_audits = {}          # cluster_id -> audited scores awaiting the representative's
+        self.audit_pairs = {score: [] for score in AUDIT_SCORES}   # (audited, representative)
+
+    def _match(self, signature):
+        """Best cluster among LSH candidates and its estimated similarity."""
+        best, best_similarity = None, 0.0
+        for band in range(self.bands):
+            candidate = self.buckets.get((band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+            if candidate is None or candidate == best:
+                continue
+            similarity = float(np.mean(self.signatures[candidate] == signature))
+            if similarity > best_similarity:
+                best, best_similarity = candidate, similarity
+        return best, best_similarity
+
+    def _add_cluster(self, post, signature, key):
+        index = len(self.cluster_ids)
+        self.cluster_ids.append(post["post_id"])
+        self.texts[post["post_id"]] = post.get("comment_text", "")
+        if self.exact:
+            self.buckets[key] = index
+        else:
+            self.signatures.append(signature)
+            for band in range(self.bands):
+                self.buckets.setdefault((band, signature[band * self.rows:(band + 1) * self.rows].tobytes()), index)
+        return index
+
+    def assign(self, post):
+        """Record `post["triage"]` = {cluster_id, representative, similarity[, audited]}."""
+        self.posts += 1
+        if self.exact:
+            signature, key = None, normalize_text(post.get("comment_text", ""))
+            cluster = self.buckets.get(key)
+            similarity = 1.0
+        else:
+            signature, key = self.hasher.signature(shingles(canonical(post.get("comment_text", "")))), None
+            cluster, similarity = self._match(signature)
+            if similarity < self.threshold:
+                cluster = None
+
+        if cluster is None:
+            cluster = self._add_cluster(post, signature, key)
+            post["triage"] = {"cluster_id": self.cluster_ids[cluster], "representative": True, "similarity": 1.0}
+            return post
+
+        self.members += 1
+        post["triage"] = {"cluster_id": self.cluster_ids[cluster], "representative": False,
+                          "similarity": round(similarity, 4)}
+        if self.audit_rate and self.rng.random() < self.audit_rate:
+            post["triage"]["audited"] = True
+            self.audited += 1
+        return post
+
+    def scoring_text(self, post):
+        """Text to send for `post`: its cluster representative's, unless audited."""
+        if scored_own_text(post):
+            return post.get("comment_text", "")
+        return self.texts[post["triage"]["cluster_id"]]
+
+    def observe(self, post):
+        """Note a scored post. With auditing on, representatives' scores are
+        kept and each audited member is paired with its representative's,
+        which is also recorded in `post["triage"]["representative_scores"]`
+        when the representative was scored first (the usual order)."""
+        info = post.get("triage")
+        if not self.audit_rate or not info:
+            return
+        scores = {score: post.get(score) for score in AUDIT_SCORES}
+        cluster = info["cluster_id"]
+        if info["representative"]:
+            self.representative_scores[cluster] = scores
+            for audited in self.pending_audits.pop(cluster, ()):
+                self._pair(audited, scores)
+        elif info.get("audited"):
+            representative = self.representative_scores.get(cluster)
+            if representative is None:
+                self.pending_audits.setdefault(cluster, []).append(scores)
+                return
+            info["representative_scores"] = representative
+            self._pair(scores, representative)
+
+    def _pair(self, audited, representative):
+        for score in AUDIT_SCORES:
+            if audited[score] is not None and representative[score] is not None:
+                self.audit_pairs[score].append((audited[score], representative[score]))
+
+    def audit_report(self, threshold=AUDIT_FLAG_THRESHOLD):
+        """Per score: audited pairs, mean absolute error between a member's
+        own score and its representative's, and the share of pairs on
+        different sides of `threshold`."""
+        report = {}
+        for score, pairs in self.audit_pairs.items():
+            report[score] = {"pairs": len(pairs), "mae": None, "flag_disagreement": None}
+            if pairs:
+                audited, representative = np.array(pairs, dtype=np.float64).T
+                report[score].update(
+                    mae=float(np.abs(audited - representative).mean()),
+                    flag_disagreement=float(np.mean((audited >= threshold) != (representative >= threshold))),
+                )
+        return report
+
+    def stats(self):
+        return {"posts": self.posts, "clusters": len(self.cluster_ids), "members": self.members,
+                "audited": self.audited, "threshold": self.threshold}
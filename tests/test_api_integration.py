@@ -0,0 +1,71 @@
+import os
+
+import pytest
+from openai import OpenAI
+
+import api_integration
+import mock_servers
+import storage
+from score_cache import ScoreCache
+
+TEXT = ("the economy section of this thread keeps arguing about interest rates housing prices "
+        "and whether the central bank should raise or cut again before the next election cycle")
+
+
+@pytest.fixture
+def mocked_api(tmp_path, monkeypatch):
+    """api_integration pointed at the local mocks, with its files in tmp_path."""
+    openai_server, openai_url = mock_servers.start_openai_mock()
+    perspective_server, perspective_url = mock_servers.start_perspective_mock()
+    monkeypatch.setattr(api_integration, "client", OpenAI(api_key="mock", base_url=f"{openai_url}/v1", max_retries=0))
+    monkeypatch.setattr(api_integration, "PERSPECTIVE_URL", f"{perspective_url}{mock_servers.PERSPECTIVE_PATH}")
+    for name, filename in [("INPUT_FILE", "posts.jsonl"), ("OUTPUT_FILE", "scored.jsonl"),
+                           ("CACHE_FILE", "cache.sqlite"), ("PREFILTER_FILE", "prefilter.npz")]:
+        monkeypatch.setattr(api_integration, name, str(tmp_path / filename))
+    yield api_integration
+    openai_server.shutdown()
+    perspective_server.shutdown()
+
+
+def test_seed_cache_skips_copied_triage_scores(mocked_api):
+    posts = [{"post_id": 1, "thread_id": 1, "comment_text": TEXT},
+             {"post_id": 2, "thread_id": 1, "comment_text": TEXT + " lol"},
+             {"post_id": 3, "thread_id": 1, "comment_text": "an unrelated short reply"}]
+    mocked_api.run_api_analysis(use_cache=False, posts=posts, triage=True, triage_threshold=0.5)
+    scored = {record["post_id"]: record for record in storage.iter_records(mocked_api.OUTPUT_FILE)}
+    assert scored[2]["triage"]["representative"] is False
+    assert scored[2]["persp_toxicity"] == scored[1]["persp_toxicity"]  # copied from post 1
+
+    mocked_api.seed_cache()
+    openai_provider, perspective_provider = mocked_api.make_providers()
+    cache = ScoreCache(mocked_api.CACHE_FILE)
+    try:
+        for provider in (openai_provider, perspective_provider):
+            assert cache.get(provider.namespace, TEXT) is not None
+            assert cache.get(provider.namespace, "an unrelated short reply") is not None
+            assert cache.get(provider.namespace, TEXT + " lol") is None
+        assert cache.stats()["entries"] == 4
+    finally:
+        cache.close()
+
+
+def test_cache_is_closed_on_every_exit(mocked_api, monkeypatch):
+    closed = []
+
+    class TrackedCache(ScoreCache):
+        def close(self):
+            closed.append(self.path)
+            super().close()
+
+    def broken_triage(*args):
+        raise ValueError("bad triage settings")
+
+    monkeypatch.setattr(mocked_api, "ScoreCache", TrackedCache)
+    posts = [{"post_id": 1, "thread_id": 1, "comment_text": TEXT}]
+    mocked_api.run_api_analysis(posts=posts, prefilter=True)  # no pre-filter model: nothing is opened
+    assert not os.path.exists(mocked_api.CACHE_FILE)
+
+    monkeypatch.setattr(mocked_api, "Triage", broken_triage)
+    with pytest.raises(ValueError):
+        mocked_api.run_api_analysis(posts=posts, triage=True)
+    assert closed == [mocked_api.CACHE_FILE]
@@ -0,0 +1,123 @@
+import json
+import os
+
+import pytest
+
+import storage
+from journal import ScoreJournal
+
+
+def record(post_id, **fields):
+    return {"post_id": post_id, "comment_text": f"post {post_id}", "persp_toxicity": post_id / 100, **fields}
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    return str(tmp_path / "scored.jsonl")
+
+
+def journal_of(dataset):
+    return ScoreJournal(dataset, fsync_every=1000, compact_every=0)
+
+
+def written(journal, *post_ids, **fields):
+    for post_id in post_ids:
+        journal.write(record(post_id, **fields))
+    journal.flush()
+
+
+def dataset_ids(dataset):
+    return [r["post_id"] for r in storage.iter_records(dataset)]
+
+
+def committed_bytes(dataset):
+    with open(dataset + ".state.json") as f:
+        return json.load(f)["dataset_bytes"]
+
+
+def test_replays_only_the_journal_tail(dataset):
+    journal = journal_of(dataset)
+    written(journal, 1, 2, 3)
+    assert journal.compact() == 3
+    written(journal, 4, 5)  # journalled, not compacted: a crash here keeps them in the journal
+    reopened = journal_of(dataset)
+    assert reopened.committed_ids() == {1, 2, 3}
+    assert reopened.processed_ids() == {1, 2, 3, 4, 5}
+    assert reopened.compact() == 2
+    assert dataset_ids(dataset) == [1, 2, 3, 4, 5]
+    assert os.path.getsize(dataset + ".journal") == 0
+
+
+def test_torn_journal_record_is_dropped(dataset):
+    journal = journal_of(dataset)
+    written(journal, 1, 2)
+    with open(dataset + ".journal", "ab") as f:
+        f.write(b'{"post_id":3,"comment_text":"po')  # crash mid-append
+    reopened = journal_of(dataset)
+    assert reopened.processed_ids() == {1, 2}  # post 3 is simply scored again
+    written(reopened, 3)  # the torn line is sealed off, not glued to this record
+    assert reopened.compact() == 3
+    assert dataset_ids(dataset) == [1, 2, 3]
+    assert os.path.getsize(dataset) == committed_bytes(dataset)
+
+
+def test_interrupted_compaction_is_rolled_back(dataset):
+    journal = journal_of(dataset)
+    written(journal, 1, 2)
+    journal.compact()
+    with open(dataset, "rb") as f:
+        committed = f.read()
+    written(journal, 3, 4)
+    # Crash after appending to the dataset and ids, before the state file commit
+    with open(dataset, "ab") as f:
+        f.write(b'{"post_id":3}\n{"post_id":4,"comm')
+    with open(dataset + ".ids", "ab") as f:
+        f.write((3).to_bytes(8, "little") + b"\x04\x00")
+    with open(dataset + ".state.json.tmp", "w") as f:
+        f.write('{"dataset_bytes": 99')  # torn replacement state, never renamed into place
+
+    reopened = journal_of(dataset)
+    assert reopened.committed_ids() == {1, 2}
+    assert reopened.processed_ids() == {1, 2, 3, 4}
+    assert reopened.compact() == 2
+    with open(dataset, "rb") as f:
+        data = f.read()
+    assert data.startswith(committed)
+    assert dataset_ids(dataset) == [1, 2, 3, 4]
+    assert len(data) == committed_bytes(dataset)
+    assert os.path.getsize(dataset + ".ids") == 4 * 8
+
+
+def test_unreadable_state_file_rebuilds_the_index(dataset):
+    journal = journal_of(dataset)
+    written(journal, 1, 2, 3)
+    journal.compact()
+    with open(dataset + ".state.json", "w") as f:
+        f.write('{"dataset_')
+    reopened = journal_of(dataset)
+    assert reopened.committed_ids() == {1, 2, 3}
+    assert committed_bytes(dataset) == os.path.getsize(dataset)
+
+
+def test_compaction_deduplicates_and_keeps_rescores(dataset):
+    journal = journal_of(dataset)
+    written(journal, 1, 2, prefiltered=True)
+    journal.compact()
+    other_worker = journal_of(dataset)
+    written(other_worker, 2, 3)  # post 2 scored again by a second worker
+    written(journal, 3)
+    written(journal, 1, rescored=True)
+    assert journal.compact() == 2
+    assert dataset_ids(dataset) == [1, 2, 3, 1]
+    assert journal.committed_ids() == {1, 2, 3, -1}
+    written(journal, 1, rescored=True)  # a rescore is appended only once
+    assert journal.compact() == 0
+
+
+def test_compacts_automatically_every_n_records(dataset):
+    journal = ScoreJournal(dataset, fsync_every=2, compact_every=4)
+    for post_id in range(1, 10):
+        journal.write(record(post_id))
+    journal.close()
+    assert dataset_ids(dataset) == list(range(1, 9))
+    assert journal.processed_ids() == set(range(1, 10))
@@ -0,0 +1,105 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import pearsonr, spearmanr, ttest_rel
+
+import analysis
+import benchmark
+import online_stats
+import processing
+import time_series
+
+
+@pytest.fixture(scope="module")
+def frame():
+    posts = benchmark.scored_posts(processing.clean_records(benchmark.synthetic_posts(4000), workers=1))
+    return analysis.score_frame(list(posts))
+
+
+def new_state(df=None):
+    state = online_stats.SummaryState(category_mapping=analysis.CATEGORY_MAPPING.items(), threshold=analysis.THRESHOLD)
+    if df is not None:
+        state.update(df)
+    return state
+
+
+@pytest.fixture(scope="module")
+def merged(frame):
+    state = new_state(frame.iloc[:1500])
+    state.merge(new_state(frame.iloc[1500:]))
+    return state
+
+
+def test_merged_state_matches_one_shot(frame, merged):
+    whole = new_state(frame)
+    assert merged.n == whole.n == len(frame)
+    np.testing.assert_array_equal(merged.contingency.counts, whole.contingency.counts)
+    np.testing.assert_array_equal(merged.sketch.counts, whole.sketch.counts)
+    assert merged.by_op.totals == whole.by_op.totals
+    assert merged.by_country.totals == whole.by_country.totals
+    for field in online_stats.PairedMoments.FIELDS:
+        assert getattr(merged.moments, field) == pytest.approx(getattr(whole.moments, field), rel=1e-9)
+    for pair, (moments, sketch) in whole.categories.items():
+        assert merged.categories[pair][0].pearson()[0] == pytest.approx(moments.pearson()[0], abs=1e-9)
+        np.testing.assert_array_equal(merged.categories[pair][1].counts, sketch.counts)
+    for name, table in whole.time_series.tables().items():
+        pd.testing.assert_frame_equal(merged.time_series.tables()[name], table)
+
+
+def test_merged_state_matches_exact_statistics(frame, merged):
+    x = frame["openai_toxicity"].to_numpy(np.float64)
+    y = frame["persp_toxicity"].to_numpy(np.float64)
+    r, p = merged.moments.pearson()
+    assert (r, p) == pytest.approx(tuple(pearsonr(x, y)), rel=1e-6, abs=1e-12)
+    t_stat, t_p = merged.moments.t_test()
+    assert (t_stat, t_p) == pytest.approx(tuple(ttest_rel(x, y)), rel=1e-6)
+    rho, _, bound = merged.sketch.spearman()
+    assert abs(rho - spearmanr(x, y)[0]) <= bound
+
+    exact = analysis.compute_agreement(frame.copy())
+    online = analysis.agreement_from_state(merged)
+    pd.testing.assert_frame_equal(online["cm_df"], exact["cm_df"])
+    summary = analysis.summary_from_state(merged, online)
+    assert summary["agreement_rate"] == pytest.approx(np.mean((x >= 0.5) == (y >= 0.5)))
+    json.dumps(summary)
+
+
+def test_sketch_percentiles_within_one_bin(frame, merged):
+    """time_series percentiles land in the bin of the exact percentile or next to it."""
+    table = merged.time_series.tables()["hour"]
+    overall = table[table["dimension"] == "all"].set_index("window_start")
+    windows = frame["timestamp"].to_numpy() // 3600 * 3600
+    for name, (col, hi) in time_series.PROVIDERS.items():
+        edges = online_stats.sketch_edges(hi, time_series.SKETCH_BINS)
+        values = frame[col].to_numpy(np.float64)
+        for window in np.unique(windows):
+            window_values = values[windows == window]
+            for q in time_series.QUANTILES:
+                estimate = overall.loc[window, f"{name}_p{round(q * 100)}"]
+                exact = np.quantile(window_values, q, method="inverted_cdf")
+                bins = np.searchsorted(edges, [estimate, exact], side="right") - 1
+                assert abs(bins[0] - bins[1]) <= 1, (name, window, q, estimate, exact)
+
+
+def test_run_incremental_keeps_full_run_results(tmp_path):
+    posts = list(benchmark.scored_posts(processing.clean_records(benchmark.synthetic_posts(3000), workers=1)))
+    scored, state_file = tmp_path / "scored.jsonl", str(tmp_path / "state.npz")
+    dirs = {"tables_dir": str(tmp_path / "tables"), "summary_dir": str(tmp_path / "summary")}
+    scored.write_text("".join(json.dumps(post) + "\n" for post in posts[:2000]))
+    analysis.run_analysis(input_file=str(scored), results_dir=str(tmp_path / "results"), fast=True,
+                          bootstrap_replicates=20, use_store=False, **dirs)
+    with open(scored, "a") as f:
+        f.writelines(json.dumps(post) + "\n" for post in posts[2000:])
+    summary = analysis.run_incremental(str(scored), state_file, **dirs)
+
+    assert summary["bootstrap"]["replicates"] == 20
+    assert "threshold_sweep" in summary and "op_disagreement_ci" in summary["carried_over"]
+    whole = new_state(analysis.score_frame(posts))
+    assert summary["agreement_rate"] == pytest.approx(whole.contingency.counts.trace() / whole.n)
+    with open(tmp_path / "summary" / "analysis_summary.json") as f:
+        assert json.load(f)["carried_over"] == summary["carried_over"]
+    by_op = pd.read_csv(tmp_path / "tables" / "disagreement_by_op.csv")
+    assert list(by_op.columns) == ["is_op", "disagreement", "ci_low", "ci_high"]
+    assert by_op[["ci_low", "ci_high"]].notna().all().all()
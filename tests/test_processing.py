@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+import mock_servers
+import processing
+
+# The regex fast path must clean exactly like the BeautifulSoup reference,
+# either on its own or by falling back to it.
+EDGE_CASES = [
+    "",
+    "plain text only",
+    "   leading and\ttrailing \n whitespace  ",
+    '<a href="#p123" class="quotelink">&gt;&gt;123</a> reply',
+    '<span class="quote">&gt;greentext</span><br>next line',
+    '<span class="deadlink">&gt;&gt;456</span>',
+    "https://example.com/long<wbr>/path",
+    "<s>spoiler</s> after",
+    "<br><br><wbr>",
+    "<br/>self<BR >closing<Br />tags",
+    "<span class=quote>&gt;unquoted attribute</span>",
+    "it&#039;s &amp; &quot;quoted&quot;",
+    "&amp;gt;&amp;gt;double escaped",
+    "a &gt b &amp c",
+    "&#x27;hex&#X27; entities",
+    "unknown &foo; entity",
+    "<b>bold</b>x<i>y</i>",
+    '<pre class="prettyprint">code</pre>',
+    '<font color="red">unknown tag</font>',
+    "unclosed <span class=\"quote\">&gt;tag",
+    "<!-- comment -->text",
+    "x < y and y > z",
+    # attribute values with quotes or angle brackets need the parser
+    "<a href='x>y'>q</a>",
+    '<a href="x>y">q</a>',
+    '<a title="it\'s">q</a>',
+    "<a title='say \"hi\"'>q</a>",
+    '<span data-x="a<b">q</span>',
+    # numeric entities for control characters, surrogates and noncharacters
+    "b&#0;&#x1c;&amp;gt;x",
+    "a&#28;b&#127;c&#x7f;d",
+    "a&#x85;b&#159;c",
+    "a&#xd800;b&#xfffe;c&#x110000;d",
+    "&amp;#x1c;double escaped&amp;#127;",
+    "tab&#9;newline&#10;cr&#13;nbsp&#xA0;",
+    "&#x1F600; emoji &#128512;",
+]
+
+
+@pytest.mark.parametrize("html_text", EDGE_CASES)
+def test_fast_path_matches_bs4(html_text):
+    assert processing.clean_comment(html_text) == processing.clean_comment_bs4(html_text)
+
+
+def test_quoted_gt_in_attribute_falls_back():
+    assert processing.clean_comment("<a href='x>y'>q</a>") == "q"
+
+
+def test_fast_path_matches_bs4_on_synthetic_comments():
+    rng = random.Random(0)
+    for i in range(2000):
+        html_text = mock_servers.synthetic_comment(rng, 10**8 + i)
+        assert processing.clean_comment(html_text) == processing.clean_comment_bs4(html_text), html_text
+
+
+def test_clean_comment_empty():
+    assert processing.clean_comment(None) == ""
+    assert processing.clean_comment("") == ""
+
+
+def test_clean_comments_keeps_order():
+    texts = ["<b>one</b>", "two<br>lines", "&gt;three"]
+    assert processing.clean_comments(texts, workers=1) == ["one", "two lines", ">three"]
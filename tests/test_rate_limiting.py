@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+import pytest
+
+import api_integration
+import mock_servers
+from rate_limiting import AdaptiveTokenBucket, retry_after_seconds
+from scoring_engine import Connectivity, Provider
+
+
+def test_429_cuts_the_rate_and_pauses():
+    bucket = AdaptiveTokenBucket(rate=10, capacity=5, min_rate=1, decrease=0.5)
+    pause, cut = bucket.throttled({"retry-after-ms": "200"})
+    assert (pause, cut) == (0.2, True)
+    assert bucket.rate == 5
+    assert bucket.try_acquire() > 0.1  # no request goes out until Retry-After has passed
+    # the rest of the burst gets its 429s during the pause: one cut per episode
+    assert bucket.throttled({"retry-after-ms": "200"})[1] is False
+    assert bucket.rate == 5
+    time.sleep(0.25)
+    assert bucket.throttled({"Retry-After": "0"})[1] is True
+    assert bucket.rate == 2.5
+    for _ in range(5):
+        time.sleep(0.01)
+        bucket.throttled({"Retry-After": "0"})
+    assert bucket.rate == 1  # never below min_rate
+    assert bucket.snapshot()["throttle_events"] == 8
+
+
+def test_successes_probe_back_up_to_max_rate():
+    bucket = AdaptiveTokenBucket(rate=2, max_rate=4, increase=1)
+    bucket.throttled({"Retry-After": "0"})
+    assert bucket.rate < 2
+    for _ in range(100):
+        bucket.succeeded()
+    assert bucket.rate == 4
+
+
+def test_retry_after_sources():
+    assert retry_after_seconds({"retry-after-ms": "1500", "Retry-After": "9"}) == 1.5
+    assert retry_after_seconds({"Retry-After": "3"}) == 3.0
+    assert retry_after_seconds({"Retry-After": "Thu, 01 Jan 1970 00:00:00 GMT"}) == 0.0
+    assert retry_after_seconds({"x-ratelimit-reset-requests": "1m2.5s"}) == 62.5
+    assert retry_after_seconds({}) is None
+
+
+def test_provider_backs_off_to_the_mock_quota(monkeypatch):
+    server, url = mock_servers.start_perspective_mock(quota=20)
+    monkeypatch.setattr(api_integration, "PERSPECTIVE_URL", f"{url}{mock_servers.PERSPECTIVE_PATH}")
+    provider = Provider("Perspective API", api_integration.perspective_request, rate=80, concurrency=8)
+
+    async def run():
+        connectivity = Connectivity(retry_seconds=0)
+        return await asyncio.gather(*[provider.call(connectivity, f"text {i}") for i in range(60)])
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        server.shutdown()
+    assert all(result is not None for result in results)  # a 429 is waited out, never a lost score
+    assert server.throttled > 0
+    assert provider.limiter.throttle_events > 0
+    assert provider.limiter.rate < 80
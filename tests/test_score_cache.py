@@ -0,0 +1,80 @@
+import itertools
+
+import pytest
+
+import score_cache
+from score_cache import ScoreCache
+
+NS = score_cache.make_namespace("openai", "omni-moderation-latest")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A strictly increasing last_access, so the LRU order is deterministic."""
+    ticks = itertools.count(1)
+    monkeypatch.setattr(score_cache.time, "time", lambda: float(next(ticks)))
+
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    cache = ScoreCache(str(tmp_path / "cache.sqlite"), max_entries=10, commit_every=1)
+    yield cache
+    cache.close()
+
+
+def test_put_get_and_stats(cache):
+    assert cache.get(NS, "hello") is None
+    cache.put(NS, "hello", {"score": 0.5})
+    assert cache.get(NS, "  hello ") == {"score": 0.5}  # normalized whitespace hits
+    assert cache.get(NS, "Hello") is None  # case is kept
+    assert cache.get(score_cache.make_namespace("openai", "other-model"), "hello") is None
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["by_namespace"][NS] == {"hits": 1, "misses": 2}
+
+
+def test_failures_are_not_cached(cache):
+    cache.put(NS, "hello", None)
+    assert cache.get(NS, "hello") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_overwrite_keeps_size(cache):
+    cache.put(NS, "hello", {"score": 0.1})
+    cache.put(NS, "hello", {"score": 0.9})
+    assert cache.get(NS, "hello") == {"score": 0.9}
+    assert cache.stats()["entries"] == 1
+
+
+def test_size_survives_reopen(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    cache = ScoreCache(path)
+    for i in range(5):
+        cache.put(NS, f"text {i}", {"score": i})
+    cache.put(NS, "text 0", {"score": 0})
+    cache.close()
+    cache = ScoreCache(path)
+    assert cache.stats()["entries"] == 5
+    assert cache.get(NS, "text 3") == {"score": 3}
+    cache.close()
+
+
+def test_eviction_is_bounded_and_least_recently_used(cache):
+    for i in range(10):
+        cache.put(NS, f"text {i}", {"score": i})
+    cache.get(NS, "text 0")  # touched: now the most recently used
+    cache.put(NS, "text 1", {"score": 1})  # refreshed by an overwrite
+    cache.put(NS, "text 10", {"score": 10})  # 11 entries: evict down to 9
+    assert cache.stats()["entries"] == 9
+    kept = {i for i in range(11) if cache.get(NS, f"text {i}") is not None}
+    assert kept == {0, 1} | set(range(4, 11))
+
+
+def test_overwrites_never_trigger_eviction(cache):
+    for i in range(10):
+        cache.put(NS, f"text {i}", {"score": i})
+    for _ in range(3):
+        for i in range(10):
+            cache.put(NS, f"text {i}", {"score": -i})
+    assert cache.stats()["entries"] == 10
+    assert all(cache.get(NS, f"text {i}") == {"score": -i} for i in range(10))
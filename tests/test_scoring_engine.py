@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from openai import OpenAI
+
+import api_integration
+import mock_servers
+from rate_limiting import RetryPolicy
+from scoring_engine import Connectivity, Provider
+
+
+@pytest.fixture
+def openai_mock(monkeypatch):
+    """The moderation mock with requests of more than 4 inputs answered 413."""
+    server, url = mock_servers.start_openai_mock(max_inputs=4)
+    monkeypatch.setattr(api_integration, "client", OpenAI(api_key="mock", base_url=f"{url}/v1", max_retries=0))
+    yield server
+    server.shutdown()
+
+
+def test_rejected_batch_is_split_and_fully_scored(openai_mock):
+    items = [(post_id, f"post number {post_id}") for post_id in range(1, 11)]
+    items[6] = (7, f"post {mock_servers.REJECT_MARKER} number 7")
+    results = api_integration.moderate_posts(items)
+    assert openai_mock.requests_served > 3  # the 413s and the 400 forced splits
+    assert set(results) == {post_id for post_id, _ in items}
+    assert results[7] is None
+    for post_id, text in items:
+        if post_id != 7:
+            expected = mock_servers.mock_moderation_result(text)["category_scores"]
+            scores = {name: results[post_id]["category_scores"][name] for name in expected}
+            assert scores == pytest.approx(expected), post_id
+
+
+def test_connection_errors_use_up_the_retry_budget():
+    calls = []
+
+    def offline(text):
+        calls.append(text)
+        raise ConnectionError("network is unreachable")
+
+    provider = Provider("offline", offline, rate=1000, concurrency=4, retry=RetryPolicy(retries=2),
+                        connection_errors=(ConnectionError,))
+
+    async def run():
+        connectivity = Connectivity(retry_seconds=0)
+        pending = [provider.call(connectivity, f"text {i}") for i in range(3)]
+        return await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), timeout=10)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ConnectionError) for result in results)
+    assert len(calls) <= 3 * 3  # no task goes past its retries + 1 attempts
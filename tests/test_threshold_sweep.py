@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import threshold_sweep
+
+THRESHOLDS = np.round(np.arange(0.0, 1.0 + 0.025, 0.05), 6)
+
+
+@pytest.fixture
+def scores():
+    """Paired scores with ties on the threshold grid and a few missing values."""
+    rng = np.random.default_rng(0)
+    y = rng.random(3000)
+    x = np.clip(y + rng.normal(0, 0.3, len(y)), 0, 1)
+    x[:300] = np.round(x[:300], 1)   # exactly on a threshold: flagged (>=)
+    y[300:600] = np.round(y[300:600], 2)
+    x[::97], y[::89] = np.nan, np.nan
+    return x, y
+
+
+def naive_metrics(x, y, tx, ty):
+    x, y = threshold_sweep.paired(x, y)
+    predicted, truth = x >= tx, y >= ty
+    tp, fp = np.sum(predicted & truth), np.sum(predicted & ~truth)
+    fn, tn = np.sum(~predicted & truth), np.sum(~predicted & ~truth)
+    n = len(x)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    agreement = (tp + tn) / n
+    expected = ((tp + fp) * (tp + fn) + (fn + tn) * (fp + tn)) / n ** 2
+    kappa = (agreement - expected) / (1 - expected) if expected != 1 else 0.0
+    return {"tp": tp, "fp": fp, "fn": fn, "tn": tn, "agreement": agreement,
+            "precision": precision, "recall": recall, "f1": f1, "kappa": kappa}
+
+
+def test_sweep_matches_naive_loop(scores):
+    x, y = scores
+    result = threshold_sweep.sweep(x, y, THRESHOLDS)
+    for i, tx in enumerate(THRESHOLDS):
+        for j, ty in enumerate(THRESHOLDS):
+            for metric, value in naive_metrics(x, y, tx, ty).items():
+                assert result[metric][i, j] == pytest.approx(value, abs=1e-12), (metric, tx, ty)
+
+
+def test_sweep_matches_sklearn(scores):
+    metrics = pytest.importorskip("sklearn.metrics")
+    x, y = threshold_sweep.paired(*scores)
+    result = threshold_sweep.sweep(x, y, THRESHOLDS)
+    for i, j in [(2, 3), (10, 10), (14, 6), (20, 0)]:
+        predicted, truth = x >= THRESHOLDS[i], y >= THRESHOLDS[j]
+        tn, fp, fn, tp = metrics.confusion_matrix(truth, predicted, labels=[False, True]).ravel()
+        assert (result["tn"][i, j], result["fp"][i, j], result["fn"][i, j], result["tp"][i, j]) == (tn, fp, fn, tp)
+        precision, recall, f1, _ = metrics.precision_recall_fscore_support(
+            truth, predicted, labels=[True], average=None, zero_division=0)
+        assert result["precision"][i, j] == pytest.approx(precision[0])
+        assert result["recall"][i, j] == pytest.approx(recall[0])
+        assert result["f1"][i, j] == pytest.approx(f1[0])
+        assert result["kappa"][i, j] == pytest.approx(metrics.cohen_kappa_score(truth, predicted))
+
+
+def test_ranking_curves_match_sklearn(scores):
+    metrics = pytest.importorskip("sklearn.metrics")
+    x, y = threshold_sweep.paired(*scores)
+    labels = y >= 0.5
+    curves = threshold_sweep.ranking_curves(x, labels)
+    assert curves["roc_auc"] == pytest.approx(metrics.roc_auc_score(labels, x))
+    assert curves["average_precision"] == pytest.approx(metrics.average_precision_score(labels, x))